@@ -12,8 +12,16 @@ CONF_DEFAULTS = [
     (
         CONF_SECTION,
         {
-            'opened_notebooks': [],    # Notebooks to open at start
-            'theme': 'same as spyder'  # Notebook theme (light/dark)
+            'opened_notebooks': [],       # Notebooks to open at start
+            'theme': 'same as spyder',    # Notebook theme (light/dark)
+            'hibernate_timeout': 60,      # Minutes before unused tab sleeps
+            'server_pool_size': 0,        # Idle servers to keep ready
+            'single_server': False,       # One server for all directories
+            'server_idle_timeout': 10,    # Minutes before unused server stops
+            'server_output_limit': 1024,  # Server output kept in memory (KiB)
+            'server_output_log': False,   # Write server output to log files
+            'kernel_pool_size': 0,        # Kernels started in advance
+            'kernel_cull_timeout': 0      # Minutes before idle kernel stops
         }
     )
 ]
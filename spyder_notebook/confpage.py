@@ -26,13 +26,88 @@ class NotebookConfigPage(PluginConfigPage):
         theme_combo = self.create_combobox(
             _('Notebook theme'), theme_choices, 'theme', restart=True)
 
+        hibernate_spinbox = self.create_spinbox(
+            _('Unload notebooks in background tabs after:'), _('minutes'),
+            'hibernate_timeout', min_=0, max_=24 * 60, step=15,
+            tip=_('The page of a notebook whose tab is not used for this\n'
+                  'many minutes is unloaded to save memory, while its\n'
+                  'kernel keeps running. The page is loaded again when the\n'
+                  'tab is selected. Set to 0 to only do this when memory\n'
+                  'is low.'))
+
         interface_layout = QGridLayout()
         interface_layout.addWidget(theme_combo.label, 0, 0)
         interface_layout.addWidget(theme_combo.combobox, 0, 1)
+        interface_layout.addWidget(hibernate_spinbox, 1, 0, 1, 2)
         interface_group = QGroupBox(_('Interface'))
         interface_group.setLayout(interface_layout)
 
+        pool_spinbox = self.create_spinbox(
+            _('Idle servers to keep ready:'), '', 'server_pool_size',
+            min_=0, max_=5, step=1,
+            tip=_('Starting a notebook server takes a few seconds, so this\n'
+                  'many servers are started in advance to open notebooks\n'
+                  'faster. Every idle server uses some memory.'))
+
+        single_server_box = self.create_checkbox(
+            _('Use a single server for notebooks in all directories'),
+            'single_server',
+            tip=_('The single server is rooted at the root of the drive\n'
+                  'but only renders the directories of opened notebooks.\n'
+                  'If this is not checked, a separate server is started\n'
+                  'for notebooks outside your home directory, which uses\n'
+                  'more memory. Changes apply to new servers.'))
+
+        idle_timeout_spinbox = self.create_spinbox(
+            _('Shut down unused servers after:'), _('minutes'),
+            'server_idle_timeout', min_=0, max_=24 * 60, step=5,
+            tip=_('Servers without any open notebooks are shut down after\n'
+                  'this many minutes to save memory. Set to 0 to keep\n'
+                  'servers running until Spyder exits.'))
+
+        output_limit_spinbox = self.create_spinbox(
+            _('Server output to keep in memory:'), _('KiB'),
+            'server_output_limit', min_=16, max_=64 * 1024, step=256,
+            tip=_('Only the most recent output of every server is kept\n'
+                  'and shown in the server info dialog.'))
+
+        output_log_box = self.create_checkbox(
+            _('Write all server output to log files'),
+            'server_output_log',
+            tip=_('The log files are stored in the temporary directory.\n'
+                  'Changes apply to new servers.'))
+
+        kernel_pool_spinbox = self.create_spinbox(
+            _('Kernels to keep ready in every server:'), '',
+            'kernel_pool_size', min_=0, max_=5, step=1,
+            tip=_('Starting a kernel takes a few seconds, so this many\n'
+                  'kernels are started in advance to open notebooks\n'
+                  'faster. Every idle kernel uses some memory. Changes\n'
+                  'apply to new servers.'))
+
+        kernel_cull_spinbox = self.create_spinbox(
+            _('Shut down idle kernels after:'), _('minutes'),
+            'kernel_cull_timeout', min_=0, max_=7 * 24 * 60, step=30,
+            tip=_('Kernels which did not run any code for this many\n'
+                  'minutes are shut down to save memory, even if their\n'
+                  'notebook is open. Variables in the kernel are lost,\n'
+                  'but the notebook stays open and the kernel can be\n'
+                  'restarted. Set to 0 to keep kernels running. Changes\n'
+                  'apply to new servers.'))
+
+        servers_layout = QVBoxLayout()
+        servers_layout.addWidget(pool_spinbox)
+        servers_layout.addWidget(single_server_box)
+        servers_layout.addWidget(idle_timeout_spinbox)
+        servers_layout.addWidget(kernel_pool_spinbox)
+        servers_layout.addWidget(kernel_cull_spinbox)
+        servers_layout.addWidget(output_limit_spinbox)
+        servers_layout.addWidget(output_log_box)
+        servers_group = QGroupBox(_('Servers'))
+        servers_group.setLayout(servers_layout)
+
         vlayout = QVBoxLayout()
         vlayout.addWidget(interface_group)
+        vlayout.addWidget(servers_group)
         vlayout.addStretch(1)
         self.setLayout(vlayout)
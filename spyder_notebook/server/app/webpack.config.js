@@ -9,6 +9,7 @@
 
 const fs = require('fs-extra');
 const path = require('path');
+const zlib = require('zlib');  // Spyder: for precompressed assets
 const webpack = require('webpack');
 const merge = require('webpack-merge').default;
 const Handlebars = require('handlebars');
@@ -37,6 +38,18 @@ fs.ensureDirSync(buildDir);
 // Handle the extensions.
 const { mimeExtensions, plugins } = data.jupyterlab;
 
+// Spyder: Extensions which are rarely used, so they are put in separate
+// chunks which are loaded in parallel instead of in the main bundle
+const lazyExtensions = new Set([
+  '@jupyter-notebook/help-extension',
+  '@jupyterlab/debugger-extension',
+  '@jupyterlab/metadataform-extension',
+  '@jupyterlab/toc-extension',
+]);
+
+// Spyder: File with sizes of the chunks written by the last build
+const sizeReportFile = path.resolve(__dirname, 'bundle-size-report.json');
+
 // Create the list of extension packages from the package.json metadata
 const extensionPackages = new Set();
 Object.keys(plugins).forEach((page) => {
@@ -56,19 +69,30 @@ Handlebars.registerHelper('ispage', function (key, page) {
 });
 
 // custom helper to load the plugins on the index page
+// Spyder: Use dynamic import with named chunk for lazy extensions
 Handlebars.registerHelper('list_plugins', function () {
   let str = '';
   const page = this;
   Object.keys(this).forEach((extension) => {
     const plugin = page[extension];
+    const lazy = lazyExtensions.has(extension);
+    const chunkName = extension.replace(/^@/, '').replace(/[/-]/g, '_');
+    const load = lazy
+      ? `import(/* webpackChunkName: "${chunkName}" */ \'${extension}\')`
+      : `require(\'${extension}\')`;
     if (plugin === true) {
-      str += `require(\'${extension}\'),\n  `;
+      str += `${load},\n  `;
     } else if (Array.isArray(plugin)) {
       const plugins = plugin.map((p) => `'${p}',`).join('\n');
-      str += `
-      require(\'${extension}\').default.filter(({id}) => [
+      const filter = `({id}) => [
        ${plugins}
-      ].includes(id)),
+      ].includes(id)`;
+      str += lazy
+        ? `
+      ${load}.then(mod => mod.default.filter(${filter})),
+      `
+        : `
+      ${load}.default.filter(${filter}),
       `;
     }
   });
@@ -194,6 +218,172 @@ function createShared(packageData) {
   return shared;
 }
 
+// Spyder: Emit precompressed assets and a manifest with the bundle name
+/**
+ * Webpack plugin writing gzip and brotli compressed siblings of assets
+ *
+ * The notebook server sends these to clients which accept them, so assets
+ * do not need to be compressed again for every request. The assets are
+ * compressed after they are minified and renamed with their real content
+ * hash. Once all assets are processed, every sibling is checked to
+ * decompress to the asset next to it, because the server tells browsers to
+ * cache them forever.
+ */
+class PrecompressPlugin {
+  apply(compiler) {
+    const { Compilation, sources } = compiler.webpack;
+    compiler.hooks.thisCompilation.tap('PrecompressPlugin', (compilation) => {
+      compilation.hooks.processAssets.tap(
+        {
+          name: 'PrecompressPlugin',
+          stage: Compilation.PROCESS_ASSETS_STAGE_OPTIMIZE_TRANSFER,
+        },
+        (assets) => {
+          for (const [name, asset] of Object.entries(assets)) {
+            const buffer = asset.buffer();
+            if (!/\.(js|css|json|svg|html)$/.test(name) || buffer.length < 1024) {
+              continue;
+            }
+            compilation.emitAsset(
+              `${name}.gz`,
+              new sources.RawSource(zlib.gzipSync(buffer, { level: 9 }))
+            );
+            compilation.emitAsset(
+              `${name}.br`,
+              new sources.RawSource(zlib.brotliCompressSync(buffer))
+            );
+          }
+        }
+      );
+      compilation.hooks.processAssets.tap(
+        {
+          name: 'PrecompressPlugin',
+          stage: Compilation.PROCESS_ASSETS_STAGE_REPORT,
+        },
+        (assets) => {
+          const decompress = {
+            '.gz': zlib.gunzipSync,
+            '.br': zlib.brotliDecompressSync
+          };
+          for (const name of Object.keys(assets)) {
+            const extension = name.slice(-3);
+            const original = assets[name.slice(0, -3)];
+            if (!(extension in decompress) || !original) {
+              continue;
+            }
+            const contents = decompress[extension](assets[name].buffer());
+            if (!contents.equals(original.buffer())) {
+              compilation.errors.push(
+                new compiler.webpack.WebpackError(
+                  `PrecompressPlugin: ${name} does not match ` +
+                    `${name.slice(0, -3)}`
+                )
+              );
+            }
+          }
+        }
+      );
+    });
+  }
+}
+
+/**
+ * Webpack plugin writing the name of the content-hashed entry bundle
+ *
+ * The name is stored in `bundle-manifest.json` under the key `bundle.js`,
+ * so that the notebook server can refer to it in the notebook page.
+ */
+class BundleManifestPlugin {
+  apply(compiler) {
+    const { Compilation, sources } = compiler.webpack;
+    compiler.hooks.thisCompilation.tap('BundleManifestPlugin', (compilation) => {
+      compilation.hooks.processAssets.tap(
+        {
+          name: 'BundleManifestPlugin',
+          // After the files are renamed with their real content hash
+          stage: Compilation.PROCESS_ASSETS_STAGE_OPTIMIZE_TRANSFER,
+        },
+        () => {
+          const files = [...compilation.entrypoints.get('main').getFiles()];
+          const bundle = files.find((file) => file.endsWith('.js'));
+          const manifest = JSON.stringify({ 'bundle.js': bundle });
+          compilation.emitAsset(
+            'bundle-manifest.json',
+            new sources.RawSource(manifest)
+          );
+        }
+      );
+    });
+  }
+}
+
+/**
+ * Webpack plugin reporting the size of every chunk
+ *
+ * The sizes are written to `bundle-size-report.json` and printed together
+ * with the change since the previous build, so that regressions are visible.
+ */
+class BundleSizeReportPlugin {
+  apply(compiler) {
+    compiler.hooks.done.tap('BundleSizeReportPlugin', (stats) => {
+      const { compilation } = stats;
+      if (compilation.errors.length) {
+        return;
+      }
+      const previous = fs.existsSync(sizeReportFile)
+        ? fs.readJsonSync(sizeReportFile).chunks
+        : {};
+      const chunks = {};
+      for (const chunk of compilation.chunks) {
+        const name = chunk.name || String(chunk.id);
+        let size = 0;
+        let gzipSize = 0;
+        for (const file of chunk.files) {
+          if (!file.endsWith('.js')) {
+            continue;
+          }
+          const buffer = compilation.getAsset(file).source.buffer();
+          size += buffer.length;
+          gzipSize += zlib.gzipSync(buffer).length;
+        }
+        chunks[name] = { initial: chunk.canBeInitial(), size, gzipSize };
+      }
+
+      const total = (filter) =>
+        Object.values(chunks)
+          .filter(filter)
+          .reduce((sum, chunk) => sum + chunk.gzipSize, 0);
+      const report = {
+        initialGzipSize: total((chunk) => chunk.initial),
+        totalGzipSize: total(() => true),
+        chunks,
+      };
+      fs.writeJsonSync(sizeReportFile, report, { spaces: 2 });
+
+      const kib = (bytes) => `${(bytes / 1024).toFixed(1)} KiB`;
+      const lines = Object.entries(chunks)
+        .sort(([, a], [, b]) => b.gzipSize - a.gzipSize)
+        .map(([name, chunk]) => {
+          const old = previous[name];
+          const delta = old
+            ? ` (${chunk.gzipSize >= old.gzipSize ? '+' : '-'}` +
+              `${kib(Math.abs(chunk.gzipSize - old.gzipSize))})`
+            : ' (new)';
+          const kind = chunk.initial ? 'initial' : 'async';
+          return `  ${kib(chunk.gzipSize).padStart(12)}${delta}  ${kind}  ${name}`;
+        });
+      console.log(
+        [
+          'Bundle size report (gzipped):',
+          ...lines,
+          `  Initial: ${kib(report.initialGzipSize)}, ` +
+            `total: ${kib(report.totalGzipSize)}`,
+        ].join('\n')
+      );
+    });
+  }
+}
+
 // Make a bootstrap entrypoint
 const entryPoint = path.join(buildDir, 'bootstrap.js');
 const bootstrap = 'import("./index.js");';
@@ -217,7 +407,10 @@ module.exports = [
         type: 'var',
         name: ['_JUPYTERLAB', 'CORE_OUTPUT'],
       },
-      filename: 'bundle.js',
+      // Spyder: Use content hashes so that assets can be cached forever
+      filename: 'bundle.[contenthash].js',
+      chunkFilename: '[name].[contenthash].js',
+      clean: true,
     },
     resolve: {
       fallback: { util: false },
@@ -235,6 +428,9 @@ module.exports = [
         name: 'CORE_FEDERATION',
         shared: createShared(data),
       }),
+      new BundleManifestPlugin(),
+      new PrecompressPlugin(),
+      new BundleSizeReportPlugin(),
     ],
   }),
 ].concat(extras);
@@ -4,30 +4,142 @@
 """Entry point for server rendering notebooks for Spyder."""
 
 # Standard library imports
+import asyncio
+import collections
+import json
+import mimetypes
 import os
+import re
 import signal
 import sys
 
 # Third-party imports
 from jupyter_client.kernelspec import KernelSpecManager
 from jupyter_client.provisioning.local_provisioner import LocalProvisioner
+from jupyter_server.base.handlers import APIHandler, FileFindHandler
 from jupyter_server.serverapp import ServerApp
+from jupyter_server.services.kernels.kernelmanager import (
+    AsyncMappingKernelManager)
+from jupyter_server.services.contents.largefilemanager import (
+    AsyncLargeFileManager)
+from jupyter_server.utils import url_path_join
 from notebook.app import (
     aliases, flags, JupyterNotebookApp, NotebookBaseHandler)
 import psutil
 from tornado import web
-from traitlets import default, Bool, Type, Unicode
+from traitlets import default, Bool, Integer, List, Type, Unicode
 
 
 HERE = os.path.dirname(__file__)
 
+# Delay before we give up on a kernel in the pool to become ready (in s)
+KERNEL_READY_TIMEOUT = 60
+
+# Environment variables that Jupyter sets differently for every session;
+# these are set in a kernel from the pool when it is taken
+SESSION_ENV_VARIABLES = {'JPY_SESSION_NAME'}
+
+# Number of culled kernels that are remembered
+CULLED_KERNELS_KEPT = 100
+
+# File written by webpack with the name of the content-hashed bundle
+BUNDLE_MANIFEST = 'bundle-manifest.json'
+
+# Static files whose name contains a content hash, e.g. bundle.0123abcd.js
+HASHED_FILENAME_REGEXP = re.compile(r'\.[0-9a-f]{16,}\.[^/]+$')
+
+# Precompressed siblings of static files, in order of preference
+PRECOMPRESSED_ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
 aliases['info-file'] = 'SpyderNotebookApp.info_file_cmdline'
+aliases['kernel-pool-size'] = 'SpyderKernelManager.kernel_pool_size'
+aliases['kernel-cull-timeout'] = 'SpyderKernelManager.cull_idle_timeout'
 
 flags['dark'] = (
     {'SpyderNotebookApp': {'dark_theme': True}},
     'Use dark theme when rendering notebooks'
 )
 
+flags['restrict-roots'] = (
+    {'SpyderNotebookApp': {'restrict_roots': True}},
+    'Only render notebooks in directories added while the server is running'
+)
+
+
+def is_subdir(path, directory):
+    """Return whether `path` is equal to or inside `directory`."""
+    path = os.path.normcase(os.path.abspath(path))
+    directory = os.path.normcase(os.path.abspath(directory))
+    try:
+        return os.path.commonpath([path, directory]) == directory
+    except ValueError:
+        # Paths on different drives
+        return False
+
+
+def get_bundle_name(static_dir):
+    """
+    Return name of the JavaScript bundle in `static_dir`.
+
+    The name contains a hash of the contents and is read from the manifest
+    written by webpack. If there is no manifest, fall back to `bundle.js`.
+    """
+    try:
+        with open(os.path.join(static_dir, BUNDLE_MANIFEST)) as file:
+            return json.load(file)['bundle.js']
+    except (OSError, ValueError, KeyError):
+        return 'bundle.js'
+
+
+class SpyderStaticFileHandler(FileFindHandler):
+    """
+    Handler for the static files of the notebook page.
+
+    Files with a content hash in their name never change, so the browser is
+    told to cache them forever. Other files, like the fallback `bundle.js`,
+    have to be revalidated every time. If the client accepts it and the build
+    wrote a precompressed sibling (`.br` or `.gz`) of the requested file,
+    then that sibling is served instead of the file itself.
+    """
+
+    content_encoding = None
+
+    def validate_absolute_path(self, root, absolute_path):
+        """Validate path and swap in precompressed sibling if possible."""
+        absolute_path = super().validate_absolute_path(root, absolute_path)
+        if absolute_path is None or self.request.headers.get('Range'):
+            return absolute_path
+
+        accepted = self.request.headers.get('Accept-Encoding', '')
+        accepted = {item.split(';')[0].strip() for item in accepted.split(',')}
+        for encoding, extension in PRECOMPRESSED_ENCODINGS:
+            if encoding in accepted and os.path.isfile(
+                    absolute_path + extension):
+                self.content_encoding = encoding
+                self.uncompressed_path = absolute_path
+                return super().validate_absolute_path(
+                    root, absolute_path + extension)
+        return absolute_path
+
+    def get_content_type(self):
+        """Return content type of the file before compression."""
+        if self.content_encoding:
+            mime_type = mimetypes.guess_type(self.uncompressed_path)[0]
+            return mime_type or 'application/octet-stream'
+        return super().get_content_type()
+
+    def set_headers(self):
+        """Set caching and encoding headers."""
+        super().set_headers()
+        self.set_header('Vary', 'Accept-Encoding')
+        if self.content_encoding:
+            self.set_header('Content-Encoding', self.content_encoding)
+        if HASHED_FILENAME_REGEXP.search(self.request.path):
+            self.set_header(
+                'Cache-Control', 'public, max-age=31536000, immutable')
+        else:
+            self.set_header('Cache-Control', 'no-cache')
+
 
 class SpyderNotebookHandler(NotebookBaseHandler):
     """A notebook page handler for Spyder."""
@@ -35,6 +147,8 @@ class SpyderNotebookHandler(NotebookBaseHandler):
     def get_page_config(self):
         page_config = super().get_page_config()
         page_config['darkTheme'] = self.extensionapp.dark_theme
+        # The first two are also left out of the JavaScript bundle; they are
+        # listed here in case they are provided by a federated extension
         page_config['disabledExtensions'] = [
             # Remove editor-related items from Settings menu
             '@jupyterlab/fileeditor-extension',
@@ -51,13 +165,98 @@ class SpyderNotebookHandler(NotebookBaseHandler):
     def get(self, path=None):
         """Get the notebook page."""
         tpl = self.render_template(
-            'notebook-template.html', page_config=self.get_page_config())
+            'notebook-template.html', page_config=self.get_page_config(),
+            bundle_name=get_bundle_name(self.extensionapp.static_dir))
         return self.write(tpl)
 
 
+class SpyderRootsHandler(APIHandler):
+    """
+    Handler for the directories from which notebooks can be rendered.
+
+    This is only useful if the server is started with `--restrict-roots`.
+    A GET request returns the list of directories, while a POST request with
+    a JSON body of the form `{"root": directory}` adds a directory.
+    """
+
+    @web.authenticated
+    def get(self):
+        """Return list of notebook roots."""
+        self.finish(json.dumps(self.contents_manager.notebook_roots))
+
+    @web.authenticated
+    def post(self):
+        """Add directory to list of notebook roots."""
+        contents_manager = self.contents_manager
+        if contents_manager.notebook_roots is None:
+            raise web.HTTPError(
+                409, 'Server is not restricted to notebook roots')
+
+        model = self.get_json_body() or {}
+        root = model.get('root')
+        if not root or not os.path.isdir(root):
+            raise web.HTTPError(400, f'{root} is not a directory')
+        root = os.path.abspath(root)
+        if not is_subdir(root, contents_manager.root_dir):
+            raise web.HTTPError(
+                400, f'{root} is not inside {contents_manager.root_dir}')
+
+        if root not in contents_manager.notebook_roots:
+            self.log.info(f'Adding notebook root {root}')
+            contents_manager.notebook_roots = (
+                contents_manager.notebook_roots + [root])
+        self.set_status(201)
+        self.finish(json.dumps(contents_manager.notebook_roots))
+
+
+class SpyderCulledKernelsHandler(APIHandler):
+    """
+    Handler for the kernels which were shut down because they were idle.
+
+    A GET request returns the list of ids of the most recently culled
+    kernels, so that Spyder can tell the user why a notebook lost its kernel.
+    """
+
+    @web.authenticated
+    def get(self):
+        """Return list of ids of culled kernels."""
+        self.finish(json.dumps(list(self.kernel_manager.culled_kernel_ids)))
+
+
+class SpyderContentsManager(AsyncLargeFileManager):
+    """
+    Variant of Jupyter's contents manager for Spyder.
+
+    The server can be restricted to only render notebooks in certain
+    directories under its root directory by setting `notebook_roots`. This is
+    used for servers which are started before it is known which notebooks
+    they will render.
+    """
+
+    notebook_roots = List(
+        Unicode(), default_value=None, allow_none=True,
+        help='If not None, directories from which notebooks can be rendered')
+
+    def _get_os_path(self, path):
+        """
+        Given an API path, return its file system path.
+
+        Overridden to refuse paths which are not inside one of the notebook
+        roots, if set.
+        """
+        os_path = super()._get_os_path(path)
+        if self.notebook_roots is not None and not any(
+                is_subdir(os_path, root) for root in self.notebook_roots):
+            raise web.HTTPError(404, f'{path} is outside the notebook roots')
+        return os_path
+
+
 class SpyderLocalProvisioner(LocalProvisioner):
     """Variant of Jupyter's LocalProvisioner for Spyder kernels"""
 
+    # Tuple (self.pid, process) cached by _get_conda_run_process()
+    _conda_run_process_cache = None
+
     async def send_signal(self, signum):
         """
         Send signal to kernel.
@@ -74,24 +273,58 @@ class SpyderLocalProvisioner(LocalProvisioner):
         """
         if signum == signal.SIGINT and sys.platform != "win32":
             # Windows is handled differently in LocalProvisioner
-            try:
-                process = psutil.Process(self.pid)
-                cmdline = process.cmdline()
-                if len(cmdline) > 2 and cmdline[2] == 'run':
-                    # If second word on command line is 'run', then assume
-                    # kernel is started with 'conda run' and therefore
-                    # send SIGINT to grandchild.
-                    grandchild_pid = process.children()[0].children()[0].pid
-                    self.log.info(f'Sending signal to PID {grandchild_pid} '
-                                  f'instead of process group of PID {self.pid}')
-                    os.kill(grandchild_pid, signum)
+            process = self._get_conda_run_process()
+            if process is not None:
+                self.log.info(f'Sending signal to PID {process.pid} '
+                              f'instead of process group of PID {self.pid}')
+                try:
+                    os.kill(process.pid, signum)
                     return
-            except (psutil.AccessDenied, psutil.NoSuchProcess, IndexError, OSError):
-                # Ignore errors and fall back to code in LocalProvisioner
-                pass
+                except OSError:
+                    # Fall back to code in LocalProvisioner
+                    self._conda_run_process_cache = None
 
         await super().send_signal(signum)
 
+    def _get_conda_run_process(self):
+        """
+        Return kernel process if the kernel is started with `conda run`.
+
+        The process tree is only inspected the first time; afterwards, the
+        result is taken from a cache. The cache is not used if the kernel
+        was restarted (so that self.pid changed) or if the cached process is
+        no longer running.
+
+        Returns
+        -------
+        psutil.Process or None
+            The grandchild of self.pid if the kernel is started with
+            `conda run`, and None otherwise or if there is an error.
+        """
+        if self._conda_run_process_cache is not None:
+            pid, process = self._conda_run_process_cache
+            if pid == self.pid and (process is None or process.is_running()):
+                return process
+
+        try:
+            process = psutil.Process(self.pid)
+            cmdline = process.cmdline()
+            if len(cmdline) > 2 and cmdline[2] == 'run':
+                # If second word on command line is 'run', then assume
+                # kernel is started with 'conda run' and therefore
+                # use grandchild.
+                process = process.children()[0].children()[0]
+            else:
+                process = None
+        except (psutil.AccessDenied, psutil.NoSuchProcess, IndexError,
+                OSError):
+            # Do not cache errors, because the grandchild may not be
+            # started yet
+            return None
+
+        self._conda_run_process_cache = (self.pid, process)
+        return process
+
 
 class SpyderKernelSpecManager(KernelSpecManager):
     """Variant of Jupyter's KernelSpecManager"""
@@ -105,8 +338,167 @@ class SpyderKernelSpecManager(KernelSpecManager):
     )
 
 
+class SpyderKernelManager(AsyncMappingKernelManager):
+    """
+    Variant of Jupyter's kernel manager which keeps kernels ready.
+
+    If `kernel_pool_size` is positive, then this many kernels for the default
+    kernel spec are started in advance, with the environment of the server.
+    When a new session asks for a kernel for the default kernel spec with
+    the same environment (apart from SESSION_ENV_VARIABLES), a kernel from
+    the pool is used (after changing its working directory and session
+    variables) and the pool is refilled in the background. Kernels in the
+    pool are not listed and never culled.
+
+    If `cull_idle_timeout` is positive, then kernels which are idle for that
+    many seconds are culled, even if a notebook is connected to them: a
+    notebook which is open in Spyder stays connected, even if nobody looked
+    at it for days. The ids of culled kernels are kept in
+    `culled_kernel_ids`.
+    """
+
+    kernel_pool_size = Integer(
+        0, config=True,
+        help='Number of kernels for the default kernel spec to keep ready')
+
+    cull_connected = Bool(
+        True, config=True,
+        help='Whether to cull idle kernels with notebooks connected to them')
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._kernel_pool = {}
+        self._pool_kernels_starting = 0
+        self.culled_kernel_ids = collections.deque(maxlen=CULLED_KERNELS_KEPT)
+
+    async def fill_kernel_pool(self):
+        """Start kernels until there are `kernel_pool_size` in the pool."""
+        while (len(self._kernel_pool) + self._pool_kernels_starting
+               < self.kernel_pool_size):
+            self._pool_kernels_starting += 1
+            env = dict(os.environ)
+            try:
+                kernel_id = await super().start_kernel(
+                    kernel_name=self.default_kernel_name, env=env)
+            except Exception as err:
+                self.log.warning(f'Failed to start kernel for pool: {err}')
+                return
+            finally:
+                self._pool_kernels_starting -= 1
+            self.log.info(f'Kernel {kernel_id} added to pool')
+            self._kernel_pool[kernel_id] = env
+
+    async def start_kernel(self, *, kernel_id=None, path=None, **kwargs):
+        """
+        Start a kernel for a session and return its kernel id.
+
+        Overridden to use a kernel from the pool if possible. This is only
+        done for the default kernel spec, if there are no arguments other
+        than `kernel_name`, `path` and `env`, and if `env` equals the
+        environment of the kernel in the pool, apart from
+        SESSION_ENV_VARIABLES. Otherwise, a new kernel is started.
+        """
+        kernel_name = kwargs.get('kernel_name') or self.default_kernel_name
+        env = kwargs.get('env')
+        if (kernel_id is None and kernel_name == self.default_kernel_name
+                and set(kwargs) <= {'kernel_name', 'env'}):
+            while self._kernel_pool:
+                pool_kernel_id = next(iter(self._kernel_pool))
+                if pool_kernel_id not in self:
+                    # Kernel died while in the pool
+                    del self._kernel_pool[pool_kernel_id]
+                    continue
+                if env is not None and not self._env_matches(
+                        env, self._kernel_pool[pool_kernel_id]):
+                    self.log.info('Not using kernel from pool because the '
+                                  'session needs a different environment')
+                    break
+                del self._kernel_pool[pool_kernel_id]
+                self.log.info(f'Using kernel {pool_kernel_id} from pool')
+                asyncio.ensure_future(self.fill_kernel_pool())
+                session_env = {name: value
+                               for name, value in (env or {}).items()
+                               if name in SESSION_ENV_VARIABLES}
+                cwd = None if path is None else self.cwd_for_path(path)
+                await self._prepare_pool_kernel(
+                    pool_kernel_id, cwd, session_env)
+                return pool_kernel_id
+
+        kernel_id = await super().start_kernel(
+            kernel_id=kernel_id, path=path, **kwargs)
+        asyncio.ensure_future(self.fill_kernel_pool())
+        return kernel_id
+
+    def list_kernels(self):
+        """Return list of kernel models, without the kernels in the pool."""
+        return [model for model in super().list_kernels()
+                if model['id'] not in self._kernel_pool]
+
+    async def cull_kernel_if_idle(self, kernel_id):
+        """Cull kernel if idle, unless it is in the pool."""
+        if kernel_id in self._kernel_pool:
+            return
+        await super().cull_kernel_if_idle(kernel_id)
+        if kernel_id not in self:
+            self.culled_kernel_ids.append(kernel_id)
+
+    @staticmethod
+    def _env_matches(env, pool_env):
+        """
+        Return whether environments are equal apart from session variables.
+        """
+        def without_session(env):
+            return {name: value for name, value in env.items()
+                    if name not in SESSION_ENV_VARIABLES}
+
+        return without_session(env) == without_session(pool_env)
+
+    async def _prepare_pool_kernel(self, kernel_id, cwd, session_env):
+        """
+        Prepare a kernel from the pool for the session which takes it.
+
+        Change the working directory to `cwd` (unless it is None) and set the
+        environment variables in `session_env`. Like Jupyter, set the name
+        `__session__` to the session name. The code is run silently and
+        leaves no other names in the user namespace. Errors are logged and
+        otherwise ignored.
+
+        The arguments used to launch the kernel are updated as well, so that
+        the kernel keeps the directory and variables when it is restarted.
+        """
+        kernel_manager = self.get_kernel(kernel_id)
+        kernel_manager.update_env(env=session_env)
+        if cwd is not None and kernel_manager._launch_args is not None:
+            kernel_manager._launch_args['cwd'] = cwd
+
+        code = []
+        if cwd is not None:
+            code.append(f'__import__("os").chdir({cwd!r})')
+        for name, value in session_env.items():
+            code.append(f'__import__("os").environ[{name!r}] = {value!r}')
+        if session_env.get('JPY_SESSION_NAME'):
+            code.append(f'__session__ = {session_env["JPY_SESSION_NAME"]!r}')
+        if not code:
+            return
+
+        client = kernel_manager.client()
+        client.start_channels()
+        try:
+            await client.wait_for_ready(timeout=KERNEL_READY_TIMEOUT)
+            client.execute('; '.join(code), silent=True, store_history=False)
+            await client.get_shell_msg(timeout=KERNEL_READY_TIMEOUT)
+        except Exception as err:
+            self.log.warning(
+                f'Failed to prepare kernel {kernel_id} from pool for its '
+                f'session: {err}')
+        finally:
+            client.stop_channels()
+
+
 class SpyderServerApp(ServerApp):
     """Variant of Jupyter's ServerApp"""
+    contents_manager_class = SpyderContentsManager
+    kernel_manager_class = SpyderKernelManager
     kernel_spec_manager_class = SpyderKernelSpecManager
 
 
@@ -135,6 +527,11 @@ class SpyderNotebookApp(JupyterNotebookApp):
         '', config=True,
         help='Name of file in Jupyter runtime dir with connection info')
 
+    restrict_roots = Bool(
+        False, config=True,
+        help='Whether to only render notebooks in directories which are '
+             'added while the server is running')
+
     @default('static_dir')
     def _default_static_dir(self):
         return os.path.join(HERE, 'static')
@@ -145,24 +542,41 @@ class SpyderNotebookApp(JupyterNotebookApp):
 
     def initialize_handlers(self):
         """Initialize handlers."""
+        self.handlers.append(
+            ('/spyder-notebooks-api/roots', SpyderRootsHandler))
+        self.handlers.append(
+            ('/spyder-notebooks-api/culled-kernels',
+             SpyderCulledKernelsHandler))
         self.handlers.append(('/spyder-notebooks(.*)', SpyderNotebookHandler))
+        # Added before the static handler of the extension, so it takes over
+        self.handlers.append((
+            url_path_join('/static', self.name, '(.*)'),
+            SpyderStaticFileHandler,
+            {'path': [self.static_dir]}))
         super().initialize_handlers()
 
     @classmethod
     def _load_jupyter_server_extension(cls, serverapp):
         """
-        Overridden to propagate `info-file` command line parameter.
+        Overridden to propagate command line parameters.
 
         If the `info-file` command line parameter is given, then prepend the
         Jupyter runtime directory and use the resulting path to store the
-        server info file.
+        server info file. If the `restrict-roots` flag is given, then start
+        without any directories from which notebooks can be rendered.
         """
         extension = super()._load_jupyter_server_extension(serverapp)
         if extension.info_file_cmdline:
             serverapp.info_file = os.path.join(
                 serverapp.runtime_dir, extension.info_file_cmdline)
+        if extension.restrict_roots:
+            serverapp.contents_manager.notebook_roots = []
         return extension
 
+    async def _start_jupyter_server_extension(self, serverapp):
+        """Start kernels for the kernel pool once the server is running."""
+        asyncio.ensure_future(serverapp.kernel_manager.fill_kernel_pool())
+
 main = SpyderNotebookApp.launch_instance
 
 if __name__ == "__main__":
@@ -0,0 +1,83 @@
+// Copyright (c) Spyder Project Contributors.
+// Distributed under the terms of the Modified BSD License.
+
+/**
+ * Bridge for communication between the notebook page and Spyder.
+ *
+ * Spyder shares an object with the page through QWebChannel. A promise
+ * resolving to that object is stored in `window.spyderBridge` by a script
+ * that Spyder injects before the page is loaded.
+ */
+
+/**
+ * A message sent from the notebook page to Spyder.
+ */
+export type SpyderMessage =
+  | { type: 'dirty'; value: boolean }
+  | { type: 'empty'; value: boolean }
+  | { type: 'saved'; value: boolean }
+  | { type: 'kernel'; value: string }
+  | { type: 'paint'; value: string };
+
+/**
+ * A command sent from Spyder to the notebook page.
+ */
+export type SpyderCommand = { type: 'save' } | { type: 'restart_kernel' };
+
+/**
+ * The object shared by Spyder, as seen from JavaScript.
+ */
+interface ISpyderChannelObject {
+  receive(messages: SpyderMessage[]): void;
+  sig_command_sent: {
+    connect(callback: (command: SpyderCommand) => void): void;
+  };
+}
+
+declare global {
+  interface Window {
+    spyderBridge?: Promise<ISpyderChannelObject>;
+  }
+}
+
+let queue: SpyderMessage[] = [];
+let flushScheduled = false;
+
+/**
+ * Send all queued messages to Spyder in one batch.
+ */
+async function flush(): Promise<void> {
+  flushScheduled = false;
+  const messages = queue;
+  queue = [];
+  const channelObject = await window.spyderBridge;
+  channelObject?.receive(messages);
+}
+
+/**
+ * Send message to Spyder.
+ *
+ * Messages sent in the same turn of the event loop are delivered together.
+ * If the page is not shown inside Spyder, the message is dropped.
+ */
+export function sendToSpyder(message: SpyderMessage): void {
+  if (!window.spyderBridge) {
+    return;
+  }
+  queue.push(message);
+  if (!flushScheduled) {
+    flushScheduled = true;
+    setTimeout(flush, 0);
+  }
+}
+
+/**
+ * Call a function whenever Spyder sends a command to the page.
+ */
+export function onCommandFromSpyder(
+  callback: (command: SpyderCommand) => void
+): void {
+  void window.spyderBridge?.then(channelObject =>
+    channelObject.sig_command_sent.connect(callback)
+  );
+}
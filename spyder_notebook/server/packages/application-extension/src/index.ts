@@ -9,7 +9,7 @@ import {
   JupyterFrontEndPlugin
 } from '@jupyterlab/application';
 
-import { IThemeManager } from '@jupyterlab/apputils';
+import { ISessionContext, IThemeManager } from '@jupyterlab/apputils';
 
 import {
   IChangedArgs,
@@ -27,6 +27,8 @@ import {
 
 import { INotebookShell } from '@jupyter-notebook/application';
 
+import { onCommandFromSpyder, sendToSpyder } from './bridge';
+
 /**
  * A regular expression to match path to notebooks and documents
  *
@@ -114,8 +116,18 @@ const theme: JupyterFrontEndPlugin<void> = {
   }
 };
 
+/**
+ * How long the dirty state has to be stable before it is sent (in ms)
+ */
+const DIRTY_DEBOUNCE_DELAY = 100;
+
 /**
  * Send message to Spyder if notebook becomes dirty or non-dirty
+ *
+ * The dirty state can toggle rapidly, for instance when many cells are
+ * executed, so changes are debounced: the state is only sent when it did not
+ * change for DIRTY_DEBOUNCE_DELAY ms, and only if it differs from the state
+ * that was sent last.
  */
 const monitorDirty: JupyterFrontEndPlugin<void> = {
   id: '@spyder-notebook/application-extension:monitor-dirty',
@@ -127,13 +139,30 @@ const monitorDirty: JupyterFrontEndPlugin<void> = {
     app: JupyterFrontEnd,
     notebookShell: INotebookShell
   ) => {
+    let sentDirty = false;
+    let timer: number | null = null;
+
+    const sendDirty = (model: INotebookModel): void => {
+      timer = null;
+      if (model.dirty !== sentDirty) {
+        sentDirty = model.dirty;
+        sendToSpyder({ type: 'dirty', value: sentDirty });
+      }
+    };
+
     const onNotebookModelStateChange = (
       model: INotebookModel,
       args: IChangedArgs<any>
     ): void => {
       if (args.name == 'dirty') {
-        alert(':SpyderComm:dirty:' + args.newValue)
-      };
+        if (timer !== null) {
+          window.clearTimeout(timer);
+        }
+        timer = window.setTimeout(
+          () => sendDirty(model),
+          DIRTY_DEBOUNCE_DELAY
+        );
+      }
     };
 
     const onNotebookShellChange = async () => {
@@ -152,6 +181,156 @@ const monitorDirty: JupyterFrontEndPlugin<void> = {
   },
 };
 
+/**
+ * Send messages to Spyder about saving the notebook and its contents
+ *
+ * Spyder is told when the notebook is saved, so that it does not need to
+ * wait for the file to appear on disk, and whether the notebook is empty
+ * (whenever this changes), so that it does not need to read the file.
+ */
+const monitorContents: JupyterFrontEndPlugin<void> = {
+  id: '@spyder-notebook/application-extension:monitor-contents',
+  description:
+    'Send messages to Spyder about saving the notebook and its contents.',
+  autoStart: true,
+  requires: [INotebookShell],
+  activate: (
+    app: JupyterFrontEnd,
+    notebookShell: INotebookShell
+  ) => {
+    const onNotebookShellChange = async () => {
+      const current = notebookShell.currentWidget;
+      if (!(current instanceof NotebookPanel)) {
+        return;
+      }
+
+      const context = current.context;
+      await context.ready;
+
+      let empty: boolean | null = null;
+      const checkEmpty = (): void => {
+        const cells = context.model.cells;
+        const newEmpty =
+          cells.length == 0 || cells.get(0).sharedModel.getSource() == '';
+        if (newEmpty !== empty) {
+          empty = newEmpty;
+          sendToSpyder({ type: 'empty', value: empty });
+        }
+      };
+
+      checkEmpty();
+      context.model.contentChanged.connect(checkEmpty);
+
+      context.saveState.connect((sender, state) => {
+        if (state == 'completed' || state == 'failed') {
+          sendToSpyder({ type: 'saved', value: state == 'completed' });
+        }
+      });
+    };
+
+    notebookShell.currentChanged.connect(onNotebookShellChange);
+  },
+};
+
+/**
+ * Send message to Spyder with the id of the kernel when it changes
+ *
+ * This lets Spyder know which kernel belongs to the notebook without asking
+ * the server for the list of sessions.
+ */
+const monitorKernel: JupyterFrontEndPlugin<void> = {
+  id: '@spyder-notebook/application-extension:monitor-kernel',
+  description:
+    'Send message to Spyder with the id of the kernel of the notebook.',
+  autoStart: true,
+  requires: [INotebookShell],
+  activate: (
+    app: JupyterFrontEnd,
+    notebookShell: INotebookShell
+  ) => {
+    const sendKernelId = (sessionContext: ISessionContext): void => {
+      const kernelId = sessionContext.session?.kernel?.id ?? '';
+      sendToSpyder({ type: 'kernel', value: kernelId });
+    };
+
+    const onNotebookShellChange = async () => {
+      const current = notebookShell.currentWidget;
+      if (!(current instanceof NotebookPanel)) {
+        return;
+      }
+
+      const sessionContext = current.sessionContext;
+      sessionContext.kernelChanged.connect(() => sendKernelId(sessionContext));
+      await sessionContext.ready;
+      sendKernelId(sessionContext);
+    };
+
+    notebookShell.currentChanged.connect(onNotebookShellChange);
+  },
+};
+
+/**
+ * A plugin sending a message to Spyder when the page is first painted
+ */
+const monitorPaint: JupyterFrontEndPlugin<void> = {
+  id: '@spyder-notebook/application-extension:monitor-paint',
+  description:
+    'Send message to Spyder when the page is first painted, for tracing.',
+  autoStart: true,
+  activate: (app: JupyterFrontEnd) => {
+    if (typeof PerformanceObserver === 'undefined') {
+      return;
+    }
+    const observer = new PerformanceObserver(list => {
+      for (const entry of list.getEntries()) {
+        sendToSpyder({ type: 'paint', value: entry.name });
+      }
+    });
+    // Paints before the plugin is activated are delivered as well
+    observer.observe({ type: 'paint', buffered: true });
+  },
+};
+
+/**
+ * Restart the kernel of a notebook, or start one if it has none
+ *
+ * If the server culled the kernel, then the session is gone, so a new
+ * session with a new kernel is started. This does not reload the page.
+ */
+async function restartKernel(sessionContext: ISessionContext): Promise<void> {
+  await sessionContext.ready;
+  const kernel = sessionContext.session?.kernel;
+  if (kernel && !kernel.isDisposed && kernel.status != 'dead') {
+    await sessionContext.restartKernel();
+  } else {
+    await sessionContext.changeKernel({
+      name: sessionContext.kernelPreference.name
+    });
+  }
+}
+
+/**
+ * Carry out commands sent by Spyder
+ */
+const spyderCommands: JupyterFrontEndPlugin<void> = {
+  id: '@spyder-notebook/application-extension:spyder-commands',
+  description: 'Carry out commands sent by Spyder.',
+  autoStart: true,
+  requires: [INotebookShell],
+  activate: (app: JupyterFrontEnd, notebookShell: INotebookShell) => {
+    onCommandFromSpyder(command => {
+      if (command.type == 'save') {
+        void app.commands.execute('docmanager:save');
+      } else if (command.type == 'restart_kernel') {
+        const current = notebookShell.currentWidget;
+        if (current instanceof NotebookPanel) {
+          void restartKernel(current.sessionContext);
+        }
+      }
+    });
+  },
+};
+
 /**
  * Export the plugins as default.
  */
@@ -159,7 +338,11 @@ const plugins: JupyterFrontEndPlugin<any>[] = [
   menus,
   opener,
   theme,
-  monitorDirty
+  monitorDirty,
+  monitorContents,
+  monitorKernel,
+  monitorPaint,
+  spyderCommands
 ];
 
 export default plugins;
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © Spyder Project Contributors
+# Licensed under the terms of the MIT License
+#
+
+"""
+Benchmarks for starting servers and opening, saving and closing notebooks.
+
+These tests start real notebook servers and are slow, so they only run if
+the environment variable SPYDER_NOTEBOOK_BENCHMARK is set to the name of a
+file. The timings are written to that file in JSON format. For example:
+
+    QT_QPA_PLATFORM=offscreen SPYDER_NOTEBOOK_BENCHMARK=bench.json \
+        pytest spyder_notebook/tests/test_benchmarks.py
+
+The number of rounds per benchmark can be set with the environment variable
+SPYDER_NOTEBOOK_BENCHMARK_ROUNDS.
+"""
+
+# Standard library imports
+import datetime
+import json
+import os
+import os.path as osp
+import platform
+import shutil
+import statistics
+import sys
+import time
+
+# Third-party library imports
+import nbformat
+import pytest
+
+# Local imports
+from spyder_notebook._version import __version__
+from spyder_notebook.utils.servermanager import ServerManager
+from spyder_notebook.widgets.notebooktabwidget import NotebookTabWidget
+
+# =============================================================================
+# Constants
+# =============================================================================
+BENCHMARK_FILE = os.environ.get('SPYDER_NOTEBOOK_BENCHMARK')
+ROUNDS = int(os.environ.get('SPYDER_NOTEBOOK_BENCHMARK_ROUNDS', 5))
+NOTEBOOK_UP = 60000
+PAGE_READY = 60000
+SAVE_DONE = 10000
+LOCATION = osp.realpath(osp.join(os.getcwd(), osp.dirname(__file__)))
+TEST_NOTEBOOK = osp.join(LOCATION, '..', 'widgets', 'tests', 'test.ipynb')
+
+# Number of cells in generated large notebook
+LARGE_NOTEBOOK_CELLS = 1000
+
+pytestmark = pytest.mark.skipif(
+    not BENCHMARK_FILE,
+    reason='Set SPYDER_NOTEBOOK_BENCHMARK to a file name to run benchmarks')
+
+# Results of all benchmarks, written to BENCHMARK_FILE at the end
+RESULTS = []
+
+
+# =============================================================================
+# Utility functions
+# =============================================================================
+def record(name, timings, **params):
+    """Store timings (in s) of a benchmark in RESULTS."""
+    RESULTS.append({
+        'name': name,
+        'params': params,
+        'rounds': len(timings),
+        'min': min(timings),
+        'max': max(timings),
+        'mean': statistics.mean(timings),
+        'median': statistics.median(timings),
+        'timings': timings
+    })
+
+
+def make_large_notebook(filename, ncells=LARGE_NOTEBOOK_CELLS):
+    """Write notebook with many code and markdown cells with outputs."""
+    nb = nbformat.v4.new_notebook()
+    for i in range(ncells):
+        if i % 10 == 0:
+            nb.cells.append(nbformat.v4.new_markdown_cell(
+                f'## Section {i // 10}\n\nSome *text* describing the code.'))
+        else:
+            output = nbformat.v4.new_output(
+                'stream', name='stdout', text=f'{i}\n' * 20)
+            nb.cells.append(nbformat.v4.new_code_cell(
+                f'x = {i}\nfor j in range(20):\n    print(x)',
+                execution_count=i, outputs=[output]))
+    nbformat.write(nb, filename)
+
+
+def open_and_wait(tabwidget, filename, qtbot):
+    """
+    Open notebook and wait until it is rendered.
+
+    Returns
+    -------
+    client : NotebookClient
+        Client displaying the notebook.
+    load_time : float
+        Time (in s) until the web page finished loading.
+    ready_time : float
+        Time (in s) until the notebook reported its contents.
+    """
+    start = time.perf_counter()
+    tabwidget.open_notebook([filename])
+    client = tabwidget.currentWidget()
+    nbwidget = client.notebookwidget
+
+    def is_notebook_page(ok):
+        return ok and nbwidget.url().toString().startswith(client.server_url)
+
+    with qtbot.waitSignal(nbwidget.sig_empty_changed, timeout=PAGE_READY):
+        qtbot.waitSignal(nbwidget.loadFinished, timeout=PAGE_READY,
+                         check_params_cb=is_notebook_page).wait()
+        load_time = time.perf_counter() - start
+    ready_time = time.perf_counter() - start
+    return client, load_time, ready_time
+
+
+# =============================================================================
+# Fixtures
+# =============================================================================
+@pytest.fixture(scope='module', autouse=True)
+def write_results():
+    """Write results of all benchmarks in this module to BENCHMARK_FILE."""
+    yield
+    data = {
+        'datetime': datetime.datetime.now().isoformat(),
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'spyder_notebook': __version__,
+        'benchmarks': RESULTS
+    }
+    with open(BENCHMARK_FILE, 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+@pytest.fixture(scope='module')
+def notebooks(tmp_path_factory):
+    """Return dict with file names of small and large notebook."""
+    nbdir = tmp_path_factory.mktemp('notebooks')
+    small = str(nbdir / 'small.ipynb')
+    shutil.copyfile(TEST_NOTEBOOK, small)
+    large = str(nbdir / 'large.ipynb')
+    make_large_notebook(large)
+    return {'small': small, 'large': large}
+
+
+@pytest.fixture
+def tabwidget(qtbot, notebooks):
+    """
+    Create NotebookTabWidget with a real server manager.
+
+    The server for the notebooks is started before the test begins.
+    """
+    server_manager = ServerManager()
+    widget = NotebookTabWidget(None, server_manager)
+    widget.resize(800, 600)
+    widget.show()
+    qtbot.addWidget(widget)
+
+    with qtbot.waitSignal(server_manager.sig_server_started,
+                          timeout=NOTEBOOK_UP):
+        server_manager.start_server(
+            notebooks['small'], widget.get_interpreter())
+
+    yield widget
+
+    while widget.count():
+        widget.close_client(save_before_close=False)
+    server_manager.shutdown_all_servers()
+
+
+# =============================================================================
+# Benchmarks
+# =============================================================================
+def test_benchmark_server_start(qtbot, notebooks):
+    """Measure time until ServerManager reports that a server started."""
+    timings = []
+    for __ in range(ROUNDS):
+        server_manager = ServerManager()
+        start = time.perf_counter()
+        with qtbot.waitSignal(server_manager.sig_server_started,
+                              timeout=NOTEBOOK_UP):
+            server_manager.start_server(notebooks['small'], sys.executable)
+        timings.append(time.perf_counter() - start)
+        server_manager.shutdown_all_servers()
+
+    record('server_start', timings)
+
+
+@pytest.mark.parametrize('size', ['small', 'large'])
+def test_benchmark_open_notebook(qtbot, tabwidget, notebooks, size):
+    """Measure time from opening a notebook until it is rendered."""
+    load_timings = []
+    ready_timings = []
+    for __ in range(ROUNDS):
+        client, load_time, ready_time = open_and_wait(
+            tabwidget, notebooks[size], qtbot)
+        load_timings.append(load_time)
+        ready_timings.append(ready_time)
+        tabwidget.close_client(tabwidget.indexOf(client),
+                               save_before_close=False)
+
+    record('open_notebook_load_finished', load_timings, size=size)
+    record('open_notebook_ready', ready_timings, size=size)
+
+
+@pytest.mark.parametrize('size', ['small', 'large'])
+def test_benchmark_save_notebook(qtbot, tabwidget, notebooks, size):
+    """Measure time from saving a notebook until it reports it is saved."""
+    client, __, __ = open_and_wait(tabwidget, notebooks[size], qtbot)
+    timings = []
+    for __ in range(ROUNDS):
+        start = time.perf_counter()
+        with qtbot.waitSignal(client.sig_saved, timeout=SAVE_DONE):
+            client.save()
+        timings.append(time.perf_counter() - start)
+
+    record('save_notebook', timings, size=size)
+
+
+@pytest.mark.parametrize('size', ['small', 'large'])
+def test_benchmark_close_notebook(mocker, qtbot, tabwidget, notebooks, size):
+    """Measure time from closing a notebook until its client is closed."""
+    timings = []
+    for __ in range(ROUNDS):
+        client, __, __ = open_and_wait(tabwidget, notebooks[size], qtbot)
+        mock_close = mocker.patch.object(
+            client, 'close', wraps=client.close)
+        start = time.perf_counter()
+        tabwidget.close_client(tabwidget.indexOf(client))
+        qtbot.waitUntil(lambda: mock_close.called, timeout=SAVE_DONE)
+        timings.append(time.perf_counter() - start)
+
+    record('close_notebook', timings, size=size)
+
+
+if __name__ == "__main__":
+    pytest.main()
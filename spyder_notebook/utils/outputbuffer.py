@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © Spyder Project Contributors
+# Licensed under the terms of the MIT License
+
+"""File implementing OutputBuffer."""
+
+# Standard library imports
+import collections
+import logging
+import os
+import os.path as osp
+
+
+# Default maximum number of characters kept in an output buffer
+DEFAULT_MAX_SIZE = 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+class OutputBuffer:
+    """
+    Bounded buffer for the output of a process.
+
+    The output is stored as a sequence of chunks, as they are received from
+    the process. When the total size exceeds the maximum, the oldest chunks
+    are discarded, so memory use does not grow over time and appending does
+    not copy the output received so far. Optionally, all output is also
+    written to a log file.
+
+    Attributes
+    ----------
+    max_size : int
+        Maximum number of characters kept in the buffer.
+    log_filename : str or None
+        Name of file to which all output is written, or None.
+    truncated : bool
+        Whether output has been discarded because the buffer was full.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, log_filename=None):
+        """
+        Construct an OutputBuffer.
+
+        Parameters
+        ----------
+        max_size : int, optional
+            Maximum number of characters kept in the buffer. The default is
+            DEFAULT_MAX_SIZE.
+        log_filename : str or None, optional
+            If set, name of file to which all output is written. The default
+            is None, meaning that output is only kept in memory.
+        """
+        self.max_size = max_size
+        self.log_filename = log_filename
+        self.truncated = False
+        self._chunks = collections.deque()
+        self._size = 0
+        self._log_file = None
+
+    def __len__(self):
+        """Return number of characters in the buffer."""
+        return self._size
+
+    def append(self, text):
+        """
+        Append text to the buffer, discarding old text if necessary.
+
+        Parameters
+        ----------
+        text : str
+            Text to be appended.
+        """
+        if not text:
+            return
+        self._write_to_log(text)
+
+        self._chunks.append(text)
+        self._size += len(text)
+        while self._size > self.max_size and len(self._chunks) > 1:
+            self._size -= len(self._chunks.popleft())
+            self.truncated = True
+        if self._size > self.max_size:
+            # Only one chunk left, which is too large by itself
+            chunk = self._chunks.pop()
+            chunk = chunk[len(chunk) - self.max_size:]
+            self._chunks.append(chunk)
+            self._size = len(chunk)
+            self.truncated = True
+
+    def getvalue(self):
+        """Return the text in the buffer."""
+        return ''.join(self._chunks)
+
+    def close(self):
+        """Close log file, if any."""
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+
+    def _write_to_log(self, text):
+        """Write text to log file, if any, opening it if necessary."""
+        if self.log_filename is None:
+            return
+        try:
+            if self._log_file is None:
+                os.makedirs(osp.dirname(self.log_filename), exist_ok=True)
+                self._log_file = open(self.log_filename, 'a',
+                                      encoding='utf-8')
+            self._log_file.write(text)
+            self._log_file.flush()
+        except OSError as err:
+            logger.warning(f'Cannot write to {self.log_filename}: {err}')
+            self.close()
+            self.log_filename = None
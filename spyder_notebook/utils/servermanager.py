@@ -13,29 +13,103 @@ import logging
 import os
 import os.path as osp
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 
 # Qt imports
-from qtpy.QtCore import QObject, QProcess, QProcessEnvironment, QTimer, Signal
-from qtpy.QtWebEngineWidgets import QWebEngineProfile
+from qtpy.QtCore import (
+    QFileSystemWatcher, QObject, QProcess, QProcessEnvironment, QTimer, Signal)
 
 # Third-party imports
 from jupyter_core.paths import jupyter_runtime_dir
-from jupyter_server import serverapp
-from tornado.httpclient import HTTPClientError
+from jupyter_server.utils import url_path_join
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Spyder imports
 from spyder.config.base import DEV, get_home_dir, get_module_path
+from spyder.utils.programs import get_temp_dir
 
+# Local imports
+from spyder_notebook.utils.outputbuffer import DEFAULT_MAX_SIZE, OutputBuffer
+from spyder_notebook.utils.sessionsclient import SessionsClient
+from spyder_notebook.utils.tracing import tracer
 
-# Delay we wait to check whether server is up (in ms)
-CHECK_SERVER_UP_DELAY = 250
+
+# Delay between checks whether server is up (in ms). Startup is normally
+# detected by watching the Jupyter runtime dir, so this is only a fallback.
+CHECK_SERVER_UP_DELAY = 1000
 
 # Delay before we give up on server starting (in s)
 SERVER_TIMEOUT_DELAY = 30
 
+# Delay before we give up on adding a notebook root to a server (in s)
+ADD_ROOT_TIMEOUT = 5
+
+# Delay before we give up on a server shutting down nicely (in s)
+SHUTDOWN_TIMEOUT = 5
+
+# Interval between checks for servers that have been idle too long (in ms)
+REAP_IDLE_SERVERS_INTERVAL = 60 * 1000
+
+# Subdirectory of Spyder's temporary directory for log files with server
+# output, if enabled
+OUTPUT_LOG_SUBDIR = 'notebook-servers'
+
+# Maximum number of connections kept open to every server
+HTTP_POOL_SIZE = 4
+
+# Number of times idempotent requests to a server are retried
+HTTP_RETRIES = 2
+
 logger = logging.getLogger(__name__)
 
 
+def is_subdir(path, directory):
+    """Return whether `path` is equal to or inside `directory`."""
+    path = osp.normcase(osp.abspath(path))
+    directory = osp.normcase(osp.abspath(directory))
+    try:
+        return osp.commonpath([path, directory]) == directory
+    except ValueError:
+        # Paths on different drives
+        return False
+
+
+def create_http_session(server_info):
+    """
+    Create HTTP session for sending requests to a notebook server.
+
+    The session keeps connections to the server open so that they can be
+    reused, authenticates with the server token and retries idempotent
+    requests (like GET and DELETE) if the connection fails or the server is
+    temporarily unavailable. Requests sent with the session should still
+    specify a timeout.
+
+    Parameters
+    ----------
+    server_info : dict
+        Server info of the server, with keys like 'url' and 'token'.
+
+    Returns
+    -------
+    requests.Session
+        The HTTP session.
+    """
+    retry = Retry(total=HTTP_RETRIES, backoff_factor=0.1,
+                  status_forcelist=[502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE,
+                          max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    token = server_info.get('token')
+    if token:
+        session.headers['Authorization'] = f'token {token}'
+    return session
+
+
 class ServerState(enum.Enum):
     """State of a server process."""
 
@@ -55,7 +129,9 @@ class ServerProcess:
 
     def __init__(self, process, notebook_dir, interpreter, info_file,
                  starttime=None, state=ServerState.STARTING, server_info=None,
-                 output=''):
+                 output='', roots=None, clients=None, idle_since=None,
+                 output_buffer=None, sessions_client=None, http_session=None,
+                 readytime=None, kernel_cull_timeout=0, pending_roots=None):
         """
         Construct a ServerProcess.
 
@@ -79,8 +155,39 @@ class ServerProcess:
             If set, this is a dict with the information in info_file. It has
             keys like 'url' and 'token'. The default is None.
         output : str
-            Output of the server process from stdout and stderr. The default
-            is ''.
+            Initial output of the server process from stdout and stderr. The
+            default is ''.
+        roots : list of str or None, optional
+            If set, the server only renders notebooks in these directories.
+            This is used for servers in the pool, which start with an empty
+            list. The default is None, meaning that the server can render
+            all notebooks under `notebook_dir`.
+        clients : set of NotebookClient or None, optional
+            Notebook clients that use this server. The default is None,
+            meaning that there are no such clients.
+        idle_since : datetime or None, optional
+            Time at which the last client stopped using the server, or None
+            if the server was never used or is still in use. The default is
+            None.
+        output_buffer : OutputBuffer or None, optional
+            Buffer for storing output of the server process. The default is
+            None, meaning that a buffer with the default size is used.
+        sessions_client : SessionsClient or None, optional
+            Client for the sessions of the server, which is created when the
+            first notebook client uses the server. The default is None.
+        http_session : requests.Session or None, optional
+            HTTP session for sending requests to the server, which is created
+            when the server is running. The default is None.
+        readytime : datetime or None, optional
+            Time at which the server started accepting requests, or None if
+            it has not done so (yet). The default is None.
+        kernel_cull_timeout : int, optional
+            Number of minutes after which the server culls idle kernels. The
+            default is 0, meaning that kernels are not culled.
+        pending_roots : set of str or None, optional
+            Directories in `roots` that the server was asked to add but did
+            not yet accept. The default is None, meaning that there are no
+            such directories.
         """
         self.process = process
         self.notebook_dir = notebook_dir
@@ -89,7 +196,55 @@ class ServerProcess:
         self.starttime = starttime or datetime.datetime.now()
         self.state = state
         self.server_info = server_info
-        self.output = output
+        if output_buffer is None:
+            output_buffer = OutputBuffer()
+        self.output_buffer = output_buffer
+        self.output_buffer.append(output)
+        self.roots = roots
+        self.sessions_client = sessions_client
+        self.http_session = http_session
+        self.clients = clients or set()
+        self.idle_since = idle_since
+        self.readytime = readytime
+        self.kernel_cull_timeout = kernel_cull_timeout
+        self.pending_roots = pending_roots or set()
+
+    def can_render(self, filename):
+        """
+        Return whether the server can render the notebook with given name.
+
+        Parameters
+        ----------
+        filename : str
+            Absolute file name of the notebook.
+        """
+        if self.roots is None:
+            return is_subdir(filename, self.notebook_dir)
+        return any(is_subdir(filename, root) for root in self.roots)
+
+    def is_adding_root(self, filename):
+        """
+        Return whether the server is still adding a root for given notebook.
+
+        Parameters
+        ----------
+        filename : str
+            Absolute file name of the notebook.
+        """
+        return any(is_subdir(filename, root) for root in self.pending_roots)
+
+    @property
+    def output(self):
+        """Output of the server process from stdout and stderr (str).
+
+        If the output is too long, then only the most recent part is kept.
+        """
+        return self.output_buffer.getvalue()
+
+    @property
+    def is_idle_in_pool(self):
+        """Whether the server is in the pool waiting to be assigned."""
+        return self.roots is not None and not self.roots
 
 
 class ServerManager(QObject):
@@ -100,10 +255,40 @@ class ServerManager(QObject):
     directory, so we may need several servers. This class manages all these
     servers.
 
+    Starting a server takes several seconds, so the manager can keep a pool
+    of servers which are started before they are needed. These servers are
+    rooted at the root of the file system but restricted to render nothing.
+    When a notebook is opened that no server can render, a server from the
+    pool is assigned to the notebook directory and the pool is refilled.
+
+    Every server takes up memory, so in multi-root mode the manager uses a
+    single server for every interpreter (and drive). This server is also
+    rooted at the root of the file system and every time a notebook is
+    opened that the server can not yet render, the directory containing the
+    notebook is added to the roots of the server.
+
+    Servers that have not been used by any notebook client for a while are
+    shut down and removed from the list of servers.
+
     Attributes
     ----------
     dark_theme : bool
         Whether notebooks should be rendered using the dark theme.
+    idle_timeout : int
+        Number of minutes after which a server that is not used by any
+        notebook client is shut down. If zero, servers are never shut down
+        until Spyder exits.
+    output_limit : int
+        Maximum number of characters of server output kept in memory for
+        every server.
+    log_output : bool
+        Whether to write all output of servers to log files in the
+        directory OUTPUT_LOG_SUBDIR of Spyder's temporary directory.
+    multi_root : bool
+        Whether to use a single server with several roots instead of one
+        server for every notebook directory.
+    pool_size : int
+        Number of idle servers to keep ready for every interpreter.
     servers : list of ServerProcess
         List of servers managed by this object.
     """
@@ -117,34 +302,81 @@ class ServerManager(QObject):
     # We tried to start a server but an error occurred
     sig_server_errored = Signal(ServerProcess)
 
-    def __init__(self, dark_theme=False):
+    # A server printed output; the second argument is the new output only
+    sig_server_output = Signal(ServerProcess, str)
+
+    # A server was added to or removed from the list of servers
+    sig_servers_changed = Signal()
+
+    # A server can now render notebooks in a directory added to its roots
+    sig_root_added = Signal(ServerProcess)
+
+    # A server replied to the request to add a root; the arguments are the
+    # server, the root and whether it succeeded
+    sig_add_root_finished = Signal(ServerProcess, str, bool)
+
+    def __init__(self, dark_theme=False, pool_size=0, multi_root=False,
+                 idle_timeout=0, output_limit=DEFAULT_MAX_SIZE,
+                 log_output=False, kernel_pool_size=0, kernel_cull_timeout=0):
         """
         Construct a ServerManager.
 
-        This constructor also clears Qt WebEngine's HTTP cache, because for
-        unknown reasons WebEngine seems to use out-of-date code after the
-        JavaScript bundle is replaced.
-
         Parameters
         ----------
         dark_theme : bool, optional
             Whether notebooks should be rendered using the dark theme.
             The default is False.
+        pool_size : int, optional
+            Number of idle servers to keep ready for every interpreter. The
+            default is 0, meaning that servers are only started when needed.
+        multi_root : bool, optional
+            Whether to use a single server with several roots instead of one
+            server for every notebook directory. The default is False.
+        idle_timeout : int, optional
+            Number of minutes after which an unused server is shut down. The
+            default is 0, meaning that servers are not shut down.
+        output_limit : int, optional
+            Maximum number of characters of server output kept in memory for
+            every server. The default is DEFAULT_MAX_SIZE.
+        log_output : bool, optional
+            Whether to write all output of servers to log files. The default
+            is False.
+        kernel_pool_size : int, optional
+            Number of kernels that every server starts in advance, so that
+            notebooks can use them without waiting. The default is 0.
+        kernel_cull_timeout : int, optional
+            Number of minutes after which servers shut down idle kernels. The
+            default is 0, meaning that kernels are not shut down.
         """
         super().__init__()
         self.dark_theme = dark_theme
+        self.pool_size = pool_size
+        self.multi_root = multi_root
+        self.idle_timeout = idle_timeout
+        self.output_limit = output_limit
+        self.log_output = log_output
+        self.kernel_pool_size = kernel_pool_size
+        self.kernel_cull_timeout = kernel_cull_timeout
         self.servers = []
-        QWebEngineProfile.defaultProfile().clearHttpCache()
+        self._server_count = 0
+        self._runtime_dir_watcher = None
+        self._reap_timer = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self.sig_add_root_finished.connect(self._handle_add_root_finished)
 
+    @tracer.traced('ServerManager.get_server')
     def get_server(self, filename, interpreter, start=True):
         """
         Return server which can render a notebook or potentially start one.
 
         Return the server info of a server managed by this object which can
         render the notebook with the given file name and which uses the given
-        interpreter. If no such server exists and `start` is True, then start
-        up a server asynchronously (unless a suitable server is already in the
-        process of starting up).
+        interpreter. If no such server exists and `start` is True, then add
+        the notebook directory to the multi-root server (in multi-root mode),
+        assign a server from the pool to the notebook or, if the pool is
+        empty, start up a server asynchronously (unless a suitable server is
+        already in the process of starting up). Servers add directories to
+        their roots asynchronously and emit `sig_root_added` when done.
 
         Parameters
         ----------
@@ -163,30 +395,249 @@ class ServerManager(QObject):
         """
         filename = osp.abspath(filename)
         for server in self.servers:
-            if (filename.startswith(server.notebook_dir)
+            if (server.can_render(filename)
                     and interpreter == server.interpreter):
                 if server.state == ServerState.RUNNING:
+                    if server.is_adding_root(filename):
+                        logger.debug('Waiting for server to add root for %s',
+                                     filename)
+                        return None
                     return server.server_info
                 elif server.state == ServerState.STARTING:
                     logger.debug('Waiting for server for %s to start up',
                                  server.notebook_dir)
                     return None
         if start:
-            self.start_server(filename, interpreter)
+            server = None
+            if self.multi_root:
+                server = self._get_multi_root_server(filename, interpreter)
+            if server is None:
+                server = self._assign_server_from_pool(filename, interpreter)
+            if server is None:
+                self.start_server(filename, interpreter)
+        return None
+
+    def _get_multi_root_server(self, filename, interpreter):
+        """
+        Add notebook directory to a server which is already in use.
+
+        Look for a server with the given interpreter which is started with
+        `--restrict-roots`, is not idle in the pool and can render notebooks
+        on the same drive as the given notebook. If there is such a server,
+        then add the notebook directory to its roots.
+
+        Parameters
+        ----------
+        filename : str
+            Absolute file name of notebook to be rendered.
+        interpreter : str
+            File name of Python interpreter to be used.
+
+        Returns
+        -------
+        ServerProcess or None
+            The server that can now render the notebook, or None if there is
+            no suitable server.
+        """
+        for server in self.servers:
+            if (server.roots and server.interpreter == interpreter
+                    and is_subdir(filename, server.notebook_dir)
+                    and server.state in (ServerState.STARTING,
+                                         ServerState.RUNNING)):
+                nbdir = self._get_notebook_dir(filename)
+                logger.debug('Adding %s to server for %s',
+                             nbdir, ', '.join(server.roots))
+                self._add_root(server, nbdir)
+                return server
         return None
 
+    def fill_pool(self, interpreter):
+        """
+        Start servers until there are enough idle servers in the pool.
+
+        Parameters
+        ----------
+        interpreter : str
+            File name of Python interpreter to be used by servers in the pool.
+        """
+        servers = [
+            server for server in self.servers
+            if (server.roots is not None and server.interpreter == interpreter
+                and server.state in (ServerState.STARTING,
+                                     ServerState.RUNNING))]
+        if self.multi_root and any(server.roots for server in servers):
+            # The multi-root server can render new notebooks immediately
+            return
+        num_idle = sum(1 for server in servers if server.is_idle_in_pool)
+        pool_root = osp.splitdrive(get_home_dir())[0] + os.sep
+        for __ in range(self.pool_size - num_idle):
+            self._start_server_process(pool_root, interpreter, roots=[])
+
+    def _assign_server_from_pool(self, filename, interpreter):
+        """
+        Assign an idle server in the pool to render the given notebook.
+
+        Servers which are already running are preferred over servers which
+        are still starting up. After a server is taken from the pool, the
+        pool is refilled.
+
+        Parameters
+        ----------
+        filename : str
+            Absolute file name of notebook to be rendered.
+        interpreter : str
+            File name of Python interpreter to be used.
+
+        Returns
+        -------
+        ServerProcess or None
+            The server that is assigned, or None if there is no suitable
+            server in the pool.
+        """
+        candidates = [
+            server for server in self.servers
+            if (server.is_idle_in_pool and server.interpreter == interpreter
+                and is_subdir(filename, server.notebook_dir)
+                and server.state in (ServerState.STARTING,
+                                     ServerState.RUNNING))]
+        if not candidates:
+            return None
+        candidates.sort(key=lambda server: server.state != ServerState.RUNNING)
+        server = candidates[0]
+
+        nbdir = self._get_notebook_dir(filename)
+        logger.debug('Assigning server in pool to %s', nbdir)
+        self._add_root(server, nbdir)
+        self.fill_pool(interpreter)
+        return server
+
+    def _add_root(self, server_process, root):
+        """
+        Add directory to the roots of a server started with `--restrict-roots`.
+
+        If the server is running, then it is told about the new root in a
+        worker thread; otherwise, this happens after it has started. In
+        either case, the root is pending until the server accepts it; see
+        `_handle_add_root_finished()`.
+
+        Parameters
+        ----------
+        server_process : ServerProcess
+            The server, which should be starting or running.
+        root : str
+            Directory from which the server should render notebooks.
+        """
+        server_process.roots.append(root)
+        if server_process.state == ServerState.RUNNING:
+            self._send_root(server_process, root)
+
+    def _send_root(self, server_process, root):
+        """
+        Ask running server in a worker thread to add directory to its roots.
+
+        When the server replies, `sig_add_root_finished` is emitted.
+        """
+        server_process.pending_roots.add(root)
+
+        def emit_finished(future):
+            success = (not future.cancelled() and future.exception() is None
+                       and future.result())
+            self.sig_add_root_finished.emit(server_process, root, success)
+
+        try:
+            future = self._executor.submit(
+                self._add_root_to_server, server_process, root)
+        except RuntimeError:
+            # Executor is shut down because Spyder is closing
+            return
+        future.add_done_callback(emit_finished)
+
+    def _handle_add_root_finished(self, server_process, root, success):
+        """
+        Handle reply of server to the request to add a root.
+
+        If the server accepted the root, emit `sig_root_added`. Otherwise,
+        remove the root, but leave the state of the server unchanged, because
+        the server can still render notebooks in its other roots. Instead,
+        start a server rooted at the directory, without `--restrict-roots`,
+        because another server with restricted roots would likely refuse the
+        directory as well.
+        """
+        server_process.pending_roots.discard(root)
+        if server_process.state != ServerState.RUNNING:
+            return
+        if success:
+            self.sig_root_added.emit(server_process)
+            return
+        server_process.roots.remove(root)
+        logger.debug('Starting server for %s because it was refused', root)
+        self._start_server_process(root, server_process.interpreter)
+
+    def _add_root_to_server(self, server_process, root):
+        """
+        Tell running server that it can render notebooks in given directory.
+
+        This function blocks, so it is run in a worker thread.
+
+        Parameters
+        ----------
+        server_process : ServerProcess
+            The server, which should be started with `--restrict-roots`.
+        root : str
+            Directory from which the server should render notebooks.
+
+        Returns
+        -------
+        bool
+            Whether the server accepted the new directory.
+        """
+        server_info = server_process.server_info
+        url = url_path_join(server_info['url'], 'spyder-notebooks-api/roots')
+        http = server_process.http_session or requests
+        try:
+            response = http.post(
+                url, json={'root': root},
+                headers={'Authorization': f'token {server_info["token"]}'},
+                timeout=ADD_ROOT_TIMEOUT)
+        except requests.exceptions.RequestException as err:
+            logger.warning(f'Error when adding {root} to server: {err}')
+            return False
+        if response.status_code != requests.codes.created:
+            logger.warning(f'Error when adding {root} to server: '
+                           f'status code = {response.status_code}')
+            return False
+        return True
+
+    @staticmethod
+    def _get_notebook_dir(filename):
+        """
+        Return directory that a server should render a notebook from.
+
+        This is the home directory if the notebook is in there, and the
+        directory containing the notebook otherwise.
+        """
+        home_dir = get_home_dir()
+        if is_subdir(filename, home_dir):
+            return home_dir
+        else:
+            return osp.dirname(filename)
+
+    @tracer.traced('ServerManager.start_server')
     def start_server(self, filename, interpreter):
         """
         Start a notebook server asynchronously.
 
         Start a server which can render the given notebook and return
-        immediately. Assume the server uses the given interpreter. The manager
-        will check periodically whether the server is accepting requests and
-        emit `sig_server_started` or `sig_server_timed_out` when appropriate.
+        immediately. In multi-root mode, the server is rooted at the root of
+        the drive and restricted to the directory containing the notebook, so
+        that other directories can be added later. Assume the server uses the
+        given interpreter. The manager watches the Jupyter runtime dir to
+        detect when the server is accepting requests and will emit
+        `sig_server_started` or `sig_server_timed_out` when appropriate.
 
         Every server uses a unique file to store its connection number in.
-        The name of this file is based on `self.servers`, under the assumption
-        that entries are never removed from this list.
+        The name of this file is based on the number of servers started by
+        this object, which does not change when servers are removed.
 
         Parameters
         ----------
@@ -195,24 +646,47 @@ class ServerManager(QObject):
         interpreter : str
             File name of Python interpreter to be used.
         """
-        home_dir = get_home_dir()
-        if filename.startswith(home_dir):
-            nbdir = home_dir
+        nbdir = self._get_notebook_dir(filename)
+        if self.multi_root:
+            drive_root = osp.splitdrive(osp.abspath(filename))[0] + os.sep
+            self._start_server_process(drive_root, interpreter, roots=[nbdir])
         else:
-            nbdir = osp.dirname(filename)
+            self._start_server_process(nbdir, interpreter)
 
+    def _start_server_process(self, nbdir, interpreter, roots=None):
+        """
+        Start a notebook server process asynchronously.
+
+        Parameters
+        ----------
+        nbdir : str
+            Root directory of the server.
+        interpreter : str
+            File name of Python interpreter to be used.
+        roots : list of str or None, optional
+            If not None, start server with `--restrict-roots` so that it can
+            only render notebooks in these directories. The default is None.
+        """
         logger.debug('Starting new notebook server for %s', nbdir)
         process = QProcess(None)
         serverscript = osp.join(osp.dirname(__file__), '../server/main.py')
         serverscript = osp.normpath(serverscript)
         my_pid = os.getpid()
-        server_index = len(self.servers) + 1
+        self._server_count += 1
+        server_index = self._server_count
         info_file = f'spynbserver-{my_pid}-{server_index}.json'
         arguments = ['-m', 'spyder_notebook.server',
                      f'--info-file={info_file}',
                      f'--notebook-dir={nbdir}']
         if self.dark_theme:
             arguments.append('--dark')
+        if roots is not None:
+            arguments.append('--restrict-roots')
+        if self.kernel_pool_size:
+            arguments.append(f'--kernel-pool-size={self.kernel_pool_size}')
+        if self.kernel_cull_timeout:
+            arguments.append(
+                f'--kernel-cull-timeout={60 * self.kernel_cull_timeout}')
 
         logger.debug('Arguments: %s', repr(arguments))
 
@@ -221,9 +695,18 @@ class ServerManager(QObject):
             env.insert('PYTHONPATH', osp.dirname(get_module_path('spyder')))
             process.setProcessEnvironment(env)
 
+        if self.log_output:
+            log_filename = osp.join(
+                get_temp_dir(), OUTPUT_LOG_SUBDIR,
+                osp.splitext(info_file)[0] + '.log')
+        else:
+            log_filename = None
+        output_buffer = OutputBuffer(self.output_limit, log_filename)
+
         server_process = ServerProcess(
             process, notebook_dir=nbdir, interpreter=interpreter,
-            info_file=info_file)
+            info_file=info_file, roots=roots, output_buffer=output_buffer,
+            kernel_cull_timeout=self.kernel_cull_timeout)
         process.setProcessChannelMode(QProcess.MergedChannels)
         process.readyReadStandardOutput.connect(
             lambda: self.read_server_output(server_process))
@@ -233,100 +716,392 @@ class ServerManager(QObject):
             lambda code, status:
                 self.handle_finished(server_process, code, status))
 
+        self._watch_runtime_dir()
+        tracer.begin('server startup', info_file, notebook_dir=nbdir)
         process.start(sys.executable, arguments)
         self.servers.append(server_process)
+        self.sig_servers_changed.emit()
 
         self._check_server_started(server_process)
 
-    def _check_server_started(self, server_process):
+    def _watch_runtime_dir(self):
         """
-        Check whether a notebook server has started up.
+        Start watching the Jupyter runtime dir for new server info files.
 
-        If the server state is no longer in the "starting" state (probably
-        because an error occurred or the server exited prematurely) then
-        do nothing.
+        Servers write their info file in the runtime dir as soon as they
+        accept requests, so watching the directory lets us detect that a
+        server has started without waiting for the next poll.
+        """
+        if self._runtime_dir_watcher is None:
+            self._runtime_dir_watcher = QFileSystemWatcher(self)
+            self._runtime_dir_watcher.directoryChanged.connect(
+                self._check_starting_servers)
+            self._runtime_dir_watcher.fileChanged.connect(
+                self._check_starting_servers)
 
-        Otherwise, look for a json file in the Jupyter runtime dir to check
-        whether the notebook server has started up. If so, then emit
-        `sig_server_started` and fill the server info with the contents of the
-        json file. If not, then schedule another check after a short delay
-        (as set in CHECK_SERVER_UP_DELAY) unless the server is taken too long
-        (as specified by SERVER_TIMEOUT_DELAY). In the latter case, emit
-        sig_server_timed_out`.
+        runtime_dir = jupyter_runtime_dir()
+        try:
+            os.makedirs(runtime_dir, exist_ok=True)
+        except OSError as err:
+            logger.debug(f'Cannot create {runtime_dir}: {err}')
+            return
+        if runtime_dir not in self._runtime_dir_watcher.directories():
+            self._runtime_dir_watcher.addPath(runtime_dir)
+
+    def _check_starting_servers(self, path=None):
+        """
+        Check whether any of the servers that are starting up has started.
+
+        This function is connected to the signals of the watcher on the
+        Jupyter runtime dir, and called when a server produces output.
 
         Parameters
         ----------
-        server_process : ServerProcess
-            The server process to be checked.
+        path : str or None, optional
+            Path reported by the watcher. It is not used, because it is
+            cheap to check all servers that are starting up.
         """
-        if server_process.state != ServerState.STARTING:
-            return
+        for server_process in self.servers:
+            if server_process.state == ServerState.STARTING:
+                self._read_server_info(server_process)
+
+    def _read_server_info(self, server_process):
+        """
+        Read info file of a notebook server to check whether it has started.
 
+        Look for a json file in the Jupyter runtime dir to check whether the
+        notebook server has started up. If so, then fill the server info with
+        the contents of the json file, tell the server about any notebook
+        roots that were assigned while it was starting up, and emit
+        `sig_server_started`.
+
+        If the file exists but cannot be parsed, then it is probably still
+        being written, so watch the file itself to be notified when the
+        server finishes writing it.
+
+        Parameters
+        ----------
+        server_process : ServerProcess
+            The server process to be checked; it should be starting up.
+
+        Returns
+        -------
+        bool
+            Whether the info file could be read.
+        """
         runtime_dir = jupyter_runtime_dir()
         filename = osp.join(runtime_dir, server_process.info_file)
 
         try:
             with open(filename, encoding='utf-8') as f:
                 server_info = json.load(f)
-        except (OSError, json.JSONDecodeError):
-            # E.g., file does not (yet) exist or is still being written
+        except OSError:
+            # E.g., file does not (yet) exist
             logger.debug(f'Error when opening {filename}')
-            delay = datetime.datetime.now() - server_process.starttime
-            if delay > datetime.timedelta(seconds=SERVER_TIMEOUT_DELAY):
-                logger.debug('Notebook server for %s timed out',
-                             server_process.notebook_dir)
-                server_process.state = ServerState.TIMED_OUT
-                self.sig_server_timed_out.emit(server_process)
-            else:
-                QTimer.singleShot(
-                    CHECK_SERVER_UP_DELAY,
-                    lambda: self._check_server_started(server_process))
-            return None
+            return False
+        except json.JSONDecodeError:
+            # File is still being written
+            logger.debug(f'Error when parsing {filename}')
+            watcher = self._runtime_dir_watcher
+            if watcher is not None and filename not in watcher.files():
+                watcher.addPath(filename)
+            return False
 
         logger.debug('Server for %s started', server_process.notebook_dir)
         server_process.state = ServerState.RUNNING
+        server_process.readytime = datetime.datetime.now()
         server_process.server_info = server_info
+        server_process.http_session = create_http_session(server_info)
+        self._unwatch_runtime_dir(filename)
+        for root in server_process.roots or []:
+            self._send_root(server_process, root)
+        tracer.end('server startup', server_process.info_file,
+                   result='started')
         self.sig_server_started.emit(server_process)
+        return True
+
+    def _unwatch_runtime_dir(self, info_filename):
+        """
+        Stop watching info file, and runtime dir if no server is starting.
+        """
+        watcher = self._runtime_dir_watcher
+        if watcher is None:
+            return
+        if info_filename in watcher.files():
+            watcher.removePath(info_filename)
+        if not any(server.state == ServerState.STARTING
+                   for server in self.servers):
+            directories = watcher.directories()
+            if directories:
+                watcher.removePaths(directories)
+
+    @tracer.traced('ServerManager._check_server_started')
+    def _check_server_started(self, server_process):
+        """
+        Check whether a notebook server has started up.
+
+        This is a fallback in case no notification from the watcher on the
+        Jupyter runtime dir arrives; normally, startup is detected by
+        `_check_starting_servers()`.
+
+        If the server state is no longer in the "starting" state (probably
+        because an error occurred, the server exited prematurely or startup
+        was already detected) then do nothing.
+
+        Otherwise, read the server info file with `_read_server_info()`. If
+        this does not succeed, then schedule another check after a delay
+        (as set in CHECK_SERVER_UP_DELAY) unless the server is taken too long
+        (as specified by SERVER_TIMEOUT_DELAY). In the latter case, emit
+        `sig_server_timed_out`.
+
+        Parameters
+        ----------
+        server_process : ServerProcess
+            The server process to be checked.
+        """
+        if server_process.state != ServerState.STARTING:
+            return
+
+        if self._read_server_info(server_process):
+            return
+
+        delay = datetime.datetime.now() - server_process.starttime
+        if delay > datetime.timedelta(seconds=SERVER_TIMEOUT_DELAY):
+            logger.debug('Notebook server for %s timed out',
+                         server_process.notebook_dir)
+            server_process.state = ServerState.TIMED_OUT
+            tracer.end('server startup', server_process.info_file,
+                       result='timed out')
+            self.sig_server_timed_out.emit(server_process)
+        else:
+            QTimer.singleShot(
+                CHECK_SERVER_UP_DELAY,
+                lambda: self._check_server_started(server_process))
+
+    def register_client(self, client, server_info):
+        """
+        Record that a notebook client uses the server with given info.
+
+        Parameters
+        ----------
+        client : NotebookClient
+            The notebook client.
+        server_info : dict
+            Server info, as returned by `get_server()`.
+
+        Returns
+        -------
+        SessionsClient or None
+            Client for the sessions of the server, or None if the server is
+            not managed by this object.
+        """
+        for server in self.servers:
+            if server.server_info == server_info:
+                server.clients.add(client)
+                server.idle_since = None
+                if server.sessions_client is None:
+                    server.sessions_client = SessionsClient(
+                        server_info, http_session=server.http_session,
+                        watch_culled=bool(server.kernel_cull_timeout),
+                        parent=self)
+                    server.sessions_client.refresh()
+                return server.sessions_client
+        return None
+
+    def unregister_client(self, client):
+        """
+        Record that a notebook client no longer uses its server.
+
+        If no other client uses the server, then start the timer for
+        shutting down idle servers.
+
+        Parameters
+        ----------
+        client : NotebookClient
+            The notebook client.
+        """
+        for server in self.servers:
+            if client in server.clients:
+                server.clients.remove(client)
+                if not server.clients:
+                    server.idle_since = datetime.datetime.now()
+                    self._start_reap_timer()
+
+    def _start_reap_timer(self):
+        """Start timer for shutting down idle servers if necessary."""
+        if self.idle_timeout <= 0:
+            return
+        if self._reap_timer is None:
+            self._reap_timer = QTimer(self)
+            self._reap_timer.setInterval(REAP_IDLE_SERVERS_INTERVAL)
+            self._reap_timer.timeout.connect(self.reap_idle_servers)
+        if not self._reap_timer.isActive():
+            self._reap_timer.start()
+
+    def reap_idle_servers(self):
+        """
+        Shut down servers that have not been used for a while.
+
+        Shut down all running servers without clients that have been idle
+        for longer than `self.idle_timeout` minutes. Servers in the pool are
+        not shut down, because they are meant to be idle. The timer that
+        calls this function is started if there are idle servers left, and
+        stopped otherwise.
+        """
+        if self.idle_timeout <= 0:
+            if self._reap_timer is not None:
+                self._reap_timer.stop()
+            return
+
+        now = datetime.datetime.now()
+        timeout = datetime.timedelta(minutes=self.idle_timeout)
+        waiting = False
+        for server in list(self.servers):
+            if (server.state != ServerState.RUNNING or server.clients
+                    or server.idle_since is None or server.is_idle_in_pool):
+                continue
+            if now - server.idle_since > timeout:
+                logger.debug('Shutting down idle server for %s',
+                             server.notebook_dir)
+                self.shutdown_server(server)
+            else:
+                waiting = True
+        if waiting:
+            self._start_reap_timer()
+        elif self._reap_timer is not None:
+            self._reap_timer.stop()
+
+    def shutdown_server(self, server_process):
+        """
+        Shut down a server and remove it from the list of servers.
+
+        Ask the server to shut down nicely if it is running, and kill the
+        process if it is still running after SHUTDOWN_TIMEOUT seconds. If
+        the server is not running, then kill the process immediately. This
+        function does not wait for the process to finish.
+
+        The signals of the process are disconnected first, so that killing
+        it is not reported as an error.
+
+        Parameters
+        ----------
+        server_process : ServerProcess
+            The server to be shut down.
+        """
+        process = server_process.process
+        self._disconnect_process(process)
+        if server_process.state == ServerState.RUNNING:
+            process.finished.connect(
+                lambda code, status: server_process.output_buffer.close())
+            self._request_shutdown(server_process)
+            QTimer.singleShot(
+                SHUTDOWN_TIMEOUT * 1000,
+                lambda: self._kill_process(server_process))
+        else:
+            process.kill()
+            server_process.output_buffer.close()
+        if server_process.sessions_client is not None:
+            server_process.sessions_client.close()
+        if server_process.http_session is not None:
+            server_process.http_session.close()
+        server_process.state = ServerState.FINISHED
+        self.servers.remove(server_process)
+        self.sig_servers_changed.emit()
+
+    @staticmethod
+    def _disconnect_process(process):
+        """Disconnect the signals of a server process from the manager."""
+        for signal in [process.readyReadStandardOutput,
+                       process.errorOccurred, process.finished]:
+            try:
+                signal.disconnect()
+            except TypeError:
+                # Signal was not connected
+                pass
+
+    def _request_shutdown(self, server_process):
+        """
+        Ask a running server to shut down, without waiting for it to exit.
+
+        Parameters
+        ----------
+        server_process : ServerProcess
+            The server to be shut down.
+
+        Returns
+        -------
+        bool
+            Whether the server accepted the request.
+        """
+        server_info = server_process.server_info
+        url = url_path_join(server_info['url'], 'api/shutdown')
+        http = server_process.http_session or requests
+        try:
+            response = http.post(
+                url,
+                headers={'Authorization': f'token {server_info["token"]}'},
+                timeout=SHUTDOWN_TIMEOUT)
+        except requests.exceptions.RequestException as err:
+            logger.warning(f'Error when shutting down server: {err}')
+            return False
+        return response.ok
+
+    @staticmethod
+    def _kill_process(server_process):
+        """Kill server process if it is still running."""
+        process = server_process.process
+        if process.state() != QProcess.NotRunning:
+            logger.debug('Killing server for %s', server_process.notebook_dir)
+            process.kill()
 
     def shutdown_all_servers(self):
         """
         Shutdown all servers.
 
-        Disconnect all signals of the server process and try to shutdown the
-        server nicely. However, if the server is still starting up, or if
-        shutting down nicely does not work, then kill the server process.
+        Disconnect all signals of the server processes and ask all running
+        servers to shut down nicely. The requests are sent concurrently and
+        we wait for the servers to exit until a common deadline, set by
+        SHUTDOWN_TIMEOUT, so that the total time does not grow with the
+        number of servers. Servers that are still starting up, or that have
+        not exited at the deadline, are killed. Finally, the HTTP sessions
+        of the servers are closed.
         """
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        running = []
         for server in self.servers:
             process = server.process
-            process.readyReadStandardOutput.disconnect()
-            process.errorOccurred.disconnect()
-            process.finished.disconnect()
+            self._disconnect_process(process)
+            if server.sessions_client is not None:
+                server.sessions_client.close()
 
             if server.state == ServerState.RUNNING:
                 logger.debug('Shutting down notebook server for %s',
                              server.notebook_dir)
-
-                try:
-                    serverapp.shutdown_server(server.server_info, log=logger)
-                except HTTPClientError as err:
-                    # No response received, typically due to time out
-                    if err.code == 599:
-                        logger.warning('Ignoring HTTPClientError '
-                                       'with code = 599')
-                    else:
-                        raise
-                except ConnectionError as err:
-                    logger.warning(f'Ignoring {err}')
+                running.append(server)
                 server.state = ServerState.FINISHED
-
-            if server.state == ServerState.STARTING:
+            elif server.state == ServerState.STARTING:
                 process.kill()
                 server.state = ServerState.FINISHED
 
-            if process.state() != QProcess.NotRunning:
-                # Should not be necessary, but make sure that process is killed
-                process.kill()
+        if running:
+            # Do not wait for requests that did not finish before the deadline
+            executor = ThreadPoolExecutor(max_workers=len(running))
+            futures = [executor.submit(self._request_shutdown, server)
+                       for server in running]
+            wait(futures, timeout=max(0, deadline - time.monotonic()))
+            executor.shutdown(wait=False)
+        self._executor.shutdown(wait=False)
 
+        for server in self.servers:
+            process = server.process
+            remaining = int(1000 * (deadline - time.monotonic()))
+            if (process.state() != QProcess.NotRunning
+                    and (remaining <= 0
+                         or not process.waitForFinished(remaining))):
+                logger.debug('Killing server for %s', server.notebook_dir)
+                process.kill()
+            if server.http_session is not None:
+                server.http_session.close()
 
     def read_server_output(self, server_process):
         """
@@ -334,8 +1109,12 @@ class ServerManager(QObject):
 
         This function is connected to the QProcess.readyReadStandardOutput
         signal. It reads the contents of the standard output channel of the
-        server process and stores it in `server_process.output`. The standard
-        error channel is merged into the standard output channel.
+        server process, stores it in `server_process.output_buffer` and emits
+        `sig_server_output`. The standard error channel is merged into the
+        standard output channel.
+
+        The server prints a message when it is ready to accept requests, so
+        if the server is starting up, check whether it has started.
 
         Parameters
         ----------
@@ -344,7 +1123,10 @@ class ServerManager(QObject):
         """
         byte_array = server_process.process.readAllStandardOutput()
         output = byte_array.data().decode(errors='backslashreplace')
-        server_process.output += output
+        server_process.output_buffer.append(output)
+        self.sig_server_output.emit(server_process, output)
+        if server_process.state == ServerState.STARTING:
+            self._read_server_info(server_process)
 
     def handle_error(self, server_process, error):
         """
@@ -362,6 +1144,9 @@ class ServerManager(QObject):
         """
         logger.debug('Server for %s encountered error %s',
                      server_process.notebook_dir, str(error))
+        if server_process.state == ServerState.STARTING:
+            tracer.end('server startup', server_process.info_file,
+                       result='error')
         server_process.state = ServerState.ERROR
         self.sig_server_errored.emit(server_process)
 
@@ -370,7 +1155,7 @@ class ServerManager(QObject):
         Handle signal that notebook server process has finished.
 
         This function is connected to the QProcess.finished signal.
-        It changes the state of the process.
+        It changes the state of the process and closes its log file.
 
         Parameters
         ----------
@@ -384,3 +1169,4 @@ class ServerManager(QObject):
         logger.debug('Server for %s finished with code = %d, status = %s',
                      server_process.notebook_dir, code, str(status))
         server_process.state = ServerState.FINISHED
+        server_process.output_buffer.close()
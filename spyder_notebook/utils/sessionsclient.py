@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © Spyder Project Contributors
+# Licensed under the terms of the MIT License
+
+"""File implementing SessionsClient."""
+
+# Standard library imports
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import logging
+
+# Qt imports
+from qtpy.QtCore import QObject, QTimer, Signal
+
+# Third-party imports
+from jupyter_server.utils import url_path_join
+import requests
+
+
+# Interval between refreshes of the list of sessions (in ms)
+SESSIONS_REFRESH_INTERVAL = 30 * 1000
+
+# Delay before we give up on a request to the server (in s)
+REQUEST_TIMEOUT = 5
+
+logger = logging.getLogger(__name__)
+
+
+class SessionsClient(QObject):
+    """
+    Client for the sessions and kernels of a notebook server.
+
+    This object keeps an index mapping the paths of notebooks to the ids of
+    their kernels, so that the kernel id of a notebook can be looked up
+    without sending a request to the server. The index is updated when a
+    notebook reports its kernel id and refreshed periodically in the
+    background. All requests to the server are sent from a worker thread, so
+    they do not block the GUI.
+
+    If the server culls idle kernels, then the list of culled kernels is
+    refreshed as well, so that notebooks can tell the user why they lost
+    their kernel.
+    """
+
+    sig_sessions_refreshed = Signal(object)
+    """
+    This signal is emitted when a new list of sessions is received.
+
+    Parameters
+    ----------
+    sessions : list of dict
+        List of sessions, as returned by the /api/sessions endpoint.
+    """
+
+    sig_kernel_id_fetched = Signal(int, object)
+    """
+    This signal is emitted when a request by `request_kernel_id()` is done.
+
+    Parameters
+    ----------
+    request_id : int
+        Number identifying the call to `request_kernel_id()`.
+    sessions : list of dict or None
+        List of sessions, or None if the request failed.
+    """
+
+    sig_kernels_culled = Signal(list)
+    """
+    This signal is emitted when the server reports newly culled kernels.
+
+    Parameters
+    ----------
+    kernel_ids : list of str
+        Ids of the kernels which were culled since the last refresh.
+    """
+
+    def __init__(self, server_info, http_session=None, watch_culled=False,
+                 parent=None):
+        """
+        Construct a SessionsClient.
+
+        Parameters
+        ----------
+        server_info : dict
+            Server info of the server, with keys like 'url' and 'token'.
+        http_session : requests.Session or None, optional
+            HTTP session for sending requests to the server. The default is
+            None, meaning that a new session is created.
+        watch_culled : bool, optional
+            Whether to refresh the list of kernels culled by the server. The
+            default is False.
+        parent : QObject or None, optional
+            Parent of this object. The default is None.
+        """
+        super().__init__(parent)
+        self.server_url = server_info['url']
+        self.token = server_info['token']
+        self.http_session = http_session or requests.Session()
+        self._kernel_ids = {}
+        self._deleted_kernel_ids = set()
+        self._culled_kernel_ids = set()
+        self.watch_culled = watch_culled
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._kernel_id_requests = {}
+        self._request_count = 0
+
+        self.sig_sessions_refreshed.connect(self._handle_sessions_refreshed)
+        self.sig_kernel_id_fetched.connect(self._handle_kernel_id_fetched)
+        self.sig_kernels_culled.connect(self._handle_kernels_culled)
+        self._refresh_timer = QTimer(self)
+        self._refresh_timer.setInterval(SESSIONS_REFRESH_INTERVAL)
+        self._refresh_timer.timeout.connect(self.refresh)
+        self._refresh_timer.start()
+
+    def get_kernel_id(self, path):
+        """
+        Return kernel id of notebook with given path from the index.
+
+        Parameters
+        ----------
+        path : str
+            Path of the notebook relative to the server root, using forward
+            slashes.
+
+        Returns
+        -------
+        str or None
+            The kernel id, or None if the notebook is not in the index.
+        """
+        return self._kernel_ids.get(path)
+
+    def set_kernel_id(self, path, kernel_id):
+        """
+        Record kernel id of notebook with given path in the index.
+
+        Parameters
+        ----------
+        path : str
+            Path of the notebook relative to the server root, using forward
+            slashes.
+        kernel_id : str or None
+            The kernel id, or None if the notebook has no kernel.
+        """
+        if kernel_id:
+            self._kernel_ids[path] = kernel_id
+        else:
+            self._kernel_ids.pop(path, None)
+
+    def request_kernel_id(self, path, function):
+        """
+        Call function with kernel id of notebook with given path.
+
+        If the notebook is in the index, then the function is called
+        immediately. Otherwise, the list of sessions is requested in the
+        background and the function is called when the server replies.
+
+        Parameters
+        ----------
+        path : str
+            Path of the notebook relative to the server root, using forward
+            slashes.
+        function : callable
+            Function to be called with one argument, the kernel id or None if
+            the notebook has no kernel or the request failed.
+        """
+        kernel_id = self.get_kernel_id(path)
+        if kernel_id:
+            function(kernel_id)
+            return
+
+        self._request_count += 1
+        request_id = self._request_count
+        self._kernel_id_requests[request_id] = (path, function)
+        future = self._executor.submit(self._fetch_sessions)
+        future.add_done_callback(
+            partial(self._emit_kernel_id_fetched, request_id))
+
+    def refresh(self):
+        """Refresh the index in the background."""
+        future = self._executor.submit(self._fetch_sessions)
+        future.add_done_callback(self._emit_sessions_refreshed)
+        if self.watch_culled:
+            future = self._executor.submit(self._fetch_culled_kernels)
+            future.add_done_callback(self._emit_kernels_culled)
+
+    def shutdown_kernel(self, kernel_id):
+        """
+        Shutdown kernel with given id in the background.
+
+        The kernel is removed from the index immediately. If the server fails
+        to shut down the kernel, a warning is logged.
+
+        Parameters
+        ----------
+        kernel_id : str
+            The id of the kernel.
+        """
+        self._kernel_ids = {path: value
+                            for path, value in self._kernel_ids.items()
+                            if value != kernel_id}
+        self._deleted_kernel_ids.add(kernel_id)
+        self._executor.submit(self._delete_kernel, kernel_id)
+
+    def close(self):
+        """Stop refreshing the index and abandon pending requests."""
+        self._refresh_timer.stop()
+        self._executor.shutdown(wait=False)
+
+    def _get_url(self, *parts):
+        """Return URL for the REST API of the server."""
+        return url_path_join(self.server_url, 'api', *parts)
+
+    def _get_headers(self):
+        """Return headers for authenticating with the server."""
+        return {'Authorization': f'token {self.token}'}
+
+    def _fetch_sessions(self):
+        """
+        Get list of sessions from the server.
+
+        This function is run in a worker thread.
+
+        Returns
+        -------
+        list of dict or None
+            List of sessions, or None if the request failed.
+        """
+        try:
+            response = self.http_session.get(
+                self._get_url('sessions'), headers=self._get_headers(),
+                timeout=REQUEST_TIMEOUT)
+        except requests.exceptions.RequestException as err:
+            logger.warning(f'Error when getting sessions: {err}')
+            return None
+        if response.status_code != requests.codes.ok:
+            logger.warning('Error when getting sessions: '
+                           f'status code = {response.status_code}')
+            return None
+        return response.json()
+
+    def _fetch_culled_kernels(self):
+        """
+        Get list of ids of culled kernels from the server.
+
+        This function is run in a worker thread.
+
+        Returns
+        -------
+        list of str or None
+            List of kernel ids, or None if the request failed.
+        """
+        url = url_path_join(
+            self.server_url, 'spyder-notebooks-api', 'culled-kernels')
+        try:
+            response = self.http_session.get(
+                url, headers=self._get_headers(), timeout=REQUEST_TIMEOUT)
+        except requests.exceptions.RequestException as err:
+            logger.warning(f'Error when getting culled kernels: {err}')
+            return None
+        if response.status_code != requests.codes.ok:
+            logger.warning('Error when getting culled kernels: '
+                           f'status code = {response.status_code}')
+            return None
+        return response.json()
+
+    def _delete_kernel(self, kernel_id):
+        """
+        Ask the server to shut down a kernel.
+
+        This function is run in a worker thread.
+        """
+        try:
+            response = self.http_session.delete(
+                self._get_url('kernels', kernel_id),
+                headers=self._get_headers(), timeout=REQUEST_TIMEOUT)
+        except requests.exceptions.RequestException as err:
+            logger.warning(f'Error when shutting down kernel: {err}')
+            return
+        if response.status_code != requests.codes.no_content:
+            logger.warning(f'Error when shutting down kernel {kernel_id}: '
+                           f'status code = {response.status_code}')
+
+    def _emit_sessions_refreshed(self, future):
+        """
+        Emit signal with the list of sessions, if the request succeeded.
+
+        This function is run in the worker thread. The signal is delivered
+        in the thread of this object.
+        """
+        if future.cancelled() or future.exception() is not None:
+            return
+        sessions = future.result()
+        if sessions is not None:
+            self.sig_sessions_refreshed.emit(sessions)
+
+    def _emit_kernel_id_fetched(self, request_id, future):
+        """
+        Emit signal with the list of sessions requested by
+        `request_kernel_id()`.
+
+        This function is run in the worker thread. The signal is delivered
+        in the thread of this object.
+        """
+        if future.cancelled() or future.exception() is not None:
+            sessions = None
+        else:
+            sessions = future.result()
+        self.sig_kernel_id_fetched.emit(request_id, sessions)
+
+    def _emit_kernels_culled(self, future):
+        """
+        Emit signal with the kernels culled since the last refresh, if any.
+
+        This function is run in the worker thread. The signal is delivered
+        in the thread of this object.
+        """
+        if future.cancelled() or future.exception() is not None:
+            return
+        kernel_ids = future.result()
+        if kernel_ids is None:
+            return
+        new_kernel_ids = [kernel_id for kernel_id in kernel_ids
+                          if kernel_id not in self._culled_kernel_ids]
+        self._culled_kernel_ids.update(new_kernel_ids)
+        if new_kernel_ids:
+            self.sig_kernels_culled.emit(new_kernel_ids)
+
+    def _handle_kernels_culled(self, kernel_ids):
+        """Remove culled kernels from the index."""
+        self._kernel_ids = {path: value
+                            for path, value in self._kernel_ids.items()
+                            if value not in kernel_ids}
+
+    def _handle_kernel_id_fetched(self, request_id, sessions):
+        """
+        Update the index and call the function passed to
+        `request_kernel_id()`.
+        """
+        path, function = self._kernel_id_requests.pop(request_id)
+        if sessions is not None:
+            self._handle_sessions_refreshed(sessions)
+        function(self.get_kernel_id(path))
+
+    def _handle_sessions_refreshed(self, sessions):
+        """
+        Replace the index by the given list of sessions.
+
+        Kernels that we asked to shut down are left out, because the list of
+        sessions may have been requested before they were shut down.
+        """
+        kernel_ids = {}
+        for session in sessions:
+            path = session.get('notebook', {}).get('path')
+            kernel_id = session.get('kernel', {}).get('id')
+            if (path is not None and kernel_id is not None
+                    and kernel_id not in self._deleted_kernel_ids):
+                kernel_ids[path] = kernel_id
+        self._kernel_ids = kernel_ids
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © Spyder Project Contributors
+# Licensed under the terms of the MIT License
+#
+
+"""Tests for outputbuffer.py"""
+
+# Local imports
+from spyder_notebook.utils.outputbuffer import OutputBuffer
+
+
+def test_append_within_limit():
+    """Test that output is stored if it fits in the buffer."""
+    buffer = OutputBuffer(max_size=10)
+
+    buffer.append('ham')
+    buffer.append('')
+    buffer.append('spam')
+
+    assert buffer.getvalue() == 'hamspam'
+    assert len(buffer) == 7
+    assert not buffer.truncated
+
+
+def test_append_discards_old_chunks():
+    """Test that the oldest chunks are discarded if the buffer is full."""
+    buffer = OutputBuffer(max_size=10)
+
+    for chunk in ['ham', 'spam', 'eggs', 'bacon']:
+        buffer.append(chunk)
+
+    assert buffer.getvalue() == 'eggsbacon'
+    assert buffer.truncated
+
+
+def test_append_truncates_large_chunk():
+    """Test that a chunk larger than the buffer is truncated."""
+    buffer = OutputBuffer(max_size=5)
+
+    buffer.append('ham and spam')
+
+    assert buffer.getvalue() == ' spam'
+    assert len(buffer) == 5
+    assert buffer.truncated
+
+
+def test_append_writes_to_log(tmpdir):
+    """Test that all output is written to the log file."""
+    log_filename = str(tmpdir.join('logs', 'server.log'))
+    buffer = OutputBuffer(max_size=5, log_filename=log_filename)
+
+    buffer.append('ham and ')
+    buffer.append('spam')
+    buffer.close()
+
+    with open(log_filename, encoding='utf-8') as f:
+        assert f.read() == 'ham and spam'
+    assert buffer.getvalue() == 'spam'
@@ -19,7 +19,8 @@ from qtpy.QtCore import QByteArray, QProcess, QTimer
 
 # Local imports
 from spyder_notebook.utils.servermanager import (
-    ServerManager, ServerProcess, ServerState)
+    ServerManager, ServerProcess, ServerState, create_http_session,
+    is_subdir)
 
 
 @pytest.mark.parametrize('start_arg', [True, False])
@@ -108,6 +109,261 @@ def test_start_server(mocker, dark, under_home):
     mock_check.assert_called_once()
 
 
+@pytest.mark.parametrize('kernel_pool_size', [0, 2])
+def test_start_server_with_kernel_pool(mocker, kernel_pool_size):
+    """Test that .start_server() passes the kernel pool size to the server
+    if it is positive."""
+    serverManager = ServerManager(kernel_pool_size=kernel_pool_size)
+    mocker.patch.object(serverManager, '_check_server_started')
+    mock_QProcess = mocker.patch(
+        'spyder_notebook.utils.servermanager.QProcess', spec=QProcess)
+
+    serverManager.start_server('ham.ipynb', '/ham/interpreter')
+
+    args = mock_QProcess.return_value.start.call_args[0]
+    assert ('--kernel-pool-size=2' in args[1]) == (kernel_pool_size == 2)
+
+
+@pytest.mark.parametrize('kernel_cull_timeout', [0, 30])
+def test_start_server_with_kernel_cull_timeout(mocker, kernel_cull_timeout):
+    """Test that .start_server() passes the kernel cull timeout in seconds
+    to the server if it is positive and records it in the server process."""
+    serverManager = ServerManager(kernel_cull_timeout=kernel_cull_timeout)
+    mocker.patch.object(serverManager, '_check_server_started')
+    mock_QProcess = mocker.patch(
+        'spyder_notebook.utils.servermanager.QProcess', spec=QProcess)
+
+    serverManager.start_server('ham.ipynb', '/ham/interpreter')
+
+    args = mock_QProcess.return_value.start.call_args[0]
+    assert (('--kernel-cull-timeout=1800' in args[1])
+            == (kernel_cull_timeout == 30))
+    assert serverManager.servers[0].kernel_cull_timeout == kernel_cull_timeout
+
+
+@pytest.mark.parametrize('log_output', [False, True])
+def test_start_server_with_log_output(mocker, log_output):
+    """Test that .start_server() only uses Spyder's temporary directory for
+    a log file if server output is logged."""
+    serverManager = ServerManager(log_output=log_output)
+    mocker.patch.object(serverManager, '_check_server_started')
+    mocker.patch('spyder_notebook.utils.servermanager.QProcess',
+                 spec=QProcess)
+    mock_temp_dir = mocker.patch(
+        'spyder_notebook.utils.servermanager.get_temp_dir',
+        return_value=osp.abspath('tmp'))
+    mock_buffer = mocker.patch(
+        'spyder_notebook.utils.servermanager.OutputBuffer')
+
+    serverManager.start_server('ham.ipynb', '/ham/interpreter')
+
+    log_filename = mock_buffer.call_args[0][1]
+    if log_output:
+        assert log_filename.startswith(
+            osp.join(osp.abspath('tmp'), 'notebook-servers'))
+    else:
+        assert log_filename is None
+        mock_temp_dir.assert_not_called()
+
+
+def test_create_http_session():
+    """Test that create_http_session() returns a session which authenticates
+    with the server and retries failed requests."""
+    server_info = {'url': 'http://localhost:8888/', 'token': 'xyz'}
+
+    session = create_http_session(server_info)
+
+    assert session.headers['Authorization'] == 'token xyz'
+    adapter = session.get_adapter('http://localhost:8888/api/sessions')
+    assert adapter.max_retries.total > 0
+    session.close()
+
+
+def test_fill_pool(mocker):
+    """Test that .fill_pool() starts restricted servers at the root of the
+    file system until there are enough idle servers for the interpreter."""
+    serverManager = ServerManager(pool_size=2)
+    mock_start = mocker.patch.object(serverManager, '_start_server_process')
+    idle_server = ServerProcess(
+        mocker.Mock(spec=QProcess), osp.abspath('/'), 'ham', 'info.json',
+        state=ServerState.RUNNING, roots=[])
+    other_server = ServerProcess(
+        mocker.Mock(spec=QProcess), osp.abspath('/'), 'spam', 'info.json',
+        state=ServerState.RUNNING, roots=[])
+    serverManager.servers = [idle_server, other_server]
+
+    serverManager.fill_pool('ham')
+
+    mock_start.assert_called_once_with(ANY, 'ham', roots=[])
+
+
+@pytest.mark.parametrize('state', [ServerState.RUNNING, ServerState.STARTING])
+def test_get_server_assigns_server_from_pool(mocker, qtbot, state):
+    """Test that .get_server() assigns an idle server in the pool to the
+    notebook directory instead of starting a new server, that it refills the
+    pool, and that a running server adds the directory in the background and
+    then renders the notebook."""
+    serverManager = ServerManager()
+    mock_start = mocker.patch.object(serverManager, 'start_server')
+    mock_fill = mocker.patch.object(serverManager, 'fill_pool')
+    mock_add_root = mocker.patch.object(
+        serverManager, '_add_root_to_server', return_value=True)
+    mocker.patch(
+        'spyder_notebook.utils.servermanager.get_home_dir',
+        return_value=osp.abspath('home'))
+    filename = osp.abspath(osp.join('home', 'ham.ipynb'))
+    server_info = mocker.Mock(spec=dict)
+    server = ServerProcess(
+        mocker.Mock(spec=QProcess), osp.abspath('/'), 'ham', 'info.json',
+        state=state, server_info=server_info, roots=[])
+    serverManager.servers.append(server)
+
+    if state == ServerState.RUNNING:
+        with qtbot.waitSignal(serverManager.sig_root_added) as blocker:
+            res = serverManager.get_server(filename, interpreter='ham')
+        assert blocker.args == [server]
+        mock_add_root.assert_called_once_with(server, osp.abspath('home'))
+        assert not server.pending_roots
+        assert serverManager.get_server(filename, 'ham') == server_info
+    else:
+        res = serverManager.get_server(filename, interpreter='ham')
+        mock_add_root.assert_not_called()
+
+    assert res is None
+    mock_start.assert_not_called()
+    mock_fill.assert_called_once_with('ham')
+    assert server.roots == [osp.abspath('home')]
+
+
+def test_can_render_checks_path_components(mocker):
+    """Test that a server only renders notebooks inside its roots, and not
+    in sibling directories whose name starts with the same string."""
+    server = ServerProcess(
+        mocker.Mock(spec=QProcess), osp.abspath('/'), 'ham', 'info.json',
+        roots=[osp.abspath('data')], pending_roots={osp.abspath('data')})
+
+    assert server.can_render(osp.abspath(osp.join('data', 'ham.ipynb')))
+    assert not server.can_render(osp.abspath(osp.join('data2', 'ham.ipynb')))
+    assert server.is_adding_root(osp.abspath(osp.join('data', 'ham.ipynb')))
+    assert not server.is_adding_root(
+        osp.abspath(osp.join('data2', 'ham.ipynb')))
+    assert is_subdir(osp.abspath('data'), osp.abspath('data'))
+
+
+def test_get_server_while_adding_root(mocker):
+    """Test that .get_server() waits while the server is adding the root of
+    the notebook, instead of adding it again or starting a new server."""
+    serverManager = ServerManager()
+    mock_start = mocker.patch.object(serverManager, 'start_server')
+    filename = osp.abspath(osp.join('data', 'ham.ipynb'))
+    server = ServerProcess(
+        mocker.Mock(spec=QProcess), osp.abspath('/'), 'ham', 'info.json',
+        state=ServerState.RUNNING, server_info={},
+        roots=[osp.abspath('data')], pending_roots={osp.abspath('data')})
+    serverManager.servers.append(server)
+
+    res = serverManager.get_server(filename, interpreter='ham')
+
+    assert res is None
+    assert server.roots == [osp.abspath('data')]
+    mock_start.assert_not_called()
+
+
+def test_get_server_when_adding_root_fails(mocker, qtbot):
+    """Test that a server rooted at the notebook directory is started if the
+    idle server in the pool refuses the directory, and that the idle server
+    stays running."""
+    serverManager = ServerManager()
+    mock_start = mocker.patch.object(serverManager, '_start_server_process')
+    mocker.patch.object(
+        serverManager, '_add_root_to_server', return_value=False)
+    mocker.patch(
+        'spyder_notebook.utils.servermanager.get_home_dir',
+        return_value=osp.abspath('home'))
+    filename = osp.abspath(osp.join('data', 'ham.ipynb'))
+    server = ServerProcess(
+        mocker.Mock(spec=QProcess), osp.abspath('/'), 'ham', 'info.json',
+        state=ServerState.RUNNING, server_info={}, roots=[])
+    serverManager.servers.append(server)
+
+    with qtbot.waitSignal(serverManager.sig_add_root_finished):
+        res = serverManager.get_server(filename, interpreter='ham')
+
+    assert res is None
+    assert server.roots == []
+    assert not server.pending_roots
+    assert server.state == ServerState.RUNNING
+    mock_start.assert_called_once_with(osp.dirname(filename), 'ham')
+
+
+def test_get_server_adds_root_in_multi_root_mode(mocker, qtbot):
+    """Test that .get_server() in multi-root mode adds the notebook directory
+    to an existing server with the same interpreter instead of starting a new
+    server or taking a server from the pool."""
+    serverManager = ServerManager(multi_root=True)
+    mock_start = mocker.patch.object(serverManager, 'start_server')
+    mock_assign = mocker.patch.object(
+        serverManager, '_assign_server_from_pool')
+    mock_add_root = mocker.patch.object(
+        serverManager, '_add_root_to_server', return_value=True)
+    mocker.patch(
+        'spyder_notebook.utils.servermanager.get_home_dir',
+        return_value=osp.abspath('home'))
+    filename = osp.abspath(osp.join('data', 'ham.ipynb'))
+    server_info = mocker.Mock(spec=dict)
+    other_server = ServerProcess(
+        mocker.Mock(spec=QProcess), osp.abspath('/'), 'spam', 'info.json',
+        state=ServerState.RUNNING, roots=[osp.abspath('home')])
+    server = ServerProcess(
+        mocker.Mock(spec=QProcess), osp.abspath('/'), 'ham', 'info.json',
+        state=ServerState.RUNNING, server_info=server_info,
+        roots=[osp.abspath('home')])
+    serverManager.servers = [other_server, server]
+
+    with qtbot.waitSignal(serverManager.sig_root_added):
+        res = serverManager.get_server(filename, interpreter='ham')
+
+    assert res is None
+    assert serverManager.get_server(filename, 'ham') == server_info
+    assert server.roots == [osp.abspath('home'), osp.abspath('data')]
+    assert other_server.roots == [osp.abspath('home')]
+    mock_add_root.assert_called_once_with(server, osp.abspath('data'))
+    mock_start.assert_not_called()
+    mock_assign.assert_not_called()
+
+
+def test_start_server_in_multi_root_mode(mocker):
+    """Test that .start_server() in multi-root mode starts a restricted server
+    at the root of the drive with the notebook directory as root."""
+    serverManager = ServerManager(multi_root=True)
+    mock_start = mocker.patch.object(serverManager, '_start_server_process')
+    mocker.patch(
+        'spyder_notebook.utils.servermanager.get_home_dir',
+        return_value=osp.abspath('home'))
+    filename = osp.abspath(osp.join('data', 'ham.ipynb'))
+
+    serverManager.start_server(filename, 'ham')
+
+    drive_root = osp.splitdrive(filename)[0] + osp.sep
+    mock_start.assert_called_once_with(
+        drive_root, 'ham', roots=[osp.abspath('data')])
+
+
+def test_fill_pool_in_multi_root_mode(mocker):
+    """Test that .fill_pool() in multi-root mode does not start any servers
+    if there is already a server in use for the interpreter."""
+    serverManager = ServerManager(pool_size=1, multi_root=True)
+    mock_start = mocker.patch.object(serverManager, '_start_server_process')
+    server = ServerProcess(
+        mocker.Mock(spec=QProcess), osp.abspath('/'), 'ham', 'info.json',
+        state=ServerState.RUNNING, roots=[osp.abspath('home')])
+    serverManager.servers = [server]
+
+    serverManager.fill_pool('ham')
+
+    mock_start.assert_not_called()
+
+
 def test_check_server_started_if_started(mocker, qtbot):
     """Test that .check_server_started() emits sig_server_started if there
     is a json file with the correct name and completes the server info."""
@@ -129,6 +385,30 @@ def test_check_server_started_if_started(mocker, qtbot):
     assert server_process.server_info == {'foo': 42}
 
 
+def test_check_server_started_adds_roots(mocker, qtbot):
+    """Test that .check_server_started() asks the server to add the roots
+    assigned while it was starting, and that it starts a server rooted at a
+    directory which the server refuses, without changing its state."""
+    mocker.patch('spyder_notebook.utils.servermanager.open',
+                 mocker.mock_open(read_data='{"foo": 42}'))
+    server_process = ServerProcess(
+        mocker.Mock(spec=QProcess), 'notebookdir', 'interpreter',
+        'info.json', roots=['ham'])
+    serverManager = ServerManager()
+    mock_add_root = mocker.patch.object(
+        serverManager, '_add_root_to_server', return_value=False)
+    mock_start = mocker.patch.object(serverManager, '_start_server_process')
+
+    with qtbot.waitSignals([serverManager.sig_server_started,
+                            serverManager.sig_add_root_finished]):
+        serverManager._check_server_started(server_process)
+
+    mock_add_root.assert_called_once_with(server_process, 'ham')
+    mock_start.assert_called_once_with('ham', 'interpreter')
+    assert server_process.state == ServerState.RUNNING
+    assert server_process.roots == []
+
+
 def test_check_server_started_if_not_started(mocker, qtbot):
     """Test that .check_server_started() repeats itself on a timer if there
     is no json file with the correct name."""
@@ -192,29 +472,205 @@ def test_check_server_started_if_errored(mocker, qtbot):
     assert server_process.state == ServerState.ERROR
 
 
+def test_check_starting_servers(mocker, qtbot):
+    """Test that .check_starting_servers(), which is called when the runtime
+    dir changes, detects servers that have started without waiting for the
+    next poll, and that it ignores servers that are not starting up."""
+    mocker.patch('spyder_notebook.utils.servermanager.open',
+                 mocker.mock_open(read_data='{"foo": 42}'))
+    mocker.patch('spyder_notebook.utils.servermanager.jupyter_runtime_dir',
+                 return_value='runtimedir')
+    mock_QTimer = mocker.patch('spyder_notebook.utils.servermanager.QTimer',
+                               spec=QTimer)
+    server1 = ServerProcess(
+        mocker.Mock(spec=QProcess), 'notebookdir', 'interpreter', 'info.json')
+    server2 = ServerProcess(
+        mocker.Mock(spec=QProcess), 'notebookdir', 'interpreter', 'info.json',
+        state=ServerState.ERROR)
+    serverManager = ServerManager()
+    serverManager.servers = [server1, server2]
+
+    with qtbot.waitSignal(serverManager.sig_server_started) as blocker:
+        serverManager._check_starting_servers('runtimedir')
+
+    assert blocker.args == [server1]
+    assert server1.state == ServerState.RUNNING
+    assert server1.server_info == {'foo': 42}
+    assert server2.state == ServerState.ERROR
+    mock_QTimer.singleShot.assert_not_called()
+
+
+def test_read_server_info_if_partially_written(mocker, qtbot, tmpdir):
+    """Test that .read_server_info() watches the info file if it cannot be
+    parsed, so that we are notified when the server finishes writing it."""
+    mocker.patch('spyder_notebook.utils.servermanager.jupyter_runtime_dir',
+                 return_value=str(tmpdir))
+    info_file = tmpdir.join('info.json')
+    info_file.write('{"foo"')
+    server = ServerProcess(
+        mocker.Mock(spec=QProcess), 'notebookdir', 'interpreter', 'info.json')
+    serverManager = ServerManager()
+    serverManager.servers = [server]
+    serverManager._watch_runtime_dir()
+
+    assert not serverManager._read_server_info(server)
+    assert server.state == ServerState.STARTING
+    watcher = serverManager._runtime_dir_watcher
+    assert str(info_file) in watcher.files()
+
+    info_file.write('{"foo": 42}')
+    assert serverManager._read_server_info(server)
+    assert server.state == ServerState.RUNNING
+    assert watcher.files() == []
+    assert watcher.directories() == []
+
+
+def test_register_and_unregister_client(mocker):
+    """Test that .register_client() and .unregister_client() keep track of
+    the clients using a server and when the server became idle."""
+    server_info = mocker.Mock(spec=dict)
+    server = ServerProcess(
+        mocker.Mock(spec=QProcess), '', '', '', state=ServerState.RUNNING,
+        server_info=server_info)
+    serverManager = ServerManager(idle_timeout=10)
+    mock_start_timer = mocker.patch.object(serverManager, '_start_reap_timer')
+    mock_SessionsClient = mocker.patch(
+        'spyder_notebook.utils.servermanager.SessionsClient')
+    serverManager.servers = [server]
+    client1 = mocker.Mock()
+    client2 = mocker.Mock()
+
+    res1 = serverManager.register_client(client1, server_info)
+    res2 = serverManager.register_client(client2, server_info)
+    assert server.clients == {client1, client2}
+    mock_SessionsClient.assert_called_once_with(
+        server_info, http_session=server.http_session, watch_culled=False,
+        parent=serverManager)
+    assert res1 == res2 == mock_SessionsClient.return_value
+    mock_SessionsClient.return_value.refresh.assert_called_once()
+
+    serverManager.unregister_client(client1)
+    assert server.clients == {client2}
+    assert server.idle_since is None
+    mock_start_timer.assert_not_called()
+
+    serverManager.unregister_client(client2)
+    assert server.clients == set()
+    assert server.idle_since is not None
+    mock_start_timer.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    ('minutes_idle', 'roots', 'clients', 'shutdown'),
+    [(20,             None,    False,     True),
+     (5,              None,    False,     False),
+     (20,             [],      False,     False),
+     (20,             None,    True,      False)])
+def test_reap_idle_servers(mocker, minutes_idle, roots, clients, shutdown):
+    """Test that .reap_idle_servers() shuts down servers without clients
+    that have been idle for too long, but not servers in the pool."""
+    idle_since = (datetime.datetime.now()
+                  - datetime.timedelta(minutes=minutes_idle))
+    server = ServerProcess(
+        mocker.Mock(spec=QProcess), '', '', '', state=ServerState.RUNNING,
+        roots=roots, clients={mocker.Mock()} if clients else None,
+        idle_since=idle_since)
+    serverManager = ServerManager(idle_timeout=10)
+    mock_shutdown = mocker.patch.object(serverManager, 'shutdown_server')
+    mocker.patch.object(serverManager, '_start_reap_timer')
+    serverManager.servers = [server]
+
+    serverManager.reap_idle_servers()
+
+    if shutdown:
+        mock_shutdown.assert_called_once_with(server)
+    else:
+        mock_shutdown.assert_not_called()
+
+
+def test_shutdown_server(mocker, qtbot):
+    """Test that .shutdown_server() disconnects the process, asks a running
+    server to shut down, schedules killing it and removes it from the list of
+    servers, and that info files of servers started afterwards have unique
+    names."""
+    mock_post = mocker.patch(
+        'spyder_notebook.utils.servermanager.requests.post')
+    mock_QTimer = mocker.patch('spyder_notebook.utils.servermanager.QTimer',
+                               spec=QTimer)
+    mocker.patch('spyder_notebook.utils.servermanager.QProcess',
+                 spec=QProcess)
+    mocker.patch.object(ServerManager, '_check_server_started')
+    mocker.patch.object(ServerManager, '_watch_runtime_dir')
+    serverManager = ServerManager()
+    serverManager.start_server(osp.abspath('ham.ipynb'), 'ham')
+    serverManager.start_server(osp.abspath('ham.ipynb'), 'ham')
+    server1, server2 = serverManager.servers
+    server1.state = ServerState.RUNNING
+    server1.server_info = {'url': 'http://localhost:8888/', 'token': 'xyz'}
+
+    with qtbot.waitSignal(serverManager.sig_servers_changed):
+        serverManager.shutdown_server(server1)
+
+    server1.process.errorOccurred.disconnect.assert_called_once_with()
+    server1.process.finished.disconnect.assert_called_once_with()
+    mock_post.assert_called_once_with(
+        'http://localhost:8888/api/shutdown',
+        headers={'Authorization': 'token xyz'}, timeout=ANY)
+    mock_QTimer.singleShot.assert_called_once()
+    assert server1.state == ServerState.FINISHED
+    assert serverManager.servers == [server2]
+
+    serverManager.start_server(osp.abspath('ham.ipynb'), 'ham')
+    info_files = [server.info_file for server in serverManager.servers]
+    assert info_files[0] != info_files[1]
+
+
 def test_shutdown_all_servers(mocker):
-    """Test that .shutdown_all_servers() does shutdown all running servers,
-    but not servers in another state."""
-    mock_shutdown = mocker.patch(
-        'spyder_notebook.utils.servermanager.serverapp.shutdown_server')
+    """Test that .shutdown_all_servers() asks all running servers to shut
+    down, but not servers in another state, and that it kills servers which
+    are starting up or did not exit in time, and that it closes the HTTP
+    sessions of the servers."""
+    mock_request = mocker.patch.object(ServerManager, '_request_shutdown')
     server1 = ServerProcess(
         mocker.Mock(spec=QProcess), '', '', '', state=ServerState.RUNNING,
-        server_info=mocker.Mock(dict))
+        server_info=mocker.Mock(dict), http_session=mocker.Mock())
+    server1.process.state.return_value = QProcess.Running
+    server1.process.waitForFinished.return_value = True
     server2 = ServerProcess(
         mocker.Mock(spec=QProcess), '', '', '', state=ServerState.ERROR,
         server_info=mocker.Mock(dict))
+    server2.process.state.return_value = QProcess.NotRunning
+    server3 = ServerProcess(
+        mocker.Mock(spec=QProcess), '', '', '', state=ServerState.RUNNING,
+        server_info=mocker.Mock(dict))
+    server3.process.state.return_value = QProcess.Running
+    server3.process.waitForFinished.return_value = False
+    server3.http_session = mocker.Mock()
+    server4 = ServerProcess(
+        mocker.Mock(spec=QProcess), '', '', '', state=ServerState.STARTING)
+    server4.process.state.return_value = QProcess.NotRunning
     serverManager = ServerManager()
-    serverManager.servers = [server1, server2]
+    serverManager.servers = [server1, server2, server3, server4]
 
     serverManager.shutdown_all_servers()
 
-    mock_shutdown.assert_called_once_with(server1.server_info, log=ANY)
+    assert mock_request.call_count == 2
+    mock_request.assert_any_call(server1)
+    mock_request.assert_any_call(server3)
+    server1.process.kill.assert_not_called()
+    server2.process.kill.assert_not_called()
+    server3.process.kill.assert_called_once()
+    server4.process.kill.assert_called_once()
     assert server1.state == ServerState.FINISHED
     assert server2.state == ServerState.ERROR
+    assert server4.state == ServerState.FINISHED
+    server1.http_session.close.assert_called_once_with()
+    server3.http_session.close.assert_called_once_with()
 
 
-def test_read_standard_output(mocker):
-    """Test that .read_standard_output() stores the output."""
+def test_read_standard_output(mocker, qtbot):
+    """Test that .read_standard_output() stores the output and emits the
+    new output."""
     before = 'before\n'
     output = 'Αθήνα\n'  # check that we can handle non-ascii
     mock_read = mocker.Mock(return_value=QByteArray(output.encode()))
@@ -223,10 +679,26 @@ def test_read_standard_output(mocker):
     serverManager = ServerManager()
     serverManager.servers = [server]
 
-    serverManager.read_server_output(server)
+    with qtbot.waitSignal(serverManager.sig_server_output) as blocker:
+        serverManager.read_server_output(server)
 
     mock_read.assert_called_once()
     assert server.output == before + output
+    assert blocker.args == [server, output]
+
+
+def test_read_standard_output_when_starting(mocker):
+    """Test that .read_standard_output() checks whether the server has
+    started if it is starting up."""
+    mock_read = mocker.Mock(return_value=QByteArray(b'running at\n'))
+    mock_process = mocker.Mock(spec=QProcess, readAllStandardOutput=mock_read)
+    server = ServerProcess(mock_process, '', '', '')
+    serverManager = ServerManager()
+    mock_read_info = mocker.patch.object(serverManager, '_read_server_info')
+
+    serverManager.read_server_output(server)
+
+    mock_read_info.assert_called_once_with(server)
 
 
 def test_handle_error(mocker, qtbot):
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © Spyder Project Contributors
+# Licensed under the terms of the MIT License
+#
+
+"""Tests for sessionsclient.py"""
+
+# Third party imports
+import pytest
+import requests
+
+# Local imports
+from spyder_notebook.utils.sessionsclient import SessionsClient
+
+
+SESSIONS = [
+    {'kernel': {'id': '1'}, 'notebook': {'spam': 'eggs'}},
+    {'kernel': {'id': '2'}},
+    {'kernel': {'id': '3'}, 'notebook': {'path': 'ham.ipynb'}},
+    {'kernel': {'id': '4'}, 'notebook': {'path': 'dir/spam.ipynb'}}]
+
+
+@pytest.fixture
+def sessions_client(mocker, qtbot):
+    """Construct a SessionsClient for a fake server with a fake HTTP
+    session, which can be accessed as `sessions_client.http_session`."""
+    server_info = {'url': 'http://localhost:8888/', 'token': 'xyz'}
+    http_session = mocker.Mock(spec=requests.Session)
+    client = SessionsClient(server_info, http_session=http_session)
+    yield client
+    client.close()
+
+
+def test_set_and_get_kernel_id(sessions_client):
+    """Test that kernel ids recorded in the index can be looked up."""
+    sessions_client.set_kernel_id('ham.ipynb', '42')
+    assert sessions_client.get_kernel_id('ham.ipynb') == '42'
+    assert sessions_client.get_kernel_id('spam.ipynb') is None
+
+    sessions_client.set_kernel_id('ham.ipynb', None)
+    assert sessions_client.get_kernel_id('ham.ipynb') is None
+
+
+def test_refresh(sessions_client, mocker, qtbot):
+    """Test that .refresh() gets the list of sessions in the background and
+    replaces the index."""
+    response = mocker.Mock(status_code=requests.codes.ok)
+    response.json.return_value = SESSIONS
+    mock_get = sessions_client.http_session.get
+    mock_get.return_value = response
+    sessions_client.set_kernel_id('old.ipynb', '42')
+
+    with qtbot.waitSignal(sessions_client.sig_sessions_refreshed):
+        sessions_client.refresh()
+
+    mock_get.assert_called_once_with(
+        'http://localhost:8888/api/sessions',
+        headers={'Authorization': 'token xyz'}, timeout=mocker.ANY)
+    assert sessions_client.get_kernel_id('ham.ipynb') == '3'
+    assert sessions_client.get_kernel_id('dir/spam.ipynb') == '4'
+    assert sessions_client.get_kernel_id('old.ipynb') is None
+
+
+def test_refresh_with_error_status(sessions_client, mocker, qtbot):
+    """Test that .refresh() leaves the index alone if the request fails."""
+    response = mocker.Mock(status_code=requests.codes.forbidden)
+    sessions_client.http_session.get.return_value = response
+    sessions_client.set_kernel_id('ham.ipynb', '42')
+
+    with qtbot.assertNotEmitted(sessions_client.sig_sessions_refreshed,
+                                wait=100):
+        sessions_client.refresh()
+
+    assert sessions_client.get_kernel_id('ham.ipynb') == '42'
+
+
+def test_request_kernel_id(sessions_client, mocker, qtbot):
+    """Test that .request_kernel_id() calls the function immediately if the
+    kernel id is in the index, and otherwise after getting the list of
+    sessions in the background."""
+    response = mocker.Mock(status_code=requests.codes.ok)
+    response.json.return_value = SESSIONS
+    mock_get = sessions_client.http_session.get
+    mock_get.return_value = response
+    sessions_client.set_kernel_id('ham.ipynb', '42')
+    function = mocker.Mock()
+
+    sessions_client.request_kernel_id('ham.ipynb', function)
+    function.assert_called_once_with('42')
+    mock_get.assert_not_called()
+
+    function.reset_mock()
+    with qtbot.waitSignal(sessions_client.sig_kernel_id_fetched):
+        sessions_client.request_kernel_id('dir/spam.ipynb', function)
+    function.assert_called_once_with('4')
+    assert sessions_client.get_kernel_id('dir/spam.ipynb') == '4'
+
+
+def test_request_kernel_id_with_error_status(sessions_client, mocker,
+                                             qtbot):
+    """Test that .request_kernel_id() calls the function with None if the
+    request for the list of sessions fails."""
+    response = mocker.Mock(status_code=requests.codes.forbidden)
+    sessions_client.http_session.get.return_value = response
+    function = mocker.Mock()
+
+    with qtbot.waitSignal(sessions_client.sig_kernel_id_fetched):
+        sessions_client.request_kernel_id('ham.ipynb', function)
+
+    function.assert_called_once_with(None)
+
+
+def test_shutdown_kernel(sessions_client, mocker, qtbot):
+    """Test that .shutdown_kernel() removes the kernel from the index, sends
+    a request in the background, and that the kernel is not added back by a
+    list of sessions requested before the kernel was shut down."""
+    mock_delete = sessions_client.http_session.delete
+    mock_delete.return_value = mocker.Mock(
+        status_code=requests.codes.no_content)
+    sessions_client.set_kernel_id('ham.ipynb', '3')
+
+    sessions_client.shutdown_kernel('3')
+    assert sessions_client.get_kernel_id('ham.ipynb') is None
+
+    qtbot.waitUntil(lambda: mock_delete.called)
+    mock_delete.assert_called_once_with(
+        'http://localhost:8888/api/kernels/3',
+        headers={'Authorization': 'token xyz'}, timeout=mocker.ANY)
+
+    sessions_client._handle_sessions_refreshed(SESSIONS)
+    assert sessions_client.get_kernel_id('ham.ipynb') is None
+    assert sessions_client.get_kernel_id('dir/spam.ipynb') == '4'
+
+
+def test_refresh_culled_kernels(mocker, qtbot):
+    """Test that .refresh() also gets the list of culled kernels if asked to,
+    removes them from the index and only reports kernels once."""
+    server_info = {'url': 'http://localhost:8888/', 'token': 'xyz'}
+    http_session = mocker.Mock(spec=requests.Session)
+    sessions_client = SessionsClient(
+        server_info, http_session=http_session, watch_culled=True)
+
+    def fake_get(url, **kwargs):
+        if url.endswith('culled-kernels'):
+            return mocker.Mock(status_code=requests.codes.ok,
+                               json=mocker.Mock(return_value=['3']))
+        return mocker.Mock(status_code=requests.codes.forbidden)
+
+    http_session.get.side_effect = fake_get
+    sessions_client.set_kernel_id('ham.ipynb', '3')
+
+    with qtbot.waitSignal(sessions_client.sig_kernels_culled) as blocker:
+        sessions_client.refresh()
+
+    assert blocker.args == [['3']]
+    http_session.get.assert_any_call(
+        'http://localhost:8888/spyder-notebooks-api/culled-kernels',
+        headers={'Authorization': 'token xyz'}, timeout=mocker.ANY)
+    assert sessions_client.get_kernel_id('ham.ipynb') is None
+
+    with qtbot.assertNotEmitted(sessions_client.sig_kernels_culled,
+                                wait=100):
+        sessions_client.refresh()
+    sessions_client.close()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © Spyder Project Contributors
+# Licensed under the terms of the MIT License
+#
+
+"""Tests for tracing.py"""
+
+# Standard library imports
+import json
+
+# Local imports
+from spyder_notebook.utils.tracing import Tracer
+
+
+def test_span_records_complete_event():
+    """Test that a span is recorded as a complete event with duration."""
+    tracer = Tracer()
+
+    with tracer.span('ham', spam=42):
+        pass
+
+    [event] = tracer.to_chrome_trace()['traceEvents']
+    assert event['name'] == 'ham'
+    assert event['ph'] == 'X'
+    assert event['dur'] >= 0
+    assert event['args'] == {'spam': 42}
+
+
+def test_traced_decorator():
+    """Test that a decorated function is traced and its result returned."""
+    tracer = Tracer()
+
+    @tracer.traced('eggs')
+    def func(x):
+        return 2 * x
+
+    assert func(21) == 42
+    [event] = tracer.to_chrome_trace()['traceEvents']
+    assert event['name'] == 'eggs'
+
+
+def test_begin_and_end_record_async_events():
+    """Test that begin() and end() record async events with the same id."""
+    tracer = Tracer()
+
+    tracer.begin('open', 1, filename='ham.ipynb')
+    tracer.instant('loaded')
+    tracer.end('open', 1)
+
+    events = tracer.to_chrome_trace()['traceEvents']
+    assert [event['ph'] for event in events] == ['b', 'i', 'e']
+    assert events[0]['id'] == events[2]['id'] == 1
+    assert events[0]['ts'] <= events[1]['ts'] <= events[2]['ts']
+
+
+def test_tracer_discards_oldest_events():
+    """Test that only the most recent events are kept."""
+    tracer = Tracer(max_events=2)
+
+    for name in ['ham', 'spam', 'eggs']:
+        tracer.instant(name)
+
+    events = tracer.to_chrome_trace()['traceEvents']
+    assert [event['name'] for event in events] == ['spam', 'eggs']
+
+
+def test_disabled_tracer_records_nothing():
+    """Test that a disabled tracer does not record events."""
+    tracer = Tracer(enabled=False)
+
+    with tracer.span('ham'):
+        tracer.instant('spam')
+
+    assert tracer.to_chrome_trace()['traceEvents'] == []
+
+
+def test_export(tmp_path):
+    """Test that export() writes the trace as JSON."""
+    tracer = Tracer()
+    tracer.instant('ham')
+    filename = str(tmp_path / 'trace.json')
+
+    tracer.export(filename)
+
+    with open(filename) as f:
+        data = json.load(f)
+    assert data == tracer.to_chrome_trace()
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © Spyder Project Contributors
+# Licensed under the terms of the MIT License
+
+"""File implementing Tracer, which records timing spans."""
+
+# Standard library imports
+import collections
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+
+# Maximum number of events kept in a trace
+DEFAULT_MAX_EVENTS = 10000
+
+logger = logging.getLogger(__name__)
+
+
+class Tracer:
+    """
+    Bounded in-memory trace of timing spans and events.
+
+    The events are stored in the Trace Event Format used by Chrome, so the
+    trace can be inspected with chrome://tracing or https://ui.perfetto.dev.
+    Spans within one function are recorded as complete events, while spans
+    that start and end in different callbacks, like opening a notebook, are
+    recorded as async events with an id. When the trace is full, the oldest
+    events are discarded.
+
+    Attributes
+    ----------
+    enabled : bool
+        Whether events are recorded.
+    """
+
+    def __init__(self, max_events=DEFAULT_MAX_EVENTS, enabled=True):
+        """
+        Construct a Tracer.
+
+        Parameters
+        ----------
+        max_events : int, optional
+            Maximum number of events kept. The default is DEFAULT_MAX_EVENTS.
+        enabled : bool, optional
+            Whether to record events. The default is True.
+        """
+        self.enabled = enabled
+        self._events = collections.deque(maxlen=max_events)
+        self._start = time.perf_counter()
+
+    def _timestamp(self):
+        """Return time since construction (in µs)."""
+        return (time.perf_counter() - self._start) * 1e6
+
+    def _add_event(self, phase, name, timestamp, args, **fields):
+        """Add event with given phase (in Chrome's terminology)."""
+        event = {
+            'name': name,
+            'cat': 'spyder_notebook',
+            'ph': phase,
+            'ts': timestamp,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': args
+        }
+        event.update(fields)
+        self._events.append(event)
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        """
+        Context manager recording the time spent in its body.
+
+        Parameters
+        ----------
+        name : str
+            Name of the span.
+        **args
+            Extra information stored with the span; should be serializable
+            as JSON.
+        """
+        if not self.enabled:
+            yield
+            return
+        start = self._timestamp()
+        try:
+            yield
+        finally:
+            self._add_event(
+                'X', name, start, args, dur=self._timestamp() - start)
+
+    def traced(self, name=None):
+        """
+        Decorator recording the time spent in the decorated function.
+
+        Parameters
+        ----------
+        name : str or None, optional
+            Name of the span. The default is None, meaning that the
+            qualified name of the function is used.
+        """
+        def decorator(func):
+            span_name = name or func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def instant(self, name, **args):
+        """Record an event without duration."""
+        if self.enabled:
+            self._add_event('i', name, self._timestamp(), args, s='t')
+
+    def begin(self, name, span_id, **args):
+        """
+        Record start of a span which ends in another function.
+
+        Parameters
+        ----------
+        name : str
+            Name of the span.
+        span_id : int or str
+            Identifier distinguishing spans with the same name which may
+            overlap, for instance `id(client)`.
+        **args
+            Extra information stored with the start of the span.
+        """
+        if self.enabled:
+            self._add_event('b', name, self._timestamp(), args, id=span_id)
+
+    def end(self, name, span_id, **args):
+        """Record end of a span started with `begin()`."""
+        if self.enabled:
+            self._add_event('e', name, self._timestamp(), args, id=span_id)
+
+    def clear(self):
+        """Remove all recorded events."""
+        self._events.clear()
+
+    def to_chrome_trace(self):
+        """Return trace as a dict in Chrome's Trace Event Format."""
+        return {'traceEvents': list(self._events), 'displayTimeUnit': 'ms'}
+
+    def export(self, filename):
+        """
+        Write trace to file in Chrome's Trace Event Format.
+
+        Parameters
+        ----------
+        filename : str
+            Name of the file, which is overwritten if it exists.
+        """
+        logger.debug(f'Writing trace with {len(self._events)} events '
+                     f'to {filename}')
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(self.to_chrome_trace(), f, default=str)
+
+
+# Trace shared by all parts of the plugin
+tracer = Tracer()
@@ -6,26 +6,32 @@
 """Qt widgets for the notebook."""
 
 # Standard library imports
+import hashlib
 import json
 import logging
 import os
 import os.path as osp
+import shutil
 from string import Template
 import sys
+import time
 
 # Third-party imports
 from jupyter_server.utils import url_path_join, url_escape
 import qstylizer
-from qtpy.QtCore import QEvent, QUrl, Qt, Signal
+from qtpy.QtCore import (QEvent, QFile, QIODevice, QObject, QTimer, QUrl, Qt,
+                         Signal, Slot)
 from qtpy.QtGui import QColor, QFontMetrics, QFont
-from qtpy.QtWebEngineWidgets import (QWebEnginePage, QWebEngineSettings,
+from qtpy.QtWebChannel import QWebChannel
+from qtpy.QtWebEngineWidgets import (QWebEnginePage, QWebEngineProfile,
+                                     QWebEngineScript, QWebEngineSettings,
                                      QWebEngineView, WEBENGINE)
-from qtpy.QtWidgets import (QApplication, QMenu, QFrame, QVBoxLayout,
-                            QMessageBox)
+from qtpy.QtWidgets import (QApplication, QHBoxLayout, QLabel, QMenu,
+                            QFrame, QPushButton, QVBoxLayout, QMessageBox)
 import requests
 
 # Spyder imports
-from spyder.config.base import get_module_source_path
+from spyder.config.base import get_conf_path, get_module_source_path
 from spyder.utils import sourcecode
 from spyder.utils.image_path_manager import get_image_path
 from spyder.utils.qthelpers import add_actions
@@ -34,8 +40,10 @@ from spyder.widgets.browser import WebPage
 from spyder.widgets.findreplace import FindReplace
 
 # Local imports
+from spyder_notebook._version import __version__
 from spyder_notebook.config import CONF_SECTION
 from spyder_notebook.utils.localization import _
+from spyder_notebook.utils.tracing import tracer
 from spyder_notebook.widgets.dom import DOMWidget
 
 # -----------------------------------------------------------------------------
@@ -52,8 +60,93 @@ BLANK = open(osp.join(TEMPLATES_PATH, 'blank.html')).read()
 LOADING = open(osp.join(TEMPLATES_PATH, 'loading.html')).read()
 KERNEL_ERROR = open(osp.join(TEMPLATES_PATH, 'kernel_error.html')).read()
 
+# Delay before we give up on a request to the server (in s)
+REQUEST_TIMEOUT = 5
+
+# How long to wait for the notebook to confirm that it is saved (in ms)
+SAVE_TIMEOUT = 5000
+
+# Whether web pages can be discarded to save memory (needs Qt 5.14 or later)
+CAN_HIBERNATE = WEBENGINE and hasattr(QWebEnginePage, 'LifecycleState')
+
+# Manifest written by webpack with the name of the JavaScript bundle
+BUNDLE_MANIFEST = osp.join(
+    get_module_source_path('spyder_notebook'), 'server', 'static',
+    'bundle-manifest.json')
+
+# Directory with the persistent storage and caches of notebook pages
+WEBENGINE_DIR = get_conf_path(osp.join('notebook', 'webengine'))
+
 logger = logging.getLogger(__name__)
 
+# Profile shared by all notebook pages, created on first use
+_notebook_profile = None
+
+
+# -----------------------------------------------------------------------------
+# WebEngine profile
+# -----------------------------------------------------------------------------
+def get_bundle_version():
+    """
+    Return string identifying the JavaScript bundle shipped with the plugin.
+
+    This is a hash of the bundle manifest, which contains the content hash of
+    the bundle. If there is no manifest, the version of the plugin is used.
+    """
+    try:
+        with open(BUNDLE_MANIFEST, 'rb') as manifest:
+            return hashlib.sha256(manifest.read()).hexdigest()[:16]
+    except OSError:
+        return __version__
+
+
+def prepare_cache_dir(base_dir, version):
+    """
+    Return cache directory for given bundle version, removing stale ones.
+
+    Every bundle version gets its own subdirectory of `base_dir`. Caches
+    for other versions are not valid anymore, so they are removed.
+
+    Parameters
+    ----------
+    base_dir : str
+        Directory containing the caches for all versions.
+    version : str
+        Version of the bundle, as returned by `get_bundle_version()`.
+
+    Returns
+    -------
+    str
+        Cache directory for `version`.
+    """
+    cache_dir = osp.join(base_dir, version)
+    if osp.isdir(base_dir):
+        for name in os.listdir(base_dir):
+            if name != version:
+                logger.debug(f'Removing stale WebEngine cache {name}')
+                shutil.rmtree(osp.join(base_dir, name), ignore_errors=True)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def get_notebook_profile():
+    """
+    Return the WebEngine profile shared by all notebook pages.
+
+    The profile stores its HTTP cache, which includes the code compiled from
+    the JavaScript bundle, on disk. Thus, notebooks load faster in later
+    Spyder sessions. The cache is only thrown away when the bundle changes.
+    """
+    global _notebook_profile
+    if _notebook_profile is None:
+        profile = QWebEngineProfile('spyder-notebook', QApplication.instance())
+        profile.setPersistentStoragePath(osp.join(WEBENGINE_DIR, 'storage'))
+        profile.setCachePath(prepare_cache_dir(
+            osp.join(WEBENGINE_DIR, 'cache'), get_bundle_version()))
+        profile.setHttpCacheType(QWebEngineProfile.DiskHttpCache)
+        _notebook_profile = profile
+    return _notebook_profile
+
 
 # -----------------------------------------------------------------------------
 # Widgets
@@ -91,41 +184,95 @@ class WebViewInBrowser(QWebEngineView):
         self.close()
 
 
-class NotebookWebPage(WebPage):
+class NotebookBridge(QObject):
     """
-    Object to view and edit notebooks rendered as web pages.
+    Object shared with the notebook page through QWebChannel.
 
-    Spyder notebooks communicate with Spyder itself with the JavaScript
-    alert() function where the message starts with a special prefix.
-    This class raises a signal if such a message is received.
+    The page sends messages by calling `receive()` with a list of messages,
+    each of them a dict with keys `type` and `value`. Spyder sends commands
+    to the page by emitting `sig_command_sent`.
     """
 
-    SPYDER_COMM_PREFIX = ':SpyderComm:'
+    sig_messages_received = Signal(list)
     """
-    Prefix for alert() messages used to communicate with Spyder.
+    This signal is emitted when the page sends messages to Spyder.
+
+    Parameters
+    ----------
+    messages : list of dict
+        The messages sent by the page.
     """
 
-    sig_message_received = Signal(str)
+    sig_command_sent = Signal('QVariantMap')
     """
-    This signal is emitted when a Spyder comms message is received.
+    This signal is emitted to send a command to the page.
+
+    Parameters
+    ----------
+    command : dict
+        The command, with key `type` giving the type of command.
     """
 
-    def javaScriptAlert(self, securityOrigin, msg: str) -> None:
-        """
-        Called whenever the JavaScript function alert() is called.
+    @Slot('QVariantList')
+    def receive(self, messages):
+        """Receive batch of messages from the page."""
+        self.sig_messages_received.emit(list(messages))
+
 
-        If the message starts with `SPYDER_COMM_PREFIX`, then this is a
-        message to communicate to Spyder so emit `sig_message_received`.
-        Otherwise, this is a standard JavaScript alert() to communicate to
-        the user, so let the base class handle it.
+class NotebookWebPage(WebPage):
+    """
+    Object to view and edit notebooks rendered as web pages.
 
-        Overloads the function in QWebEnginePage.
+    All pages use the profile returned by `get_notebook_profile()`.
+    Spyder notebooks communicate with Spyder through a NotebookBridge shared
+    with QWebChannel under the name `spyder`. Before a page is loaded, a
+    script is injected which stores a promise resolving to the bridge in
+    `window.spyderBridge`.
+    """
+
+    BRIDGE_SCRIPT = """
+        window.spyderBridge = new Promise(function (resolve) {
+            new QWebChannel(qt.webChannelTransport, function (channel) {
+                resolve(channel.objects.spyder);
+            });
+        });
+    """
+    """
+    JavaScript code for setting up the bridge in the page.
+    """
+
+    def __init__(self, parent):
         """
-        if msg.startswith(self.SPYDER_COMM_PREFIX):
-            msg = msg.removeprefix(self.SPYDER_COMM_PREFIX)
-            self.sig_message_received.emit(msg)
-        else:
-            super().javaScriptAlert(securityOrigin, msg)
+        Constructor.
+
+        Parameters
+        ----------
+        parent : QObject
+            Parent of the page.
+        """
+        super().__init__(get_notebook_profile(), parent)
+        self.bridge = NotebookBridge(self)
+        channel = QWebChannel(self)
+        channel.registerObject('spyder', self.bridge)
+        self.setWebChannel(channel)
+        self._inject_bridge_script()
+
+    def _inject_bridge_script(self):
+        """Inject QWebChannel library and BRIDGE_SCRIPT in every page."""
+        qwebchannel_file = QFile(':/qtwebchannel/qwebchannel.js')
+        if not qwebchannel_file.open(QIODevice.ReadOnly):
+            logger.warning('Cannot read qwebchannel.js')
+            return
+        source = bytes(qwebchannel_file.readAll()).decode('utf-8')
+        qwebchannel_file.close()
+
+        script = QWebEngineScript()
+        script.setName('spyder-bridge')
+        script.setSourceCode(source + self.BRIDGE_SCRIPT)
+        script.setInjectionPoint(QWebEngineScript.DocumentCreation)
+        script.setWorldId(QWebEngineScript.MainWorld)
+        script.setRunsOnSubFrames(False)
+        self.scripts().insert(script)
 
 
 class NotebookWidget(DOMWidget):
@@ -151,6 +298,47 @@ class NotebookWidget(DOMWidget):
         Whether the notebook is now dirty.
     """
 
+    sig_kernel_changed = Signal(str)
+    """
+    This signal is emitted when the notebook reports the id of its kernel.
+
+    Parameters
+    ----------
+    kernel_id : str
+        The id of the kernel, or the empty string if there is no kernel.
+    """
+
+    sig_empty_changed = Signal(bool)
+    """
+    This signal is emitted when the notebook becomes empty or non-empty.
+
+    Parameters
+    ----------
+    new_value : bool
+        Whether the notebook is now empty, meaning that it has no cells or
+        that the first cell has no contents.
+    """
+
+    sig_saved = Signal(bool)
+    """
+    This signal is emitted when the notebook has finished saving.
+
+    Parameters
+    ----------
+    success : bool
+        Whether the notebook was saved successfully.
+    """
+
+    sig_painted = Signal(str)
+    """
+    This signal is emitted when the page reports that it has been painted.
+
+    Parameters
+    ----------
+    paint_type : str
+        Type of paint, e.g. `first-paint` or `first-contentful-paint`.
+    """
+
     def __init__(self, parent, actions=None):
         """
         Constructor.
@@ -168,7 +356,8 @@ class NotebookWidget(DOMWidget):
 
         # Use our subclass of QtWebEnginePage to view notebooks
         web_page = NotebookWebPage(self)
-        web_page.sig_message_received.connect(self.on_message_received)
+        web_page.bridge.sig_messages_received.connect(
+            self.on_messages_received)
         self.setPage(web_page)
 
         self.CONTEXT_NAME = str(id(self))
@@ -230,18 +419,45 @@ class NotebookWidget(DOMWidget):
         """Set informational html with css from local path."""
         self.setHtml(html, QUrl.fromLocalFile(self.css_path))
 
-    def on_message_received(self, msg: str) -> None:
+    def on_messages_received(self, messages: list) -> None:
+        """Handle batch of messages sent by the notebook."""
+        for message in messages:
+            self.on_message_received(message)
+
+    def on_message_received(self, message: dict) -> None:
         """
-        Handle messages from notebooks communicated with alert().
+        Handle message sent by the notebook through the bridge.
 
-        The only message implemented at the moment indicates that a notebook
-        has become dirty or non-dirty.
+        The message `dirty` indicates that a notebook has become dirty or
+        non-dirty, the message `empty` that it has become empty or
+        non-empty, the message `saved` that it has finished saving, the
+        message `kernel` reports the id of the kernel and the message `paint`
+        that the page has been painted.
         """
-        msg_class, msg_args = msg.split(':', 2)
-        if msg_class == 'dirty':
-            self.sig_dirty_changed.emit(msg_args == 'true')
-        else:
-            logger.warning(f'Unknown message class from notebook, {msg = }')
+        dispatch = {
+            'dirty': (self.sig_dirty_changed, bool),
+            'empty': (self.sig_empty_changed, bool),
+            'saved': (self.sig_saved, bool),
+            'kernel': (self.sig_kernel_changed, str),
+            'paint': (self.sig_painted, str)
+        }
+        try:
+            signal, value_type = dispatch[message['type']]
+        except (KeyError, TypeError):
+            logger.warning(f'Unknown message from notebook, {message = }')
+            return
+        value = message.get('value')
+        signal.emit(value_type() if value is None else value_type(value))
+
+    def send_command(self, command_type: str) -> None:
+        """
+        Send command to the notebook through the bridge.
+
+        The command `save` saves the notebook and the command
+        `restart_kernel` restarts its kernel, or starts a new one if the
+        notebook has no kernel.
+        """
+        self.page().bridge.sig_command_sent.emit({'type': command_type})
 
     def show_blank(self):
         """Show a blank page."""
@@ -318,6 +534,28 @@ class NotebookClient(QFrame):
     ----------
     server_url : str or None
         URL to send requests to; set by register().
+    sessions_client : SessionsClient or None
+        Client for looking up and shutting down kernels on the server; set
+        by register().
+    kernel_id : str or None
+        Id of the kernel as reported by the notebook, or None if not known.
+    empty : bool or None
+        Whether the notebook is empty, as reported by the notebook, or None
+        if the notebook did not report this yet; see `can_discard()`.
+    save_pending : bool
+        Whether a save was requested that the notebook did not yet confirm.
+        This is cleared if the notebook does not confirm the save within
+        SAVE_TIMEOUT or if the page is reloaded.
+    deferred : bool
+        Whether loading the notebook is deferred until the tab becomes
+        current.
+    hibernated : bool
+        Whether the web page is discarded to save memory; see `hibernate()`.
+    kernel_culled : bool
+        Whether the server shut down the kernel because it was idle; see
+        `restart_kernel()`.
+    last_active : float
+        Time (as given by `time.monotonic()`) when the tab was last current.
     """
 
     CONF_SECTION = CONF_SECTION
@@ -332,6 +570,26 @@ class NotebookClient(QFrame):
         Whether the notebook is now dirty.
     """
 
+    sig_saved = Signal(bool)
+    """
+    This signal is emitted when the notebook has finished saving.
+
+    Parameters
+    ----------
+    success : bool
+        Whether the notebook was saved successfully.
+    """
+
+    sig_kernel_culled_changed = Signal(bool)
+    """
+    This signal is emitted when the kernel is culled or restarted afterwards.
+
+    Parameters
+    ----------
+    culled : bool
+        Whether the kernel is now culled.
+    """
+
     def __init__(self, parent, filename, actions=None, ini_message=None):
         """
         Constructor.
@@ -358,8 +616,19 @@ class NotebookClient(QFrame):
 
         self.file_url = None
         self.server_url = None
+        self.sessions_client = None
+        self.kernel_id = None
         self.path = None
         self.dirty = False
+        self.empty = None
+        self.save_pending = False
+        self.deferred = False
+        self.hibernated = False
+        self.opening = False
+        self.kernel_culled = False
+        self.last_active = time.monotonic()
+        self._last_kernel_id = None
+        self._load_requested = False
 
         self.notebookwidget = NotebookWidget(self, actions)
         if ini_message:
@@ -371,18 +640,49 @@ class NotebookClient(QFrame):
 
         self.notebookwidget.sig_dirty_changed.connect(
             self._handle_dirty_changed)
+        self.notebookwidget.sig_kernel_changed.connect(
+            self._handle_kernel_changed)
+        self.notebookwidget.sig_empty_changed.connect(
+            self._handle_empty_changed)
+        self.notebookwidget.sig_saved.connect(self._handle_saved)
+        self.notebookwidget.loadStarted.connect(self._handle_load_started)
+        self.notebookwidget.loadFinished.connect(
+            lambda ok: tracer.instant('page load finished',
+                                      filename=self.filename, ok=ok))
+        self.notebookwidget.sig_painted.connect(
+            lambda paint_type: tracer.instant(
+                'page painted', filename=self.filename, type=paint_type))
         self.notebookwidget.sig_focus_in_event.connect(
             lambda: self._apply_stylesheet(focus=True))
         self.notebookwidget.sig_focus_out_event.connect(
             lambda: self._apply_stylesheet(focus=False))
         self._apply_stylesheet()
 
+        self._save_timer = QTimer(self)
+        self._save_timer.setSingleShot(True)
+        self._save_timer.setInterval(SAVE_TIMEOUT)
+        self._save_timer.timeout.connect(self._handle_save_timed_out)
+
         self.find_widget = FindReplace(self)
         self.find_widget.set_editor(self.notebookwidget)
         self.find_widget.hide()
 
+        self.culled_label = QLabel(
+            _('The kernel of this notebook was shut down because it was '
+              'idle. Restart it to run code again.'), self)
+        self.culled_label.setWordWrap(True)
+        restart_button = QPushButton(_('Restart kernel'), self)
+        restart_button.clicked.connect(self.restart_kernel)
+        culled_layout = QHBoxLayout()
+        culled_layout.addWidget(self.culled_label, 1)
+        culled_layout.addWidget(restart_button)
+        self.culled_bar = QFrame(self)
+        self.culled_bar.setLayout(culled_layout)
+        self.culled_bar.hide()
+
         layout = QVBoxLayout()
         layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.culled_bar)
         layout.addWidget(self.notebookwidget)
         layout.addWidget(self.find_widget)
         self.setLayout(layout)
@@ -392,8 +692,24 @@ class NotebookClient(QFrame):
         token_url = url + '?token={}'.format(self.token)
         return token_url
 
-    def register(self, server_info):
-        """Register attributes that can be computed with the server info."""
+    @tracer.traced('NotebookClient.register')
+    def register(self, server_info, sessions_client=None):
+        """
+        Register attributes that can be computed with the server info.
+
+        Parameters
+        ----------
+        server_info : dict
+            Server info of the server rendering the notebook.
+        sessions_client : SessionsClient or None, optional
+            Client for the sessions of the server. The default is None,
+            meaning that kernels are looked up with blocking requests.
+        """
+        self.sessions_client = sessions_client
+        if sessions_client is not None:
+            sessions_client.sig_kernels_culled.connect(
+                self._handle_kernels_culled)
+
         # Path relative to the server directory
         self.path = os.path.relpath(self.filename,
                                     start=server_info['root_dir'])
@@ -423,10 +739,66 @@ class NotebookClient(QFrame):
         logger.debug(f'Going to URL {url_or_text}')
         self.notebookwidget.load(url)
 
+    @tracer.traced('NotebookClient.load_notebook')
     def load_notebook(self):
         """Load the associated notebook."""
+        self._load_requested = True
         self.go_to(self.file_url)
 
+    def can_discard(self):
+        """
+        Return whether the notebook can be discarded without asking the user.
+
+        This is the case if the notebook reported that it is empty. If the
+        notebook did not report whether it is empty, then this is only the
+        case if the notebook was never loaded, because then the user cannot
+        have changed it.
+        """
+        if self.empty is None:
+            return not self._load_requested
+        return self.empty
+
+    def can_hibernate(self):
+        """
+        Return whether the web page can be discarded without losing data.
+
+        This is the case if the notebook is loaded, it is not hidden already,
+        all changes are saved and the page is not shown on screen.
+        """
+        return (CAN_HIBERNATE and not self.static and not self.deferred
+                and self.file_url is not None and not self.hibernated
+                and not self.dirty and not self.save_pending
+                and not self.isVisible())
+
+    def hibernate(self):
+        """
+        Discard the web page to save memory.
+
+        The kernel keeps running, so no results are lost. The page is loaded
+        again in `wake_up()`.
+
+        Returns
+        -------
+        bool
+            Whether the page was discarded.
+        """
+        if not self.can_hibernate():
+            return False
+        logger.debug(f'Hibernating {self.filename}')
+        self.notebookwidget.page().setLifecycleState(
+            QWebEnginePage.LifecycleState.Discarded)
+        self.hibernated = True
+        return True
+
+    def wake_up(self):
+        """Load the web page again if it was discarded by `hibernate()`."""
+        if not self.hibernated:
+            return
+        logger.debug(f'Waking up {self.filename}')
+        self.hibernated = False
+        self.notebookwidget.page().setLifecycleState(
+            QWebEnginePage.LifecycleState.Active)
+
     def get_filename(self):
         """Get notebook's filename."""
         return self.filename
@@ -443,14 +815,37 @@ class NotebookClient(QFrame):
         """
         Save current notebook asynchronously.
 
-        This function simulates a click on the Save button in the notebook
-        which will save the current notebook (but the function will return
-        before). The Save button is found by selecting the first element of
-        class `jp-ToolbarButtonComponent` whose `title` attribute begins with
-        the string "Save".
+        This function sends the `save` command to the notebook, which will
+        save the current notebook (but the function will return before).
+        When the notebook is saved, `sig_saved` is emitted.
         """
-        self.notebookwidget.mousedown(
-            '.jp-ToolbarButtonComponent[title^="Save"]')
+        if self.server_url:
+            self.save_pending = True
+            self._save_timer.start()
+        self.notebookwidget.send_command('save')
+
+    def restart_kernel(self):
+        """
+        Restart the kernel of the notebook.
+
+        If the kernel was culled, then a new kernel is started. The page is
+        not reloaded, so the notebook view, including the outputs, stays as
+        it is.
+        """
+        logger.debug(f'Restarting kernel of {self.filename}')
+        self.notebookwidget.send_command('restart_kernel')
+
+    def set_kernel_culled(self, culled):
+        """
+        Record whether the kernel is culled and show or hide the message.
+
+        Emit `sig_kernel_culled_changed` if the value changes.
+        """
+        if culled == self.kernel_culled:
+            return
+        self.kernel_culled = culled
+        self.culled_bar.setVisible(culled)
+        self.sig_kernel_culled_changed.emit(culled)
 
     def get_session_url(self):
         """
@@ -469,15 +864,27 @@ class NotebookClient(QFrame):
         """
         Get the kernel id of the client.
 
+        Use the kernel id reported by the notebook or the index of the
+        sessions client. If the client has no sessions client, then ask the
+        server for the list of sessions; this blocks until the server
+        replies. Use `request_kernel_id()` to avoid blocking if the kernel id
+        is not known yet.
+
         Return a str with the kernel id or None. On error, display a dialog
         box and return None.
         """
+        if self.kernel_id:
+            return self.kernel_id
+        if self.sessions_client:
+            return self.sessions_client.get_kernel_id(self.path)
+
         sessions_url = self.get_session_url()
         if not sessions_url:
             return None
 
         try:
-            sessions_response = requests.get(sessions_url)
+            sessions_response = self._get_http().get(
+                sessions_url, timeout=REQUEST_TIMEOUT)
         except requests.exceptions.RequestException as exception:
             msg = _('Spyder could not get a list of sessions '
                     'from the Jupyter Notebook server. '
@@ -492,28 +899,66 @@ class NotebookClient(QFrame):
             QMessageBox.warning(self, _('Server error'), msg)
             return None
 
-        if os.name == 'nt':
-            path = self.path.replace('\\', '/')
-        else:
-            path = self.path
-
         sessions = json.loads(sessions_response.content.decode())
         for session in sessions:
             notebook_path = session.get('notebook', {}).get('path')
-            if notebook_path is not None and notebook_path == path:
+            if notebook_path is not None and notebook_path == self.path:
                 kernel_id = session['kernel']['id']
                 return kernel_id
 
+    def request_kernel_id(self, function):
+        """
+        Call function with the kernel id of the client.
+
+        If the client has a sessions client and the kernel id is not known
+        yet, then the sessions client asks the server for it in the
+        background and the function is called when the server replies.
+        Otherwise, the function is called immediately with the result of
+        `get_kernel_id()`.
+
+        Parameters
+        ----------
+        function : callable
+            Function to be called with one argument, the kernel id or None.
+        """
+        if self.kernel_id or not self.sessions_client or self.path is None:
+            function(self.get_kernel_id())
+        else:
+            self.sessions_client.request_kernel_id(self.path, function)
+
     def shutdown_kernel(self):
-        """Shutdown the kernel of the client."""
+        """
+        Shutdown the kernel of the client.
+
+        If the client has a sessions client, then the kernel is shut down in
+        the background and errors are only logged. Otherwise, this blocks
+        until the server replies and errors are reported in a dialog box.
+        """
+        if self.sessions_client:
+            sessions_client = self.sessions_client
+
+            def shutdown(kernel_id):
+                if kernel_id:
+                    sessions_client.shutdown_kernel(kernel_id)
+
+            self.request_kernel_id(shutdown)
+            self.kernel_id = None
+            return
+
         kernel_id = self.get_kernel_id()
+        self.kernel_id = None
 
         if kernel_id:
             delete_url = self.add_token(url_path_join(self.server_url,
                                                       'api/kernels/',
                                                       kernel_id))
-            delete_req = requests.delete(delete_url)
-            if delete_req.status_code != 204:
+            try:
+                delete_req = self._get_http().delete(
+                    delete_url, timeout=REQUEST_TIMEOUT)
+                success = delete_req.status_code == 204
+            except requests.exceptions.RequestException:
+                success = False
+            if not success:
                 QMessageBox.warning(
                     self,
                     _("Server error"),
@@ -523,6 +968,17 @@ class NotebookClient(QFrame):
                       "If you want to shut it down, "
                       "you'll have to close Spyder."))
 
+    def _get_http(self):
+        """
+        Return object for sending HTTP requests to the server.
+
+        This is the pooled HTTP session of the server if the client has a
+        sessions client, and the requests module otherwise.
+        """
+        if self.sessions_client:
+            return self.sessions_client.http_session
+        return requests
+
     def _apply_stylesheet(self, focus=False):
         """Apply stylesheet according to the current focus."""
         if focus:
@@ -544,11 +1000,83 @@ class NotebookClient(QFrame):
         """
         Handle signal that a notebook became dirty or not.
 
-        Store the new value and emit the signal again.
+        Store the new value and emit the signal again, unless the value did
+        not change.
         """
+        if new_value == self.dirty:
+            return
         self.dirty = new_value
         self.sig_dirty_changed.emit(new_value)
 
+    def _handle_empty_changed(self, new_value: bool) -> None:
+        """
+        Handle signal that a notebook became empty or non-empty.
+
+        The notebook sends this signal as soon as its contents are loaded,
+        so this also ends the `open notebook` trace span.
+        """
+        self.empty = new_value
+        if self.opening:
+            self.opening = False
+            tracer.end('open notebook', id(self))
+
+    def _handle_saved(self, success: bool) -> None:
+        """
+        Handle signal that the notebook has finished saving.
+
+        Record that there is no pending save and emit the signal again.
+        """
+        self.save_pending = False
+        self._save_timer.stop()
+        self.sig_saved.emit(success)
+
+    def _handle_save_timed_out(self):
+        """
+        Handle notebook not confirming a save within SAVE_TIMEOUT.
+
+        Assume the confirmation is lost, so that the client is not blocked
+        forever waiting for it.
+        """
+        logger.warning(f'{self.filename} did not confirm that it was saved')
+        self.save_pending = False
+
+    def _handle_load_started(self):
+        """
+        Handle signal that the web page started loading.
+
+        A save requested from the previous page will never be confirmed, so
+        there is no longer a pending save.
+        """
+        tracer.instant('page load started', filename=self.filename)
+        self.save_pending = False
+        self._save_timer.stop()
+
+    def _handle_kernel_changed(self, kernel_id: str) -> None:
+        """
+        Handle signal that the notebook reported the id of its kernel.
+
+        Store the kernel id and record it in the index of the sessions client.
+        A new kernel means that the kernel is no longer culled.
+        """
+        self.kernel_id = kernel_id or None
+        if self.sessions_client and self.path is not None:
+            self.sessions_client.set_kernel_id(self.path, self.kernel_id)
+        if kernel_id:
+            self._last_kernel_id = kernel_id
+            self.set_kernel_culled(False)
+
+    def _handle_kernels_culled(self, kernel_ids):
+        """
+        Handle signal that the server culled some kernels.
+
+        The notebook reports that it has no kernel when its kernel is
+        culled, so compare with the last kernel it reported.
+        """
+        if self._last_kernel_id in kernel_ids:
+            logger.debug(f'Kernel of {self.filename} was culled')
+            self.kernel_id = None
+            self.set_kernel_culled(True)
+
 # -----------------------------------------------------------------------------
 # Tests
 # -----------------------------------------------------------------------------
@@ -10,10 +10,12 @@ from typing import Optional
 
 # Third-party imports
 from jupyter_core.paths import jupyter_runtime_dir
-from qtpy.QtCore import Signal
+from qtpy.compat import getsavefilename
+from qtpy.QtCore import Qt, Signal
 from qtpy.QtWidgets import QMessageBox, QVBoxLayout
 
 # Spyder imports
+from spyder.api.config.decorators import on_conf_change
 from spyder.api.plugins import Plugins
 from spyder.api.widgets.main_widget import PluginMainWidget
 from spyder.config.gui import is_dark_interface
@@ -21,6 +23,9 @@ from spyder.config.gui import is_dark_interface
 # Local imports
 from spyder_notebook.utils.localization import _
 from spyder_notebook.utils.servermanager import ServerManager
+from spyder_notebook.utils.tracing import tracer
+from spyder_notebook.widgets.memorygovernor import (
+    CullKernelsDialog, MemoryGovernor)
 from spyder_notebook.widgets.notebooktabwidget import NotebookTabWidget
 from spyder_notebook.widgets.serverinfo import ServerInfoDialog
 
@@ -35,6 +40,7 @@ class NotebookMainWidgetActions:
     Open = 'Open'
     OpenConsole = 'Open console'
     ServerInfo = 'Server info'
+    ExportTrace = 'Export trace'
     ClearRecentNotebooks = 'Clear recent notebooks'
     RecentNotebook = 'Recent notebook'
 
@@ -94,19 +100,38 @@ class NotebookMainWidget(PluginMainWidget):
         """Widget constructor."""
         super().__init__(name, plugin, parent)
 
-        self.server_manager = ServerManager(self.dark_theme)
+        self.server_manager = ServerManager(
+            self.dark_theme,
+            pool_size=self.get_conf('server_pool_size', default=0),
+            multi_root=self.get_conf('single_server', default=False),
+            idle_timeout=self.get_conf('server_idle_timeout', default=10),
+            output_limit=1024 * self.get_conf(
+                'server_output_limit', default=1024),
+            log_output=self.get_conf('server_output_log', default=False),
+            kernel_pool_size=self.get_conf('kernel_pool_size', default=0),
+            kernel_cull_timeout=self.get_conf(
+                'kernel_cull_timeout', default=0)
+        )
 
         # Tab widget
         self.tabwidget = NotebookTabWidget(
             self,
             self.server_manager,
-            dark_theme=self.dark_theme
+            dark_theme=self.dark_theme,
+            hibernate_timeout=self.get_conf('hibernate_timeout', default=60)
         )
         self.tabwidget.currentChanged.connect(self.refresh_plugin)
         self.tabwidget.sig_refresh_save_actions_requested.connect(
             self.refresh_save_actions
         )
 
+        # Governor acting when memory is low
+        self.memory_governor = MemoryGovernor(
+            self.tabwidget, self.server_manager, parent=self)
+        self.memory_governor.sig_memory_low.connect(self.warn_memory_low)
+        self.memory_governor.sig_cull_offered.connect(
+            self.offer_cull_kernels)
+
         # Widget layout
         layout = QVBoxLayout()
         layout.addWidget(self.tabwidget)
@@ -138,10 +163,17 @@ class NotebookMainWidget(PluginMainWidget):
             icon=self.create_icon('log'),
             triggered=self.view_servers
         )
+        self.export_trace_action = self.create_action(
+            NotebookMainWidgetActions.ExportTrace,
+            text=_('Export performance trace...'),
+            icon=self.create_icon('filesave'),
+            triggered=self.export_trace
+        )
 
         # Options menu
         options_menu = self.get_options_menu()
-        for item in [self.open_console_action, self.server_info_action]:
+        for item in [self.open_console_action, self.server_info_action,
+                     self.export_trace_action]:
             self.add_item_to_menu(
                 item,
                 menu=options_menu,
@@ -202,8 +234,51 @@ class NotebookMainWidget(PluginMainWidget):
             client.close()
 
         self.set_conf('opened_notebooks', opened_notebooks)
+        self.memory_governor.close()
         self.server_manager.shutdown_all_servers()
 
+    @on_conf_change(option='server_pool_size')
+    def on_server_pool_size_change(self, value):
+        """Update number of idle servers and refill the pool."""
+        self.server_manager.pool_size = value
+        self.server_manager.fill_pool(self.tabwidget.get_interpreter())
+
+    @on_conf_change(option='single_server')
+    def on_single_server_change(self, value):
+        """Use single or several servers for new notebooks."""
+        self.server_manager.multi_root = value
+
+    @on_conf_change(option='server_idle_timeout')
+    def on_server_idle_timeout_change(self, value):
+        """Update time after which unused servers are shut down."""
+        self.server_manager.idle_timeout = value
+        self.server_manager.reap_idle_servers()
+
+    @on_conf_change(option='server_output_limit')
+    def on_server_output_limit_change(self, value):
+        """Update amount of server output kept for new servers."""
+        self.server_manager.output_limit = 1024 * value
+
+    @on_conf_change(option='server_output_log')
+    def on_server_output_log_change(self, value):
+        """Update whether new servers write their output to log files."""
+        self.server_manager.log_output = value
+
+    @on_conf_change(option='kernel_pool_size')
+    def on_kernel_pool_size_change(self, value):
+        """Update number of kernels that new servers start in advance."""
+        self.server_manager.kernel_pool_size = value
+
+    @on_conf_change(option='kernel_cull_timeout')
+    def on_kernel_cull_timeout_change(self, value):
+        """Update time after which new servers shut down idle kernels."""
+        self.server_manager.kernel_cull_timeout = value
+
+    @on_conf_change(option='hibernate_timeout')
+    def on_hibernate_timeout_change(self, value):
+        """Update time after which tabs that are not used are hibernated."""
+        self.tabwidget.set_hibernate_timeout(value)
+
     # ---- Public API
     # ------------------------------------------------------------------------
     @property
@@ -232,18 +307,24 @@ class NotebookMainWidget(PluginMainWidget):
 
     def open_previous_session(self):
         """Open notebooks left open in the previous session."""
+        self.server_manager.fill_pool(self.tabwidget.get_interpreter())
         filenames = self.get_conf('opened_notebooks')
         if filenames:
-            self.open_notebook(filenames)
+            self.open_notebook(filenames, deferred=True)
         else:
             self.tabwidget.maybe_create_welcome_client()
             self.create_new_client()
             self.tabwidget.setCurrentIndex(0)  # bring welcome tab to top
         self.refresh_save_actions()
 
-    def open_notebook(self, filenames=None):
-        """Open a notebook from file."""
-        filenames = self.tabwidget.open_notebook(filenames)
+    def open_notebook(self, filenames=None, deferred=False):
+        """
+        Open a notebook from file.
+
+        If `deferred` is True, then notebooks are only loaded when their tab
+        becomes current.
+        """
+        filenames = self.tabwidget.open_notebook(filenames, deferred)
         for filename in filenames:
             self.sig_new_recent_file.emit(filename)
 
@@ -295,15 +376,13 @@ class NotebookMainWidget(PluginMainWidget):
         Enable or disable 'Save' and 'Save All' actions.
 
         The 'Save' action is enabled if the current notebook can be saved.
-        The 'Save all' action is enabled if any notebook can be saved.
+        The 'Save all' action is enabled if any notebook can be saved, which
+        is the case if any notebook is dirty; the tab widget keeps count.
         """
         current_index = self.tabwidget.currentIndex()
         current_client = self.tabwidget.widget(current_index)
         save_enabled = self.tabwidget.can_save_client(current_client)
-        save_all_enabled = any(
-            self.tabwidget.can_save_client(self.tabwidget.widget(index))
-            for index in range(self.tabwidget.count())
-        )
+        save_all_enabled = self.tabwidget.dirty_count > 0
         self.sig_enable_save_requested.emit(save_enabled, save_all_enabled)
 
     def close_notebook(self) -> None:
@@ -330,7 +409,11 @@ class NotebookMainWidget(PluginMainWidget):
         if not client:
             client = self.tabwidget.currentWidget()
 
-        kernel_id = client.get_kernel_id()
+        client.request_kernel_id(
+            lambda kernel_id: self._open_console_for_kernel(client, kernel_id))
+
+    def _open_console_for_kernel(self, client, kernel_id):
+        """Open an IPython console for the given kernel of a client."""
         if not kernel_id:
             QMessageBox.critical(
                 self,
@@ -349,8 +432,75 @@ class NotebookMainWidget(PluginMainWidget):
     def view_servers(self):
         """Display server info."""
         dialog = ServerInfoDialog(self.server_manager.servers, parent=self)
+        self.server_manager.sig_server_output.connect(dialog.append_output)
+        self.server_manager.sig_servers_changed.connect(dialog.refresh_data)
+
+        def disconnect(result):
+            self.server_manager.sig_server_output.disconnect(
+                dialog.append_output)
+            self.server_manager.sig_servers_changed.disconnect(
+                dialog.refresh_data)
+
+        dialog.finished.connect(disconnect)
         dialog.show()
 
+    def warn_memory_low(self, percent):
+        """
+        Warn user that memory is low, without blocking.
+
+        Parameters
+        ----------
+        percent : float
+            Percentage of memory in use.
+        """
+        message_box = QMessageBox(
+            QMessageBox.Warning,
+            _('Memory is low'),
+            _('Your computer is running out of memory ({:.0f}% in use). '
+              'Notebooks in background tabs have been unloaded. Close '
+              'notebooks whose results you no longer need to free more '
+              'memory.').format(percent),
+            QMessageBox.Ok,
+            self)
+        message_box.setAttribute(Qt.WA_DeleteOnClose)
+        message_box.setModal(False)
+        message_box.show()
+
+    def offer_cull_kernels(self, candidates):
+        """
+        Offer user to shut down idle kernels because memory is low.
+
+        Parameters
+        ----------
+        candidates : list of (NotebookClient, int)
+            Notebook clients with an idle kernel and the memory it uses, as
+            emitted by `MemoryGovernor.sig_cull_offered`.
+        """
+        dialog = CullKernelsDialog(candidates, parent=self)
+        if dialog.exec_():
+            self.memory_governor.cull_kernels(dialog.selected_clients())
+
+    def export_trace(self):
+        """
+        Save timing spans of the plugin to a file chosen by the user.
+
+        The file is in Chrome's trace format, so it can be inspected with
+        chrome://tracing or https://ui.perfetto.dev.
+        """
+        filename, _selfilter = getsavefilename(
+            self, _('Export performance trace'), 'notebook-trace.json',
+            '{} (*.json)'.format(_('Trace files')))
+        if not filename:
+            return
+        try:
+            tracer.export(filename)
+        except OSError as error:
+            QMessageBox.critical(
+                self,
+                _('Error exporting trace'),
+                _('The trace could not be saved:\n\n{}').format(error)
+            )
+
     def get_current_filename(self) -> Optional[str]:
         """
         Get file name of currently displayed notebook.
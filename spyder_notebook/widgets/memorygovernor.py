@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) Spyder Project Contributors
+# Licensed under the terms of the MIT License
+
+"""File implementing MemoryGovernor and CullKernelsDialog."""
+
+# Standard library imports
+from concurrent.futures import ThreadPoolExecutor
+import enum
+import logging
+
+# Qt imports
+from qtpy.QtCore import QObject, Qt, QTimer, Signal
+from qtpy.QtWidgets import (
+    QDialog, QDialogButtonBox, QLabel, QListWidget, QListWidgetItem,
+    QVBoxLayout)
+
+# Third-party imports
+import psutil
+
+# Local imports
+from spyder_notebook.utils.localization import _
+from spyder_notebook.utils.servermanager import ServerState
+from spyder_notebook.widgets.serverinfo import collect_metrics, format_bytes
+
+
+# Interval between checks of the available memory (in ms)
+MEMORY_CHECK_INTERVAL = 10 * 1000
+
+# Percentage of memory in use above which memory is considered low
+MEMORY_PRESSURE_PERCENT = 90
+
+# Percentage of memory in use below which memory is no longer considered low
+MEMORY_RECOVERED_PERCENT = 85
+
+logger = logging.getLogger(__name__)
+
+
+class GovernorStage(enum.IntEnum):
+    """Actions that the memory governor took while memory is low."""
+
+    NORMAL = 0
+    HIBERNATED = 1
+    WARNED = 2
+    CULL_OFFERED = 3
+
+
+class MemoryGovernor(QObject):
+    """
+    Object which takes graduated actions when the system is low on memory.
+
+    The memory in use is checked every MEMORY_CHECK_INTERVAL ms. If it is
+    above MEMORY_PRESSURE_PERCENT, then on every check the governor takes the
+    next of these steps:
+
+    1. Hibernate the background tabs, which is cheap and loses nothing.
+    2. Emit `sig_memory_low`, so that the user can be warned.
+    3. Collect the memory usage of the kernels in a worker thread and emit
+       `sig_cull_offered` with the idle kernels, so that the user can be
+       offered to shut down the largest ones.
+
+    Every step is only taken once until the memory in use drops below
+    MEMORY_RECOVERED_PERCENT.
+
+    Attributes
+    ----------
+    stage : GovernorStage
+        Last step taken since memory became low.
+    """
+
+    sig_memory_low = Signal(float)
+    """
+    This signal is emitted when memory stays low after hibernating tabs.
+
+    Parameters
+    ----------
+    percent : float
+        Percentage of memory in use.
+    """
+
+    sig_cull_offered = Signal(list)
+    """
+    This signal is emitted when the user should be offered to cull kernels.
+
+    Parameters
+    ----------
+    candidates : list of (NotebookClient, int)
+        Notebook clients whose kernel is idle, together with the memory used
+        by the kernel (in bytes), sorted with the largest kernel first.
+    """
+
+    sig_kernel_usage_collected = Signal(list)
+    """
+    This signal is emitted when the memory usage of the kernels is collected.
+
+    Parameters
+    ----------
+    kernels : list of dict
+        Kernel metrics of all running servers, as returned by
+        `collect_metrics()`.
+    """
+
+    def __init__(self, tabwidget, server_manager, parent=None):
+        """
+        Construct a MemoryGovernor.
+
+        Parameters
+        ----------
+        tabwidget : NotebookTabWidget
+            Tabbed widget with the notebooks.
+        server_manager : ServerManager
+            Object managing the notebook servers.
+        parent : QObject or None, optional
+            Parent of this object. The default is None.
+        """
+        super().__init__(parent)
+        self.tabwidget = tabwidget
+        self.server_manager = server_manager
+        self.stage = GovernorStage.NORMAL
+        self._processes = {}
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._usage_future = None
+
+        self.sig_kernel_usage_collected.connect(self._offer_cull)
+        self._check_timer = QTimer(self)
+        self._check_timer.setInterval(MEMORY_CHECK_INTERVAL)
+        self._check_timer.timeout.connect(self.check_memory)
+        self._check_timer.start()
+
+    def check_memory(self):
+        """Check memory in use and take the next step if it is low."""
+        percent = psutil.virtual_memory().percent
+        if percent < MEMORY_RECOVERED_PERCENT:
+            if self.stage != GovernorStage.NORMAL:
+                logger.debug(f'Memory is no longer low ({percent}% in use)')
+                self.stage = GovernorStage.NORMAL
+            return
+        if percent < MEMORY_PRESSURE_PERCENT:
+            return
+
+        background_clients = self.tabwidget.get_background_clients()
+        if self.tabwidget.hibernate_least_recently_used(
+                len(background_clients)):
+            logger.debug(f'Memory is low ({percent}% in use), '
+                         'hibernated background tabs')
+            self.stage = max(self.stage, GovernorStage.HIBERNATED)
+        elif self.stage < GovernorStage.WARNED:
+            logger.debug(f'Memory is low ({percent}% in use), warning user')
+            self.stage = GovernorStage.WARNED
+            self.sig_memory_low.emit(percent)
+        elif self.stage < GovernorStage.CULL_OFFERED:
+            self.collect_kernel_usage()
+
+    def collect_kernel_usage(self):
+        """
+        Start collecting memory usage of kernels in a worker thread.
+
+        If the usage is still being collected, then do nothing. When it is
+        collected, `sig_kernel_usage_collected` is emitted.
+        """
+        if self._usage_future and not self._usage_future.done():
+            return
+        servers = [(server.process.processId(), server.server_info,
+                    server.http_session)
+                   for server in self.server_manager.servers
+                   if server.state == ServerState.RUNNING]
+
+        def collect():
+            kernels = []
+            for pid, server_info, http_session in servers:
+                metrics = collect_metrics(
+                    pid, server_info, http_session, self._processes)
+                kernels.extend(metrics['kernels'])
+            self.sig_kernel_usage_collected.emit(kernels)
+
+        try:
+            self._usage_future = self._executor.submit(collect)
+        except RuntimeError:
+            # Executor is shut down because the governor is closed
+            pass
+
+    def cull_kernels(self, clients):
+        """
+        Shut down the kernels of the given notebook clients.
+
+        The notebooks stay open and show that their kernel is culled, so
+        that the user can restart it.
+
+        Parameters
+        ----------
+        clients : list of NotebookClient
+            Clients whose kernel is to be shut down.
+        """
+        for client in clients:
+            logger.info(f'Shutting down kernel of {client.filename} '
+                        'to free memory')
+            client.shutdown_kernel()
+            client.set_kernel_culled(True)
+
+    def close(self):
+        """Stop checking memory and abandon pending work."""
+        self._check_timer.stop()
+        self._executor.shutdown(wait=False)
+
+    def _offer_cull(self, kernels):
+        """
+        Offer to cull idle kernels, if memory is still low.
+
+        Only kernels which belong to a notebook in a tab, are idle and whose
+        memory usage is known are offered.
+        """
+        if (self.stage != GovernorStage.WARNED
+                or psutil.virtual_memory().percent < MEMORY_PRESSURE_PERCENT):
+            return
+
+        clients = {}
+        for index in range(self.tabwidget.count()):
+            client = self.tabwidget.widget(index)
+            if client.kernel_id:
+                clients[client.kernel_id] = client
+        candidates = [
+            (clients[kernel['id']], kernel['rss']) for kernel in kernels
+            if kernel['id'] in clients and kernel['state'] == 'idle'
+            and kernel['rss'] is not None]
+        if not candidates:
+            logger.debug('Memory is low, but there are no idle kernels')
+            return
+
+        candidates.sort(key=lambda candidate: candidate[1], reverse=True)
+        self.stage = GovernorStage.CULL_OFFERED
+        self.sig_cull_offered.emit(candidates)
+
+
+class CullKernelsDialog(QDialog):
+    """
+    Dialog offering to shut down idle kernels because memory is low.
+
+    The kernels are listed with the memory they use and can be selected
+    with check boxes. Initially, only the largest kernel is selected.
+    """
+
+    def __init__(self, candidates, parent=None):
+        """
+        Construct a CullKernelsDialog.
+
+        Parameters
+        ----------
+        candidates : list of (NotebookClient, int)
+            Notebook clients together with the memory used by their kernel
+            (in bytes), as emitted by `MemoryGovernor.sig_cull_offered`.
+        parent : QWidget, optional
+            Parent of the dialog window. The default is None.
+        """
+        super().__init__(parent)
+        self.setWindowTitle(_('Memory is low'))
+        self.candidates = candidates
+
+        label = QLabel(
+            _('Your computer is running out of memory. The kernels of the '
+              'following notebooks are not running any code. Shutting them '
+              'down frees memory, but their variables are lost. The '
+              'notebooks stay open, so you can restart their kernels '
+              'later.'), self)
+        label.setWordWrap(True)
+
+        self.kernel_list = QListWidget(self)
+        for index, (client, rss) in enumerate(candidates):
+            item = QListWidgetItem(
+                f'{client.get_short_name()} ({format_bytes(rss)})')
+            item.setToolTip(client.get_filename())
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Checked if index == 0 else Qt.Unchecked)
+            self.kernel_list.addItem(item)
+
+        buttonbox = QDialogButtonBox(QDialogButtonBox.Cancel, self)
+        buttonbox.addButton(
+            _('Shut down selected kernels'), QDialogButtonBox.AcceptRole)
+        buttonbox.accepted.connect(self.accept)
+        buttonbox.rejected.connect(self.reject)
+
+        layout = QVBoxLayout()
+        layout.addWidget(label)
+        layout.addWidget(self.kernel_list)
+        layout.addWidget(buttonbox)
+        self.setLayout(layout)
+
+    def selected_clients(self):
+        """Return list of notebook clients whose kernel is selected."""
+        return [client for index, (client, rss) in enumerate(self.candidates)
+                if self.kernel_list.item(index).checkState() == Qt.Checked]
@@ -6,15 +6,18 @@
 """File implementing NotebookTabWidget."""
 
 # Standard library imports
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import os
 import os.path as osp
+import shutil
 import sys
 import time
 
 # Qt imports
 from qtpy.compat import getopenfilenames, getsavefilename
-from qtpy.QtCore import QEventLoop, QTimer, Signal
+from qtpy.QtCore import QTimer, Signal
+from qtpy.QtGui import QIcon
 from qtpy.QtWidgets import QMessageBox
 
 # Third-party imports
@@ -22,13 +25,15 @@ import nbformat
 
 # Spyder imports
 from spyder.api.config.mixins import SpyderConfigurationAccessor
+from spyder.utils.icon_manager import ima
 from spyder.utils.misc import get_python_executable
 from spyder.utils.programs import get_temp_dir
 from spyder.widgets.tabs import Tabs
 
 # Local imports
 from spyder_notebook.utils.localization import _
-from spyder_notebook.widgets.client import NotebookClient
+from spyder_notebook.utils.tracing import tracer
+from spyder_notebook.widgets.client import NotebookClient, SAVE_TIMEOUT
 
 
 # Directory in which new notebooks are created
@@ -43,11 +48,8 @@ WELCOME_DARK = osp.join(PACKAGE_PATH, 'utils', 'templates',
 # Filter to use in file dialogs
 FILES_FILTER = '{} (*.ipynb)'.format(_('Jupyter notebooks'))
 
-# How long to wait after save before checking whether file exists (in ms)
-WAIT_SAVE_DELAY = 250
-
-# How often to wait for that time
-WAIT_SAVE_ITERATIONS = 20
+# Interval between checks for tabs to hibernate (in ms)
+HIBERNATE_CHECK_INTERVAL = 60 * 1000
 
 logger = logging.getLogger(__name__)
 
@@ -96,8 +98,13 @@ class NotebookTabWidget(Tabs, SpyderConfigurationAccessor):
         Items to be added to the context menu.
     dark_theme : bool
         Whether to display notebooks in a dark theme. The default is False.
+    hibernate_timeout : int
+        Number of minutes after which tabs that are not current are
+        hibernated, or 0 to only hibernate them when memory is low.
     untitled_num : int
         Number used in file name of newly created notebooks.
+    dirty_count : int
+        Number of tabs with notebooks that are dirty.
     last_closed_files : list[str]
         File names of notebooks that have been closed by the user, with the
         most recently closed one listed last.
@@ -108,8 +115,24 @@ class NotebookTabWidget(Tabs, SpyderConfigurationAccessor):
     This signal is emitted when the save actions should be refreshed.
     """
 
+    sig_notebook_copied = Signal(str, str, object, int)
+    """
+    This signal is emitted when a notebook has been copied by `save_as()`.
+
+    Parameters
+    ----------
+    original_path : str
+        File name of the original notebook.
+    filename : str
+        File name of the copy.
+    error : OSError or None
+        Error raised while copying, or None if the copy succeeded.
+    copy_id : int
+        Number identifying the call to `save_as()`.
+    """
+
     def __init__(self, parent, server_manager, actions=None, menu=None,
-                 corner_widgets=None, dark_theme=False):
+                 corner_widgets=None, dark_theme=False, hibernate_timeout=0):
         """
         Construct a NotebookTabWidget.
 
@@ -125,13 +148,22 @@ class NotebookTabWidget(Tabs, SpyderConfigurationAccessor):
             Widgets to be placed in the top left and right corner of the
             tabbed widget. A button for browsing the tabs is always added to
             the top left corner.
+        hibernate_timeout : int, optional
+            Number of minutes after which tabs that are not current are
+            hibernated. The default is 0, meaning that tabs are only
+            hibernated when memory is low.
         """
         super().__init__(parent, actions, menu, corner_widgets)
 
         self.actions = actions
         self.dark_theme = dark_theme
         self.untitled_num = 0
+        self.dirty_count = 0
         self.last_closed_files: list[str] = []
+        self._pending_copies = {}
+        self._copy_count = 0
+        self._copy_executor = ThreadPoolExecutor(max_workers=1)
+        self.sig_notebook_copied.connect(self.handle_notebook_copied)
 
         self.server_manager = server_manager
         self.server_manager.sig_server_started.connect(
@@ -140,6 +172,8 @@ class NotebookTabWidget(Tabs, SpyderConfigurationAccessor):
             self.handle_server_timed_out_or_error)
         self.server_manager.sig_server_errored.connect(
             self.handle_server_timed_out_or_error)
+        self.server_manager.sig_root_added.connect(
+            self.handle_server_started)
 
         if not sys.platform == 'darwin':
             # Don't set document mode to true on OSX because it generates
@@ -148,8 +182,15 @@ class NotebookTabWidget(Tabs, SpyderConfigurationAccessor):
             self.setDocumentMode(True)
 
         self.set_close_function(self.close_client)
+        self._current_client = None
+        self.currentChanged.connect(self.handle_current_changed)
 
-    def open_notebook(self, filenames=None):
+        self._hibernate_timer = QTimer(self)
+        self._hibernate_timer.setInterval(HIBERNATE_CHECK_INTERVAL)
+        self._hibernate_timer.timeout.connect(self.hibernate_idle_tabs)
+        self.set_hibernate_timeout(hibernate_timeout)
+
+    def open_notebook(self, filenames=None, deferred=False):
         """
         Open a notebook from file.
 
@@ -158,6 +199,10 @@ class NotebookTabWidget(Tabs, SpyderConfigurationAccessor):
         filenames : list of str or None, optional
             List of file names of notebooks to open. The default is None,
             meaning that the user should be asked.
+        deferred : bool, optional
+            Whether to defer loading the notebooks until their tabs become
+            current. In that case, only the last notebook is loaded now. The
+            default is False.
 
         Returns
         -------
@@ -169,7 +214,10 @@ class NotebookTabWidget(Tabs, SpyderConfigurationAccessor):
                 self, _('Open notebook'), '', FILES_FILTER)
         if filenames:
             for filename in filenames:
-                self.create_new_client(filename=filename)
+                self.create_new_client(filename=filename, deferred=deferred)
+            if deferred:
+                self.setCurrentIndex(self.count() - 1)
+                self.handle_current_changed(self.currentIndex())
         return filenames
 
     def open_last_closed_notebook(self) -> None:
@@ -182,7 +230,8 @@ class NotebookTabWidget(Tabs, SpyderConfigurationAccessor):
             filename = self.last_closed_files.pop()
             self.create_new_client(filename)
 
-    def create_new_client(self, filename=None):
+    @tracer.traced('NotebookTabWidget.create_new_client')
+    def create_new_client(self, filename=None, deferred=False):
         """
         Create a new notebook or load a pre-existing one.
 
@@ -191,6 +240,10 @@ class NotebookTabWidget(Tabs, SpyderConfigurationAccessor):
         filename : str, optional
             File name of the notebook to load in the new client. The default
             is None, meaning that a new notebook should be created.
+        deferred : bool, optional
+            Whether to defer loading the notebook until its tab becomes
+            current. In that case, the new tab is not made current and no
+            server is started for it yet. The default is False.
 
         Returns
         -------
@@ -211,17 +264,44 @@ class NotebookTabWidget(Tabs, SpyderConfigurationAccessor):
             self.untitled_num += 1
 
         client = NotebookClient(self, filename, self.actions)
-        self.add_tab(client)
+        self.add_tab(client, set_current=not deferred)
         client.sig_dirty_changed.connect(self.handle_dirty_changed)
+        client.sig_kernel_culled_changed.connect(
+            self.handle_kernel_culled_changed)
+        if deferred:
+            # Set after adding the tab, because Qt makes the first tab
+            # current and we do not want to load it just for that
+            client.deferred = True
+        else:
+            self.connect_client(client)
+        return client
+
+    def connect_client(self, client):
+        """
+        Get a server for a client and load its notebook.
+
+        If no suitable server is running, then one is started and the
+        notebook is loaded in `handle_server_started()`. The time until the
+        notebook reports its contents is traced as `open notebook`.
+
+        Parameters
+        ----------
+        client : NotebookClient
+            Client whose notebook is to be loaded.
+        """
+        filename = client.filename
+        tracer.begin('open notebook', id(client), filename=filename)
+        client.opening = True
         interpreter = self.get_interpreter()
         server_info = self.server_manager.get_server(
             filename, interpreter, start=True)
         if server_info:
             logger.debug('Using existing server at %s',
                          server_info['root_dir'])
-            client.register(server_info)
+            sessions_client = self.server_manager.register_client(
+                client, server_info)
+            client.register(server_info, sessions_client)
             client.load_notebook()
-        return client
 
     def get_interpreter(self):
         """
@@ -266,9 +346,11 @@ class NotebookTabWidget(Tabs, SpyderConfigurationAccessor):
         Close client tab with given index (or close current tab).
 
         First save the notebook (unless this is the welcome client or
-        `save_before_close` is False). Then delete the notebook if it is in
-        `get_temp_dir()`. Then shutdown the kernel of the notebook and close
-        the tab. Finally, create a welcome tab if there are no tabs.
+        `save_before_close` is False). Then shutdown the kernel of the
+        notebook, tell the server manager that the notebook no longer uses
+        its server and remove the tab. Create a welcome tab if there are no
+        tabs. Finally, once the notebook confirms that it is saved, close
+        the client and delete the notebook if it is in `get_temp_dir()`.
 
         Parameters
         ----------
@@ -294,28 +376,97 @@ class NotebookTabWidget(Tabs, SpyderConfigurationAccessor):
             if save_before_close:
                 filename = self.save_notebook(client)
             client.shutdown_kernel()
-        client.close()
+            self.server_manager.unregister_client(client)
 
-        # Delete notebook file if it is in temporary directory.
-        # Otherwise, store the file name for the "Open last closed" action.
-        if filename.startswith(get_temp_dir()):
-            remove_file_retry_if_in_use(filename)
-        else:
+        # Store the file name for the "Open last closed" action, unless
+        # the notebook file is in the temporary directory.
+        if not filename.startswith(get_temp_dir()):
             if filename in self.last_closed_files:
                 self.last_closed_files.remove(filename)
             self.last_closed_files.append(filename)
 
         # Note: notebook index may have changed after closing related widgets
         self.removeTab(self.indexOf(client))
+        if client.dirty:
+            self.dirty_count -= 1
+            self.sig_refresh_save_actions_requested.emit()
         self.maybe_create_welcome_client()
+        self.close_client_when_saved(client, filename)
         return filename
 
+    @staticmethod
+    def close_client_when_saved(client, filename):
+        """
+        Close client once its notebook is saved.
+
+        Wait until the notebook is saved, so that closing the web page does
+        not interrupt the save. Then close the client and delete the notebook
+        file if it is in `get_temp_dir()`.
+
+        Parameters
+        ----------
+        client : NotebookClient
+            Client to be closed.
+        filename : str
+            File name of the notebook.
+        """
+        def finish(saved):
+            client.close()
+            if filename.startswith(get_temp_dir()):
+                try:
+                    remove_file_retry_if_in_use(filename)
+                except FileNotFoundError:
+                    pass
+
+        NotebookTabWidget.call_when_saved(client, finish)
+
+    @staticmethod
+    def call_when_saved(client, function):
+        """
+        Call function once the notebook of a client is saved.
+
+        If the client is saving its notebook, then wait until the notebook
+        confirms that it is saved, or until SAVE_TIMEOUT has passed, before
+        calling the function. Otherwise, call the function immediately. In
+        either case, the function is called exactly once.
+
+        Parameters
+        ----------
+        client : NotebookClient
+            Client whose notebook is being saved.
+        function : callable
+            Function to be called with one argument, which is True if the
+            notebook is saved and False if saving failed or timed out.
+        """
+        finished = False
+
+        def finish(saved):
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+            try:
+                client.sig_saved.disconnect(finish)
+            except (TypeError, RuntimeError):
+                # Not connected, or client already deleted
+                pass
+            function(saved)
+
+        if client.save_pending:
+            client.sig_saved.connect(finish)
+            QTimer.singleShot(SAVE_TIMEOUT, lambda: finish(False))
+        else:
+            finish(True)
+
     def save_notebook(self, client):
         """
         Save notebook corresponding to given client.
 
-        If the notebook is newly created and not empty, then ask the user
-        whether to save it under a new name.
+        If the notebook is newly created and cannot be discarded, then ask
+        the user whether to save it under a new name. Whether the notebook is
+        empty is reported by the notebook itself, so this function does not
+        need to wait until the file is written; see
+        `NotebookClient.can_discard()`.
 
         Parameters
         ----------
@@ -328,9 +479,7 @@ class NotebookTabWidget(Tabs, SpyderConfigurationAccessor):
         """
         client.save()
         filename = client.filename
-        if not self.is_newly_created(client):
-            return filename
-        if self.wait_and_check_if_empty(filename):
+        if not self.is_newly_created(client) or client.can_discard():
             return filename
 
         # Notebook not empty, so ask user to save with new filename
@@ -344,59 +493,18 @@ class NotebookTabWidget(Tabs, SpyderConfigurationAccessor):
         else:
             return filename
 
-    @staticmethod
-    def wait_and_check_if_empty(filename):
-        """
-        Wait until notebook is created and check whether it is empty.
-
-        Repeatedly try to read the file, waiting a bit after every attempt.
-        At the first attempt where the file exists, test whether it is empty
-        and return. If it takes too long before the file is created, pretend
-        it is empty.
-
-        Parameters
-        ----------
-        filename : str
-            File name of notebook to be checked.
-
-        Returns
-        -------
-        True if notebook is empty or on timeout, False otherwise.
-        """
-        for iteration in range(WAIT_SAVE_ITERATIONS):
-
-            # Wait a bit
-            wait_save = QEventLoop()
-            QTimer.singleShot(WAIT_SAVE_DELAY, wait_save.quit)
-            wait_save.exec_()
-
-            # Try reading the file
-            try:
-                nb_contents = nbformat.read(filename, as_version=4)
-            except (FileNotFoundError, nbformat.reader.NotJSONError):
-                continue
-
-            # If empty, we are done
-            if (len(nb_contents['cells']) == 0
-                    or len(nb_contents['cells'][0]['source']) == 0):
-                return True
-            else:
-                return False
-        else:
-            # It is taking longer than expected;
-            # Just return True and hope for the best
-            return True
-
     def save_as(self, name=None, reopen_after_save=True, close_after_save=True):
         """
         Save current notebook under a different file name.
 
         First, save the notebook under the original file name. Then ask user
         for a new file name (if `name` is not set), and return if no new name
-        is given. Then, read the contents of the notebook that was just saved
-        and write them under the new file name. If `reopen_after_save` is
-        True, then open a new tab with the notebook loaded from the new file
-        name. If `close_after_save` is True, then close the original tab.
+        is given. Once the notebook confirms that it is saved, the file is
+        copied under the new file name in a worker thread, so this function
+        returns before the copy is done; see `handle_notebook_copied()` for
+        what happens afterwards. The file is copied byte for byte, because
+        the notebook server saves notebooks in the current format, so there
+        is nothing to convert.
 
         Parameters
         ----------
@@ -412,7 +520,8 @@ class NotebookTabWidget(Tabs, SpyderConfigurationAccessor):
 
         Returns
         -------
-        The file name of the notebook.
+        The new file name of the notebook, or the original file name if the
+        user did not give a new file name.
         """
         current_client = self.currentWidget()
         current_client.save()
@@ -426,25 +535,83 @@ class NotebookTabWidget(Tabs, SpyderConfigurationAccessor):
         if not filename:
             return original_path
 
-        try:
-            nb_contents = nbformat.read(original_path, as_version=4)
-        except EnvironmentError as error:
-            txt = (_("Error while reading {}<p>{}")
-                   .format(original_path, str(error)))
-            QMessageBox.critical(self, _("File Error"), txt)
-            return original_path
-        try:
-            nbformat.write(nb_contents, filename)
-        except EnvironmentError as error:
+        self._copy_count += 1
+        copy_id = self._copy_count
+        self._pending_copies[copy_id] = (
+            current_client, reopen_after_save, close_after_save)
+
+        def copy_if_saved(saved):
+            if saved:
+                self.copy_notebook(original_path, filename, copy_id)
+            else:
+                error = _('The notebook could not be saved, so it was not '
+                          'copied.')
+                self.handle_notebook_copied(
+                    original_path, filename, error, copy_id)
+
+        self.call_when_saved(current_client, copy_if_saved)
+        return filename
+
+    def copy_notebook(self, original_path, filename, copy_id):
+        """
+        Copy notebook file in a worker thread.
+
+        When the copy is done, `sig_notebook_copied` is emitted.
+
+        Parameters
+        ----------
+        original_path : str
+            File name of the notebook to be copied.
+        filename : str
+            File name of the copy.
+        copy_id : int
+            Number identifying the call to `save_as()`.
+        """
+        def copy():
+            try:
+                shutil.copyfile(original_path, filename)
+            except OSError as error:
+                self.sig_notebook_copied.emit(
+                    original_path, filename, error, copy_id)
+            else:
+                self.sig_notebook_copied.emit(
+                    original_path, filename, None, copy_id)
+
+        self._copy_executor.submit(copy)
+
+    def handle_notebook_copied(self, original_path, filename, error,
+                               copy_id):
+        """
+        Handle signal that a notebook was copied by `save_as()`.
+
+        If the copy failed, or the notebook was not copied because it could
+        not be saved, then report the error to the user and leave the
+        original tab open. Otherwise, close the original tab if
+        `close_after_save` was set in the call to `save_as()` and open a new
+        tab with the copy if `reopen_after_save` was set. If the original tab
+        was already closed and the original notebook is in `get_temp_dir()`,
+        then delete it.
+        """
+        client, reopen_after_save, close_after_save = (
+            self._pending_copies.pop(copy_id))
+
+        if error is not None:
             txt = (_("Error while writing {}<p>{}")
                    .format(filename, str(error)))
             QMessageBox.critical(self, _("File Error"), txt)
-            return original_path
+            return
+
         if close_after_save:
-            self.close_client(save_before_close=False)
+            index = self.indexOf(client)
+            if index != -1:
+                self.close_client(index, save_before_close=False)
+            elif original_path.startswith(get_temp_dir()):
+                try:
+                    remove_file_retry_if_in_use(original_path)
+                except FileNotFoundError:
+                    pass
         if reopen_after_save:
             self.create_new_client(filename=filename)
-        return filename
 
     @staticmethod
     def is_newly_created(client):
@@ -502,7 +669,7 @@ class NotebookTabWidget(Tabs, SpyderConfigurationAccessor):
         """
         return not cls.is_welcome_client(client) and client.dirty
 
-    def add_tab(self, widget):
+    def add_tab(self, widget, set_current=True):
         """
         Add tab containing some notebook widget to the tabbed widget.
 
@@ -510,18 +677,108 @@ class NotebookTabWidget(Tabs, SpyderConfigurationAccessor):
         ----------
         widget : NotebookClient
             Notebook widget to display in new tab.
+        set_current : bool, optional
+            Whether to make the new tab current. The default is True.
         """
         index = self.addTab(widget, widget.get_short_name())
-        self.setCurrentIndex(index)
+        if set_current:
+            self.setCurrentIndex(index)
         self.setTabToolTip(index, widget.get_filename())
 
+    def handle_current_changed(self, index):
+        """
+        Handle signal that the current tab changed.
+
+        Record when the previous tab was last used. If loading the notebook
+        in the new current tab was deferred, then load it now, and if the
+        tab is hibernated, then wake it up.
+
+        Parameters
+        ----------
+        index : int
+            Index of the new current tab, or -1 if there are no tabs.
+        """
+        now = time.monotonic()
+        if self._current_client is not None:
+            self._current_client.last_active = now
+        client = self.widget(index)
+        self._current_client = client
+        if client is None:
+            return
+
+        client.last_active = now
+        if client.deferred:
+            logger.debug('Loading deferred notebook %s', client.filename)
+            client.deferred = False
+            self.connect_client(client)
+        elif client.hibernated:
+            client.wake_up()
+
+    def get_background_clients(self):
+        """Return list of clients in all tabs except the current one."""
+        return [self.widget(index) for index in range(self.count())
+                if index != self.currentIndex()]
+
+    def set_hibernate_timeout(self, timeout):
+        """
+        Set time after which tabs that are not used are hibernated.
+
+        Tabs are only checked periodically if the timeout is positive.
+
+        Parameters
+        ----------
+        timeout : int
+            Number of minutes, or 0 to only hibernate tabs when memory is low.
+        """
+        self.hibernate_timeout = timeout
+        if timeout > 0:
+            self._hibernate_timer.start()
+        else:
+            self._hibernate_timer.stop()
+
+    def hibernate_idle_tabs(self):
+        """
+        Hibernate tabs that have not been used for a while.
+
+        Tabs are hibernated if they have not been current for
+        `hibernate_timeout` minutes. This function is called periodically.
+        Tabs are also hibernated when the system is low on memory, but that
+        is done by `MemoryGovernor`.
+        """
+        if self.hibernate_timeout > 0:
+            deadline = time.monotonic() - 60 * self.hibernate_timeout
+            for client in self.get_background_clients():
+                if client.last_active < deadline:
+                    client.hibernate()
+
+    def hibernate_least_recently_used(self, count=1):
+        """
+        Hibernate tabs, starting with the least recently used one.
+
+        The current tab is never hibernated.
+
+        Parameters
+        ----------
+        count : int, optional
+            Maximum number of tabs to hibernate. The default is 1.
+
+        Returns
+        -------
+        int
+            Number of tabs that were hibernated.
+        """
+        clients = [client for client in self.get_background_clients()
+                   if client.can_hibernate()]
+        clients.sort(key=lambda client: client.last_active)
+        return sum(client.hibernate() for client in clients[:count])
+
     def handle_dirty_changed(self, new_value: bool) -> None:
         """
         Handle signal that a notebook became dirty or not.
 
         Append a `*` to the filename of the notebook in the tab title if the
-        notebook is dirty. Then signal that the save actions should be
-        refreshed.
+        notebook is dirty and update `dirty_count`. Then signal that the
+        save actions should be refreshed.
 
         Parameters
         ----------
@@ -536,11 +793,30 @@ class NotebookTabWidget(Tabs, SpyderConfigurationAccessor):
             suffix = '*' if new_value else ''
             self.setTabText(index, notebook_client.get_short_name() + suffix)
             self.setTabToolTip(index, notebook_client.get_filename() + suffix)
+            self.dirty_count += 1 if new_value else -1
         self.sig_refresh_save_actions_requested.emit()
 
+    def handle_kernel_culled_changed(self, culled: bool) -> None:
+        """
+        Handle signal that the kernel of a notebook was culled or restarted.
+
+        Show a warning icon in the tab of the notebook while its kernel is
+        culled.
+
+        Parameters
+        ----------
+        culled : bool
+            Whether the kernel is now culled.
+        """
+        index = self.indexOf(self.sender())
+        if index == -1:
+            logger.warning('handle_kernel_culled_changed: Client not found!')
+            return
+        self.setTabIcon(index, ima.icon('warning') if culled else QIcon())
+
     def handle_server_started(self, process):
         """
-        Handle signal that a notebook server has started.
+        Handle signal that a notebook server has started or added a root.
 
         Go through all notebook tabs which do not have server info and try
         getting the server info for them. If that marches the server process
@@ -549,17 +825,20 @@ class NotebookTabWidget(Tabs, SpyderConfigurationAccessor):
         Parameters
         ----------
         process : ServerProcess
-            Info about the server that has started.
+            Info about the server that has started or added a root.
         """
         for client_index in range(self.count()):
             client = self.widget(client_index)
-            if not client.static and not client.server_url:
+            if (not client.static and not client.deferred
+                    and not client.server_url):
                 logger.debug('Getting server for %s', client.filename)
                 server_info = self.server_manager.get_server(
                     client.filename, process.interpreter, start=False)
                 if server_info:
                     logger.debug('Success')
-                    client.register(server_info)
+                    sessions_client = self.server_manager.register_client(
+                        client, server_info)
+                    client.register(server_info, sessions_client)
                     client.load_notebook()
 
     def handle_server_timed_out_or_error(self, process):
@@ -7,12 +7,24 @@
 
 
 # Standard library imports
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import logging
+import re
 import sys
 
 # Qt imports
+from qtpy.QtCore import QTimer, Signal
+from qtpy.QtGui import QTextCursor
 from qtpy.QtWidgets import (
-    QApplication, QComboBox, QDialogButtonBox, QFormLayout, QLineEdit,
-    QPushButton, QTextEdit, QVBoxLayout)
+    QAbstractItemView, QApplication, QComboBox, QDialogButtonBox,
+    QFormLayout, QHeaderView, QLineEdit, QPlainTextEdit, QPushButton,
+    QTableWidget, QTableWidgetItem, QVBoxLayout)
+
+# Third-party imports
+from jupyter_server.utils import url_path_join
+import psutil
+import requests
 
 # Spyder imports
 from spyder.plugins.variableexplorer.widgets.basedialog import BaseDialog
@@ -30,9 +42,171 @@ SERVER_STATE_DESCRIPTIONS = {
     ServerState.ERROR:     _('Error'),
     ServerState.TIMED_OUT: _('Timed out')}
 
+# Interval between updates of the server metrics (in ms)
+METRICS_INTERVAL = 2000
+
+# Delay before we give up on a request for server metrics (in s)
+METRICS_TIMEOUT = 2
+
+# Kernel processes have the name of their connection file on the command line
+KERNEL_CONNECTION_FILE_REGEXP = re.compile(r'kernel-([0-9a-f-]+)\.json')
+
+# Maximum number of lines shown in the log; older lines are removed
+LOG_MAX_LINES = 10000
+
+# Log levels of the server, as in the prefix of log messages like `[I ...]`
+LOG_LEVELS = {'D': 10, 'I': 20, 'W': 30, 'E': 40, 'C': 50}
+LOG_LEVEL_REGEXP = re.compile(r'\[([DIWEC]) ')
+
+# Log levels that the user can choose to filter the log with
+LOG_FILTERS = [
+    (_('All messages'), 0),
+    (_('Info and above'), LOG_LEVELS['I']),
+    (_('Warnings and errors'), LOG_LEVELS['W']),
+    (_('Errors'), LOG_LEVELS['E'])]
+
+logger = logging.getLogger(__name__)
+
+
+def collect_metrics(pid, server_info, http_session, processes):
+    """
+    Collect resource usage of a notebook server and its kernels.
+
+    This function may block, so it should be run in a worker thread.
+
+    Parameters
+    ----------
+    pid : int
+        Process id of the server.
+    server_info : dict or None
+        Server info with keys like 'url' and 'token', or None if the server
+        is not running.
+    http_session : requests.Session or None
+        HTTP session of the server, or None if the server is not running.
+    processes : dict of int to psutil.Process
+        Cache of process objects, which is updated by this function. The
+        CPU usage is computed since the last call with the same cache.
+
+    Returns
+    -------
+    dict
+        Metrics with keys `rss` (in bytes), `cpu` (in percent), `connections`
+        and `kernels`. The last one is a list of dicts with keys `id`, `name`,
+        `state`, `connections`, `rss` and `cpu`. Values that could not be
+        determined are None; if the server cannot be queried, then the list
+        of kernels is empty.
+    """
+    def usage(pid):
+        if pid not in processes:
+            processes[pid] = psutil.Process(pid)
+        process = processes[pid]
+        with process.oneshot():
+            return process.memory_info().rss, process.cpu_percent()
+
+    metrics = {'rss': None, 'cpu': None, 'connections': None, 'kernels': []}
+    kernel_pids = {}
+    try:
+        metrics['rss'], metrics['cpu'] = usage(pid)
+        for child in processes[pid].children(recursive=True):
+            try:
+                match = KERNEL_CONNECTION_FILE_REGEXP.search(
+                    ' '.join(child.cmdline()))
+            except psutil.Error:
+                continue
+            if match:
+                kernel_pids.setdefault(match.group(1), []).append(child.pid)
+    except psutil.Error as err:
+        logger.debug(f'Cannot get resource usage of process {pid}: {err}')
+        processes.pop(pid, None)
+
+    if not server_info or http_session is None:
+        return metrics
+
+    try:
+        response = http_session.get(
+            url_path_join(server_info['url'], 'api/status'),
+            timeout=METRICS_TIMEOUT)
+        response.raise_for_status()
+        status = response.json()
+        response = http_session.get(
+            url_path_join(server_info['url'], 'api/kernels'),
+            timeout=METRICS_TIMEOUT)
+        response.raise_for_status()
+        kernels = response.json()
+    except (requests.exceptions.RequestException, ValueError) as err:
+        logger.debug(f'Cannot get metrics of server {pid}: {err}')
+        return metrics
+
+    metrics['connections'] = status.get('connections')
+    for kernel in kernels:
+        kernel_metrics = {
+            'id': kernel.get('id'),
+            'name': kernel.get('name'),
+            'state': kernel.get('execution_state'),
+            'connections': kernel.get('connections'),
+            'rss': None,
+            'cpu': None
+        }
+        # The kernel may run under a wrapper like `conda run`, which has the
+        # same connection file; report the process using the most memory
+        for kernel_pid in kernel_pids.get(kernel.get('id'), []):
+            try:
+                rss, cpu = usage(kernel_pid)
+            except psutil.Error:
+                processes.pop(kernel_pid, None)
+                continue
+            if kernel_metrics['rss'] is None or rss > kernel_metrics['rss']:
+                kernel_metrics['rss'], kernel_metrics['cpu'] = rss, cpu
+        metrics['kernels'].append(kernel_metrics)
+    return metrics
+
+
+def format_bytes(num_bytes):
+    """Return human-readable description of memory size."""
+    if num_bytes is None:
+        return _('Unknown')
+    return f'{num_bytes / 2**20:.0f} MiB'
+
+
+def format_percent(percentage):
+    """Return human-readable description of CPU usage."""
+    if percentage is None:
+        return _('Unknown')
+    return f'{percentage:.0f}%'
+
+
+def format_duration(delta):
+    """Return human-readable description of a timedelta."""
+    if delta is None:
+        return _('Unknown')
+    seconds = delta.total_seconds()
+    if seconds < 60:
+        return f'{seconds:.1f} s'
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}:{minutes:02}:{seconds:02}'
+
 
 class ServerInfoDialog(BaseDialog):
-    """Dialog window showing information about notebook servers."""
+    """
+    Dialog window showing information about notebook servers.
+
+    The resource usage of the selected server and its kernels is updated
+    every METRICS_INTERVAL ms. It is collected in a worker thread, so that
+    the dialog stays responsive.
+    """
+
+    sig_metrics_collected = Signal(object, dict)
+    """
+    This signal is emitted when the metrics of a server have been collected.
+
+    Parameters
+    ----------
+    server : ServerProcess
+        Server for which the metrics were collected.
+    metrics : dict
+        Metrics, as returned by `collect_metrics()`.
+    """
 
     def __init__(self, server_info, parent=None):
         """
@@ -71,8 +245,48 @@ class ServerInfoDialog(BaseDialog):
         self.state_lineedit.setReadOnly(True)
         self.formlayout.addRow(_('State:'), self.state_lineedit)
 
-        self.log_textedit = QTextEdit(self)
+        self.uptime_lineedit = QLineEdit(self)
+        self.uptime_lineedit.setReadOnly(True)
+        self.formlayout.addRow(_('Uptime:'), self.uptime_lineedit)
+
+        self.startup_lineedit = QLineEdit(self)
+        self.startup_lineedit.setReadOnly(True)
+        self.formlayout.addRow(_('Startup duration:'), self.startup_lineedit)
+
+        self.memory_lineedit = QLineEdit(self)
+        self.memory_lineedit.setReadOnly(True)
+        self.formlayout.addRow(_('Memory:'), self.memory_lineedit)
+
+        self.cpu_lineedit = QLineEdit(self)
+        self.cpu_lineedit.setReadOnly(True)
+        self.formlayout.addRow(_('CPU:'), self.cpu_lineedit)
+
+        self.connections_lineedit = QLineEdit(self)
+        self.connections_lineedit.setReadOnly(True)
+        self.formlayout.addRow(_('Connections:'), self.connections_lineedit)
+
+        self.kernel_table = QTableWidget(0, 5, self)
+        self.kernel_table.setHorizontalHeaderLabels(
+            [_('Kernel'), _('State'), _('Connections'), _('Memory'),
+             _('CPU')])
+        self.kernel_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.kernel_table.verticalHeader().hide()
+        self.kernel_table.horizontalHeader().setSectionResizeMode(
+            QHeaderView.ResizeToContents)
+        self.layout.addWidget(self.kernel_table)
+
+        self.log_filter_combo = QComboBox(self)
+        for text, level in LOG_FILTERS:
+            self.log_filter_combo.addItem(text, level)
+        self.log_filter_combo.currentIndexChanged.connect(
+            self.apply_log_filter)
+        log_formlayout = QFormLayout()
+        log_formlayout.addRow(_('Show in log:'), self.log_filter_combo)
+        self.layout.addLayout(log_formlayout)
+
+        self.log_textedit = QPlainTextEdit(self)
         self.log_textedit.setReadOnly(True)
+        self.log_textedit.setMaximumBlockCount(LOG_MAX_LINES)
         self.layout.addWidget(self.log_textedit)
 
         self.buttonbox = QDialogButtonBox(QDialogButtonBox.Ok, self)
@@ -83,20 +297,215 @@ class ServerInfoDialog(BaseDialog):
             self.refresh_button, QDialogButtonBox.ActionRole)
         self.layout.addWidget(self.buttonbox)
 
+        self._processes = {}
+        self._metrics_future = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self.sig_metrics_collected.connect(self.show_metrics)
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.setInterval(METRICS_INTERVAL)
+        self.metrics_timer.timeout.connect(self.update_metrics)
+
         self.refresh_data()
+        self.metrics_timer.start()
+
+    def done(self, result):
+        """Stop collecting metrics when the dialog is closed."""
+        self.metrics_timer.stop()
+        self._executor.shutdown(wait=False)
+        super().done(result)
 
     def refresh_data(self):
+        """
+        Fill the list of processes again, keeping the selected server.
+
+        Every item stores its server, so that items stay correct when servers
+        are removed from the list.
+        """
+        current = self.current_server()
+        self.process_combo.blockSignals(True)
         self.process_combo.clear()
-        for server in self.servers:
-            self.process_combo.addItem(str(server.process.processId()))
-        self.select_process(0)
+        index = 0
+        for row, server in enumerate(self.servers):
+            self.process_combo.addItem(str(server.process.processId()), server)
+            if server is current:
+                index = row
+        self.process_combo.setCurrentIndex(index)
+        self.process_combo.blockSignals(False)
+        self.select_process(index)
 
     def select_process(self, index):
-        self.dir_lineedit.setText(self.servers[index].notebook_dir)
-        self.interpreter_lineedit.setText(self.servers[index].interpreter)
-        self.state_lineedit.setText(
-            SERVER_STATE_DESCRIPTIONS[self.servers[index].state])
-        self.log_textedit.setPlainText(self.servers[index].output)
+        server = self.process_combo.itemData(index)
+        if server is None:
+            return
+        if server.roots is None:
+            notebook_dir = server.notebook_dir
+        elif server.roots:
+            notebook_dir = ', '.join(server.roots)
+        else:
+            notebook_dir = _('None (idle server in pool)')
+        self.dir_lineedit.setText(notebook_dir)
+        self.interpreter_lineedit.setText(server.interpreter)
+        self.state_lineedit.setText(SERVER_STATE_DESCRIPTIONS[server.state])
+        self.log_textedit.setPlainText(self.get_output(server))
+        self._classify_log_lines(self.log_textedit.document().firstBlock())
+        self.log_textedit.moveCursor(QTextCursor.End)
+        self.show_metrics(server, {})
+        self.update_metrics()
+
+    def append_output(self, server, output):
+        """
+        Append new output of a server to the log, if the server is selected.
+
+        This only adds the new output to the log, so it is cheap even if the
+        log is long. If the log was scrolled to the end, it stays there.
+
+        Parameters
+        ----------
+        server : ServerProcess
+            Server which printed the output.
+        output : str
+            The new output.
+        """
+        if not output or server is not self.current_server():
+            return
+        scrollbar = self.log_textedit.verticalScrollBar()
+        at_end = scrollbar.value() == scrollbar.maximum()
+
+        document = self.log_textedit.document()
+        cursor = QTextCursor(document)
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(output)
+
+        # Classify the lines touched by the output, including the last line
+        # before, which may have been incomplete
+        block = document.lastBlock()
+        for __ in range(output.count('\n')):
+            if not block.previous().isValid():
+                break
+            block = block.previous()
+        self._classify_log_lines(block)
+
+        if at_end:
+            scrollbar.setValue(scrollbar.maximum())
+
+    def apply_log_filter(self):
+        """Show only log lines with at least the level selected by user."""
+        self._classify_log_lines(self.log_textedit.document().firstBlock())
+
+    def _classify_log_lines(self, block):
+        """
+        Hide or show log lines, starting at the given block, by log level.
+
+        The log level of every line is stored in its block. Lines without a
+        log level, like tracebacks, have the same level as the line before.
+        """
+        min_level = self.log_filter_combo.currentData() or 0
+        document = self.log_textedit.document()
+        start = block.position()
+        while block.isValid():
+            match = LOG_LEVEL_REGEXP.match(block.text())
+            if match:
+                level = LOG_LEVELS[match.group(1)]
+            elif block.previous().isValid():
+                level = max(block.previous().userState(), 0)
+            else:
+                level = 0
+            block.setUserState(level)
+            block.setVisible(level >= min_level)
+            block = block.next()
+        document.markContentsDirty(start, document.characterCount() - start)
+        self.log_textedit.viewport().update()
+
+    def current_server(self):
+        """Return server selected in the dialog, or None."""
+        return self.process_combo.currentData()
+
+    def update_metrics(self):
+        """
+        Start collecting metrics of the selected server in a worker thread.
+
+        If metrics are still being collected, then do nothing. When the
+        metrics are collected, `sig_metrics_collected` is emitted.
+        """
+        server = self.current_server()
+        if server is None or server.state not in (ServerState.STARTING,
+                                                  ServerState.RUNNING):
+            return
+        if self._metrics_future and not self._metrics_future.done():
+            return
+
+        pid = server.process.processId()
+        server_info = server.server_info
+        http_session = server.http_session
+
+        def collect():
+            metrics = collect_metrics(
+                pid, server_info, http_session, self._processes)
+            self.sig_metrics_collected.emit(server, metrics)
+
+        try:
+            self._metrics_future = self._executor.submit(collect)
+        except RuntimeError:
+            # Executor is shut down because the dialog is closed
+            pass
+
+    def show_metrics(self, server, metrics):
+        """
+        Display metrics of server if it is the selected server.
+
+        Parameters
+        ----------
+        server : ServerProcess
+            Server for which the metrics were collected.
+        metrics : dict
+            Metrics, as returned by `collect_metrics()`. Missing values are
+            displayed as unknown.
+        """
+        if server is not self.current_server():
+            return
+
+        if server.state in (ServerState.STARTING, ServerState.RUNNING):
+            uptime = datetime.datetime.now() - server.starttime
+        else:
+            uptime = None
+        if server.readytime:
+            startup = server.readytime - server.starttime
+        else:
+            startup = None
+        self.uptime_lineedit.setText(format_duration(uptime))
+        self.startup_lineedit.setText(format_duration(startup))
+        self.memory_lineedit.setText(format_bytes(metrics.get('rss')))
+        self.cpu_lineedit.setText(format_percent(metrics.get('cpu')))
+        connections = metrics.get('connections')
+        self.connections_lineedit.setText(
+            _('Unknown') if connections is None else str(connections))
+
+        kernels = metrics.get('kernels', [])
+        self.kernel_table.setRowCount(len(kernels))
+        for row, kernel in enumerate(kernels):
+            connections = kernel['connections']
+            texts = [
+                f'{kernel["name"]} ({kernel["id"]})',
+                kernel['state'] or _('Unknown'),
+                _('Unknown') if connections is None else str(connections),
+                format_bytes(kernel['rss']),
+                format_percent(kernel['cpu'])]
+            for column, text in enumerate(texts):
+                self.kernel_table.setItem(
+                    row, column, QTableWidgetItem(text))
+
+    @staticmethod
+    def get_output(server):
+        """Return output of server, with a note if it is truncated."""
+        output_buffer = server.output_buffer
+        if not output_buffer.truncated:
+            return output_buffer.getvalue()
+        if output_buffer.log_filename:
+            note = _('Earlier output is discarded; the full output is '
+                     'in {}').format(output_buffer.log_filename)
+        else:
+            note = _('Earlier output is discarded')
+        return f'[{note}]\n{output_buffer.getvalue()}'
 
 
 def test():  # pragma: no cover
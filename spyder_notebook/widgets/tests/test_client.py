@@ -5,6 +5,9 @@
 
 """Tests for client.py covering NotebookClient."""
 
+# Standard library imports
+import os.path as osp
+
 # Third-party imports
 import pytest
 from qtpy.QtCore import QUrl
@@ -12,7 +15,7 @@ from qtpy.QtWidgets import QWidget
 import requests
 
 # Local imports
-from spyder_notebook.widgets.client import NotebookClient
+from spyder_notebook.widgets.client import NotebookClient, prepare_cache_dir
 
 
 class MockPlugin(QWidget):
@@ -124,3 +127,226 @@ def test_notebookclient_get_kernel_id_with_exception(plugin, mocker):
     plugin.client.get_kernel_id()
 
     MockMessageBox.warning.assert_called()
+
+
+def test_notebookclient_get_kernel_id_reported_by_notebook(plugin, mocker):
+    """Test that NotebookClient.get_kernel_id() returns the kernel id reported
+    by the notebook without sending a request, and that the kernel id is
+    recorded in the sessions client."""
+    mock_get = mocker.patch('requests.get')
+    sessions_client = mocker.Mock()
+    plugin.client.sessions_client = sessions_client
+
+    plugin.client.notebookwidget.on_message_received(
+        {'type': 'kernel', 'value': '42'})
+    kernel_id = plugin.client.get_kernel_id()
+
+    assert kernel_id == '42'
+    sessions_client.set_kernel_id.assert_called_once_with('ham.ipynb', '42')
+    mock_get.assert_not_called()
+
+
+def test_notebookclient_get_kernel_id_from_sessions_client(plugin, mocker):
+    """Test that NotebookClient.get_kernel_id() looks up the kernel id in the
+    index of the sessions client without sending a request."""
+    mock_get = mocker.patch('requests.get')
+    sessions_client = mocker.Mock()
+    sessions_client.get_kernel_id.return_value = '42'
+    plugin.client.sessions_client = sessions_client
+
+    kernel_id = plugin.client.get_kernel_id()
+
+    assert kernel_id == '42'
+    sessions_client.get_kernel_id.assert_called_once_with('ham.ipynb')
+    mock_get.assert_not_called()
+
+
+def test_notebookclient_get_kernel_id_not_in_sessions_client(plugin, mocker):
+    """Test that NotebookClient.get_kernel_id() returns None without
+    sending a request if the kernel id is not in the index of the sessions
+    client."""
+    mock_get = mocker.patch('requests.get')
+    sessions_client = mocker.Mock()
+    sessions_client.get_kernel_id.return_value = None
+    plugin.client.sessions_client = sessions_client
+
+    kernel_id = plugin.client.get_kernel_id()
+
+    assert kernel_id is None
+    mock_get.assert_not_called()
+    sessions_client.http_session.get.assert_not_called()
+
+
+def test_notebookclient_shutdown_kernel_with_sessions_client(plugin, mocker):
+    """Test that NotebookClient.shutdown_kernel() lets the sessions client
+    shut down the kernel instead of sending a request itself."""
+    mock_delete = mocker.patch('requests.delete')
+    sessions_client = mocker.Mock()
+    plugin.client.sessions_client = sessions_client
+    plugin.client.kernel_id = '42'
+
+    plugin.client.shutdown_kernel()
+
+    sessions_client.shutdown_kernel.assert_called_once_with('42')
+    mock_delete.assert_not_called()
+    assert plugin.client.kernel_id is None
+
+
+def test_notebookclient_shutdown_kernel_not_in_sessions_client(
+        plugin, mocker):
+    """Test that NotebookClient.shutdown_kernel() asks the sessions client
+    for the kernel id in the background if it is not known yet, and shuts
+    down the kernel once the id is known."""
+    sessions_client = mocker.Mock()
+    plugin.client.sessions_client = sessions_client
+    plugin.client.kernel_id = None
+
+    plugin.client.shutdown_kernel()
+
+    sessions_client.request_kernel_id.assert_called_once_with(
+        'ham.ipynb', mocker.ANY)
+    sessions_client.shutdown_kernel.assert_not_called()
+    function = sessions_client.request_kernel_id.call_args[0][1]
+    function('42')
+    sessions_client.shutdown_kernel.assert_called_once_with('42')
+
+
+def test_notebookclient_empty_reported_by_notebook(plugin):
+    """Test that NotebookClient.empty follows what the notebook reports."""
+    plugin.client.notebookwidget.on_message_received(
+        {'type': 'empty', 'value': True})
+    assert plugin.client.empty
+
+    plugin.client.notebookwidget.on_message_received(
+        {'type': 'empty', 'value': False})
+    assert not plugin.client.empty
+
+
+def test_notebookclient_can_discard(plugin):
+    """Test that a notebook which was never loaded can be discarded, but
+    that a loaded notebook can only be discarded after it reports that it is
+    empty."""
+    client = plugin.client
+    assert client.empty is None
+    assert client.can_discard()
+
+    client.load_notebook()
+    assert not client.can_discard()
+
+    client.notebookwidget.on_message_received(
+        {'type': 'empty', 'value': True})
+    assert client.can_discard()
+
+
+def test_notebookclient_saved_reported_by_notebook(plugin, qtbot):
+    """Test that NotebookClient emits sig_saved and clears save_pending when
+    the notebook reports that it is saved."""
+    plugin.client.save_pending = True
+
+    with qtbot.waitSignal(plugin.client.sig_saved) as blocker:
+        plugin.client.notebookwidget.on_messages_received(
+            [{'type': 'saved', 'value': True}])
+
+    assert blocker.args == [True]
+    assert not plugin.client.save_pending
+
+
+def test_notebookclient_save_pending_cleared(plugin, qtbot):
+    """Test that NotebookClient clears save_pending if the notebook does not
+    confirm the save in time, or if the page is reloaded."""
+    client = plugin.client
+    client._save_timer.setInterval(10)
+
+    client.save()
+    assert client.save_pending
+    qtbot.waitUntil(lambda: not client.save_pending)
+
+    client.save()
+    client.notebookwidget.loadStarted.emit()
+    assert not client.save_pending
+
+
+def test_notebookwidget_unknown_message(plugin, qtbot):
+    """Test that NotebookWidget ignores unknown messages."""
+    nbwidget = plugin.client.notebookwidget
+
+    with qtbot.assertNotEmitted(nbwidget.sig_dirty_changed):
+        nbwidget.on_messages_received([{'type': 'spam'}, 'eggs'])
+
+
+def test_notebookclient_save_sends_command(plugin, qtbot):
+    """Test that NotebookClient.save() sends the save command to the page."""
+    bridge = plugin.client.notebookwidget.page().bridge
+
+    with qtbot.waitSignal(bridge.sig_command_sent) as blocker:
+        plugin.client.save()
+
+    assert blocker.args == [{'type': 'save'}]
+
+
+def test_notebookclient_kernel_culled(plugin, qtbot):
+    """Test that NotebookClient shows that its kernel is culled if the last
+    kernel reported by the notebook is culled, and that it no longer does so
+    when the notebook reports a new kernel."""
+    client = plugin.client
+    client.notebookwidget.on_message_received(
+        {'type': 'kernel', 'value': '42'})
+    client.notebookwidget.on_message_received(
+        {'type': 'kernel', 'value': ''})
+
+    client._handle_kernels_culled(['7'])
+    assert not client.kernel_culled
+
+    with qtbot.waitSignal(client.sig_kernel_culled_changed) as blocker:
+        client._handle_kernels_culled(['7', '42'])
+    assert blocker.args == [True]
+    assert client.kernel_culled
+    assert not client.culled_bar.isHidden()
+
+    with qtbot.waitSignal(client.sig_kernel_culled_changed) as blocker:
+        client.notebookwidget.on_message_received(
+            {'type': 'kernel', 'value': '43'})
+    assert blocker.args == [False]
+    assert client.culled_bar.isHidden()
+
+
+def test_notebookclient_restart_kernel_sends_command(plugin, qtbot):
+    """Test that NotebookClient.restart_kernel() sends the command to restart
+    the kernel to the page."""
+    bridge = plugin.client.notebookwidget.page().bridge
+
+    with qtbot.waitSignal(bridge.sig_command_sent) as blocker:
+        plugin.client.restart_kernel()
+
+    assert blocker.args == [{'type': 'restart_kernel'}]
+
+
+def test_prepare_cache_dir_removes_stale_caches(tmp_path):
+    """Test that prepare_cache_dir() keeps only cache for current version."""
+    (tmp_path / 'old' / 'Cache').mkdir(parents=True)
+    (tmp_path / 'new' / 'Cache').mkdir(parents=True)
+
+    cache_dir = prepare_cache_dir(str(tmp_path), 'new')
+
+    assert cache_dir == osp.join(str(tmp_path), 'new')
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['new']
+    assert (tmp_path / 'new' / 'Cache').is_dir()
+
+
+def test_notebookwidget_uses_notebook_profile(plugin):
+    """Test that notebook pages use the shared persistent profile."""
+    page = plugin.client.notebookwidget.page()
+
+    assert page.profile().storageName() == 'spyder-notebook'
+    assert not page.profile().isOffTheRecord()
+
+
+def test_notebookwidget_paint_reported_by_notebook(plugin, qtbot):
+    """Test that NotebookWidget emits sig_painted on a paint message."""
+    nbwidget = plugin.client.notebookwidget
+
+    with qtbot.waitSignal(nbwidget.sig_painted) as blocker:
+        nbwidget.on_messages_received(
+            [{'type': 'paint', 'value': 'first-contentful-paint'}])
+
+    assert blocker.args == ['first-contentful-paint']
@@ -167,7 +167,7 @@ def test_save_notebook_as_with_error(main_widget, mocker, qtbot, tmpdir):
     name = osp.join(str(tmpdir), 'save.ipynb')
     mocker.patch('spyder_notebook.widgets.notebooktabwidget.getsavefilename',
                  return_value=(name, 'ignored'))
-    mocker.patch('spyder_notebook.widgets.notebooktabwidget.nbformat.write',
+    mocker.patch('spyder_notebook.widgets.notebooktabwidget.shutil.copyfile',
                  side_effect=PermissionError)
     mock_critical = mocker.patch('spyder_notebook.widgets.notebooktabwidget'
                                  '.QMessageBox.critical')
@@ -175,8 +175,8 @@ def test_save_notebook_as_with_error(main_widget, mocker, qtbot, tmpdir):
     # Save the notebook
     main_widget.save_as()
 
-    # Assert that message box is displayed (reporting error raised by write)
-    assert mock_critical.called
+    # Assert that message box is displayed (reporting error raised by copy)
+    qtbot.waitUntil(lambda: mock_critical.called)
 
 
 @pytest.mark.flaky(max_runs=5)
@@ -202,7 +202,7 @@ def test_shutdown_notebook_kernel(main_widget, qtbot):
     main_widget.tabwidget.close_client()
 
     # Assert that the kernel is down for the closed client
-    assert not is_kernel_up(kernel_id, sessions_url)
+    qtbot.waitUntil(lambda: not is_kernel_up(kernel_id, sessions_url))
 
 
 @pytest.mark.flaky
@@ -223,14 +223,14 @@ def test_open_console_when_no_kernel(main_widget, qtbot, mocker):
     kernel_id = client.get_kernel_id()
     sessions_url = client.get_session_url()
     client.shutdown_kernel()
-    assert not is_kernel_up(kernel_id, sessions_url)
+    qtbot.waitUntil(lambda: not is_kernel_up(kernel_id, sessions_url))
 
     # Try opening a console and check corresponding signal is not emitted
     with qtbot.assertNotEmitted(main_widget.sig_open_console_requested):
         main_widget.open_console(client)
 
-    # Assert that a dialog is displayed and no console was opened
-    MockMessageBox.critical.assert_called()
+        # Assert that a dialog is displayed and no console was opened
+        qtbot.waitUntil(lambda: MockMessageBox.critical.called)
 
 
 def test_file_in_temp_dir_deleted_after_notebook_closed(main_widget, qtbot):
@@ -249,8 +249,8 @@ def test_file_in_temp_dir_deleted_after_notebook_closed(main_widget, qtbot):
     # Close the current client
     main_widget.tabwidget.close_client()
 
-    # Assert file is deleted
-    assert not osp.exists(filename)
+    # Assert file is deleted once the notebook confirms that it is saved
+    qtbot.waitUntil(lambda: not osp.exists(filename))
 
 
 @pytest.mark.flaky(max_runs=3)
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © Spyder Project Contributors
+# Licensed under the terms of the MIT License
+
+"""Tests for memorygovernor.py."""
+
+# Third party imports
+import pytest
+from qtpy.QtCore import Qt
+
+# Local imports
+from spyder_notebook.utils.servermanager import ServerProcess, ServerState
+from spyder_notebook.widgets.memorygovernor import (
+    CullKernelsDialog, GovernorStage, MemoryGovernor)
+
+
+def make_kernel(kernel_id, state, rss):
+    """Return kernel metrics as returned by collect_metrics()."""
+    return {'id': kernel_id, 'name': 'python3', 'state': state,
+            'connections': 1, 'rss': rss, 'cpu': 0.0}
+
+
+@pytest.fixture
+def memory_percent(mocker):
+    """Fake percentage of memory in use, which can be set by the test."""
+    virtual_memory = mocker.patch(
+        'spyder_notebook.widgets.memorygovernor.psutil.virtual_memory')
+    virtual_memory.return_value.percent = 50
+    return virtual_memory.return_value
+
+
+@pytest.fixture
+def governor(mocker, qtbot, memory_percent):
+    """Construct a MemoryGovernor with fake tab widget and server manager."""
+    clients = [mocker.Mock(kernel_id=kernel_id, filename=f'{name}.ipynb')
+               for kernel_id, name in [('1', 'ham'), ('2', 'spam'),
+                                       ('3', 'eggs'), (None, 'welcome')]]
+    tabwidget = mocker.Mock(
+        count=mocker.Mock(return_value=len(clients)),
+        widget=mocker.Mock(side_effect=lambda index: clients[index]),
+        get_background_clients=mocker.Mock(return_value=clients[1:]),
+        hibernate_least_recently_used=mocker.Mock(return_value=0))
+    server_manager = mocker.Mock(servers=[])
+    res = MemoryGovernor(tabwidget, server_manager)
+    res.clients = clients
+    yield res
+    res.close()
+
+
+def test_check_memory_when_not_low(governor, memory_percent):
+    """Test that .check_memory() does nothing if memory is not low."""
+    governor.check_memory()
+
+    governor.tabwidget.hibernate_least_recently_used.assert_not_called()
+    assert governor.stage == GovernorStage.NORMAL
+
+
+def test_check_memory_takes_graduated_steps(mocker, qtbot, governor,
+                                            memory_percent):
+    """Test that .check_memory() first hibernates tabs while it can, then
+    warns the user, then collects kernel usage, and that it starts again
+    when memory is no longer low."""
+    mock_collect = mocker.patch.object(governor, 'collect_kernel_usage')
+    hibernate = governor.tabwidget.hibernate_least_recently_used
+    memory_percent.percent = 95
+
+    hibernate.return_value = 2
+    governor.check_memory()
+    hibernate.assert_called_once_with(3)
+    assert governor.stage == GovernorStage.HIBERNATED
+
+    hibernate.return_value = 0
+    with qtbot.waitSignal(governor.sig_memory_low) as blocker:
+        governor.check_memory()
+    assert blocker.args == [95]
+    assert governor.stage == GovernorStage.WARNED
+    mock_collect.assert_not_called()
+
+    with qtbot.assertNotEmitted(governor.sig_memory_low):
+        governor.check_memory()
+    mock_collect.assert_called_once()
+
+    memory_percent.percent = 88
+    governor.check_memory()
+    assert governor.stage == GovernorStage.WARNED
+
+    memory_percent.percent = 80
+    governor.check_memory()
+    assert governor.stage == GovernorStage.NORMAL
+
+
+def test_collect_kernel_usage(mocker, qtbot, governor):
+    """Test that .collect_kernel_usage() collects the kernel metrics of all
+    running servers in the background."""
+    class FakeProcess:
+        def __init__(self, pid):
+            self.pid = pid
+
+        def processId(self):
+            return self.pid
+
+    session = mocker.Mock()
+    governor.server_manager.servers = [
+        ServerProcess(FakeProcess(42), '/dir', 'python', 'info1.json',
+                      state=ServerState.RUNNING, server_info={'url': 'a'},
+                      http_session=session),
+        ServerProcess(FakeProcess(404), '/dir', 'python', 'info2.json',
+                      state=ServerState.FINISHED)]
+    mock_collect_metrics = mocker.patch(
+        'spyder_notebook.widgets.memorygovernor.collect_metrics',
+        return_value={'kernels': [make_kernel('1', 'idle', 100)]})
+    mocker.patch.object(governor, '_offer_cull')
+
+    with qtbot.waitSignal(governor.sig_kernel_usage_collected) as blocker:
+        governor.collect_kernel_usage()
+
+    assert blocker.args == [[make_kernel('1', 'idle', 100)]]
+    mock_collect_metrics.assert_called_once_with(
+        42, {'url': 'a'}, session, governor._processes)
+
+
+def test_offer_cull(qtbot, governor, memory_percent):
+    """Test that idle kernels of notebooks in tabs are offered for culling,
+    with the largest kernel first."""
+    governor.stage = GovernorStage.WARNED
+    memory_percent.percent = 95
+    kernels = [make_kernel('1', 'idle', 100), make_kernel('2', 'busy', 500),
+               make_kernel('3', 'idle', 300), make_kernel('4', 'idle', 900)]
+
+    with qtbot.waitSignal(governor.sig_cull_offered) as blocker:
+        governor._offer_cull(kernels)
+
+    clients = governor.clients
+    assert blocker.args == [[(clients[2], 300), (clients[0], 100)]]
+    assert governor.stage == GovernorStage.CULL_OFFERED
+
+
+def test_offer_cull_when_memory_recovered(qtbot, governor, memory_percent):
+    """Test that nothing is offered if memory is no longer low."""
+    governor.stage = GovernorStage.WARNED
+
+    with qtbot.assertNotEmitted(governor.sig_cull_offered):
+        governor._offer_cull([make_kernel('1', 'idle', 100)])
+
+
+def test_cull_kernels(governor):
+    """Test that .cull_kernels() shuts down the kernels of the clients and
+    marks them as culled."""
+    client = governor.clients[0]
+
+    governor.cull_kernels([client])
+
+    client.shutdown_kernel.assert_called_once_with()
+    client.set_kernel_culled.assert_called_once_with(True)
+
+
+def test_cull_kernels_dialog(mocker, qtbot):
+    """Test that CullKernelsDialog lists the notebooks and initially only
+    selects the largest kernel."""
+    clients = [mocker.Mock(**{'get_short_name.return_value': name,
+                              'get_filename.return_value': f'{name}.ipynb'})
+               for name in ['ham', 'spam']]
+    dialog = CullKernelsDialog([(clients[0], 2**30), (clients[1], 2**20)])
+    qtbot.addWidget(dialog)
+
+    assert dialog.kernel_list.count() == 2
+    assert dialog.kernel_list.item(0).text() == 'ham (1024 MiB)'
+    assert dialog.selected_clients() == [clients[0]]
+
+    dialog.kernel_list.item(1).setCheckState(Qt.Checked)
+    assert dialog.selected_clients() == clients
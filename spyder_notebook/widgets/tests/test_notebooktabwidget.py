@@ -12,12 +12,10 @@ import os.path as osp
 # Third party imports
 import pytest
 from qtpy.QtWidgets import QMessageBox
-from nbformat.reader import NotJSONError
 
 # Local imports
 from spyder_notebook.utils.servermanager import ServerManager
-from spyder_notebook.widgets.notebooktabwidget import (
-    NotebookTabWidget, WAIT_SAVE_ITERATIONS)
+from spyder_notebook.widgets.notebooktabwidget import NotebookTabWidget
 
 
 @pytest.fixture
@@ -27,8 +25,6 @@ def tabwidget(mocker, qtbot):
         return collections.defaultdict(
             str, filename=filename, root_dir=osp.dirname(filename))
 
-    mocker.patch(
-        'spyder_notebook.widgets.notebooktabwidget.WAIT_SAVE_DELAY', 1)
     fake_server_manager = mocker.Mock(
         spec=ServerManager, get_server=fake_get_server)
     widget = NotebookTabWidget(None, fake_server_manager)
@@ -38,52 +34,52 @@ def tabwidget(mocker, qtbot):
 
 def test_save_notebook_with_opened_notebook(mocker, tabwidget):
     """Test that .save_notebook() with a notebook opened from a file does
-    indeed save the notebook but does not check whether it is empty."""
+    indeed save the notebook but does not ask to save it again, even if it is
+    not empty."""
+    mock_question = mocker.patch(
+        'spyder_notebook.widgets.notebooktabwidget.QMessageBox.question')
     client = tabwidget.create_new_client('ham.ipynb')
     client.save = mocker.Mock()
-    tabwidget.wait_and_check_if_empty = mocker.Mock()
+    client.empty = False
 
     result = tabwidget.save_notebook(client)
 
     client.save.assert_called()
-    tabwidget.wait_and_check_if_empty.assert_not_called()
+    mock_question.assert_not_called()
     assert result == 'ham.ipynb'
 
 
 def test_save_notebook_with_empty_new_notebook(mocker, tabwidget):
     """Test that .save_notebook() on a newly created notebook saves the
-    notebook, checks that it is empty, and it is, does not ask to save it
-    again."""
+    notebook, and if it is empty, does not ask to save it again."""
     mock_question = mocker.patch(
         'spyder_notebook.widgets.notebooktabwidget.QMessageBox.question')
     client = tabwidget.create_new_client()
     client.save = mocker.Mock()
-    tabwidget.wait_and_check_if_empty = mocker.Mock(return_value=True)
+    client.empty = True
 
     result = tabwidget.save_notebook(client)
 
     client.save.assert_called()
-    tabwidget.wait_and_check_if_empty.assert_called()
     mock_question.assert_not_called()
     assert result.endswith('untitled0.ipynb')
 
 
 def test_save_notebook_with_nonempty_new_notebook_and_save(mocker, tabwidget):
     """Test that .save_notebook() on a newly created notebook saves the
-    notebook, checks that it is empty, and if it is, asks to save it again,
+    notebook, and if it is not empty, asks to save it again,
     and if yes, does save it under a new name."""
     mock_question = mocker.patch(
         'spyder_notebook.widgets.notebooktabwidget.QMessageBox.question',
         return_value=QMessageBox.Yes)
     client = tabwidget.create_new_client()
     client.save = mocker.Mock()
-    tabwidget.wait_and_check_if_empty = mocker.Mock(return_value=False)
+    client.empty = False
     tabwidget.save_as = mocker.Mock(return_value='newname.ipynb')
 
     result = tabwidget.save_notebook(client)
 
     client.save.assert_called()
-    tabwidget.wait_and_check_if_empty.assert_called_once()
     mock_question.assert_called_once()
     tabwidget.save_as.assert_called_once()
     assert result == 'newname.ipynb'
@@ -92,82 +88,257 @@ def test_save_notebook_with_nonempty_new_notebook_and_save(mocker, tabwidget):
 def test_save_notebook_with_nonempty_new_notebook_and_no_save(
             mocker, tabwidget):
     """Test that .save_notebook() on a newly created notebook saves the
-    notebook, checks that it is empty, and if it is, asks to save it again,
+    notebook, and if it is not empty, asks to save it again,
     and if no, does not save it under a new name."""
     mock_question = mocker.patch(
         'spyder_notebook.widgets.notebooktabwidget.QMessageBox.question',
         return_value=QMessageBox.No)
     client = tabwidget.create_new_client()
     client.save = mocker.Mock()
-    tabwidget.wait_and_check_if_empty = mocker.Mock(return_value=False)
+    client.empty = False
     tabwidget.save_as = mocker.Mock(return_value='newname.ipynb')
 
     result = tabwidget.save_notebook(client)
 
     client.save.assert_called()
-    tabwidget.wait_and_check_if_empty.assert_called_once()
     mock_question.assert_called_once()
     tabwidget.save_as.assert_not_called()
     assert result.endswith('untitled0.ipynb')
 
 
-def test_wait_and_check_if_empty_when_empty(mocker, tabwidget):
-    """Test that .wait_and_check_if_empty() returns True when called on a
-    notebook that is empty."""
-    contents = {'cells': []}
-    mock_read = mocker.patch(
-        'spyder_notebook.widgets.notebooktabwidget.nbformat.read',
-        return_value=contents)
+def test_close_client_waits_for_save(mocker, tabwidget, qtbot):
+    """Test that .close_client() removes the tab immediately, but only closes
+    the client after the notebook confirms that it is saved."""
+    client = tabwidget.create_new_client('ham.ipynb')
+    client.save = mocker.Mock()
+    client.shutdown_kernel = mocker.Mock()
+    client.close = mocker.Mock()
+    client.save_pending = True
+
+    tabwidget.close_client()
+
+    assert tabwidget.indexOf(client) == -1
+    client.close.assert_not_called()
+    client.sig_saved.emit(True)
+    client.close.assert_called_once()
 
-    result = tabwidget.wait_and_check_if_empty('ham.ipynb')
 
-    mock_read.assert_called_once()
-    assert result is True
+def test_close_client_without_pending_save(mocker, tabwidget):
+    """Test that .close_client() closes the client immediately if the
+    notebook is not being saved."""
+    client = tabwidget.create_new_client('ham.ipynb')
+    client.shutdown_kernel = mocker.Mock()
+    client.close = mocker.Mock()
+
+    tabwidget.close_client(save_before_close=False)
+
+    client.close.assert_called_once()
+
 
+def test_close_client_when_saved_with_timeout(mocker, tabwidget, qtbot):
+    """Test that .close_client_when_saved() closes the client after a
+    timeout if the notebook never confirms that it is saved, and that it
+    closes the client only once."""
+    mocker.patch(
+        'spyder_notebook.widgets.notebooktabwidget.SAVE_TIMEOUT', 10)
+    client = tabwidget.create_new_client('ham.ipynb')
+    client.close = mocker.Mock()
+    client.save_pending = True
 
-def test_wait_and_check_if_empty_when_not_empty(mocker, tabwidget):
-    """Test that .wait_and_check_if_empty() returns False when called on a
-    notebook that is not empty."""
-    contents = {'cells': [{'source': 'not empty'}]}
-    mock_read = mocker.patch(
-        'spyder_notebook.widgets.notebooktabwidget.nbformat.read',
-        return_value=contents)
+    tabwidget.close_client_when_saved(client, 'ham.ipynb')
 
-    result = tabwidget.wait_and_check_if_empty('ham.ipynb')
+    qtbot.waitUntil(lambda: client.close.called)
+    client.sig_saved.emit(True)
+    client.close.assert_called_once()
 
-    mock_read.assert_called_once()
-    assert result is False
 
+def test_save_as_copies_when_saved(mocker, tabwidget, qtbot):
+    """Test that .save_as() copies the notebook once it is saved and then
+    closes the original tab and opens a tab with the copy."""
+    mocker.patch(
+        'spyder_notebook.widgets.notebooktabwidget.getsavefilename',
+        return_value=('spam.ipynb', 'ignored'))
+    mock_copy = mocker.patch(
+        'spyder_notebook.widgets.notebooktabwidget.shutil.copyfile')
+    client = tabwidget.create_new_client('ham.ipynb')
+    client.save = mocker.Mock()
+    client.shutdown_kernel = mocker.Mock()
+    client.save_pending = True
+
+    result = tabwidget.save_as()
+
+    assert result == 'spam.ipynb'
+    mock_copy.assert_not_called()
+    client.sig_saved.emit(True)
+    qtbot.waitUntil(lambda: tabwidget.indexOf(client) == -1)
+    mock_copy.assert_called_once_with('ham.ipynb', 'spam.ipynb')
+    filenames = [tabwidget.widget(index).filename
+                 for index in range(tabwidget.count())]
+    assert 'spam.ipynb' in filenames
+
+
+def test_save_as_when_save_fails(mocker, tabwidget, qtbot):
+    """Test that .save_as() reports an error and does not copy the notebook
+    if the notebook could not be saved."""
+    mocker.patch(
+        'spyder_notebook.widgets.notebooktabwidget.getsavefilename',
+        return_value=('spam.ipynb', 'ignored'))
+    mock_copy = mocker.patch(
+        'spyder_notebook.widgets.notebooktabwidget.shutil.copyfile')
+    mock_critical = mocker.patch(
+        'spyder_notebook.widgets.notebooktabwidget.QMessageBox.critical')
+    client = tabwidget.create_new_client('ham.ipynb')
+    client.save = mocker.Mock()
+    client.save_pending = True
+
+    tabwidget.save_as()
+    client.sig_saved.emit(False)
+
+    mock_critical.assert_called_once()
+    mock_copy.assert_not_called()
+    assert tabwidget.indexOf(client) != -1
+
+
+def test_save_as_twice_to_same_file(mocker, tabwidget, qtbot):
+    """Test that .save_as() can be used twice with the same file name before
+    the first copy is done."""
+    mocker.patch(
+        'spyder_notebook.widgets.notebooktabwidget.getsavefilename',
+        return_value=('spam.ipynb', 'ignored'))
+    mock_copy = mocker.patch(
+        'spyder_notebook.widgets.notebooktabwidget.shutil.copyfile')
+    client = tabwidget.create_new_client('ham.ipynb')
+    client.save = mocker.Mock()
+    client.shutdown_kernel = mocker.Mock()
+    client.save_pending = True
+
+    tabwidget.save_as(reopen_after_save=False, close_after_save=False)
+    tabwidget.save_as(reopen_after_save=False, close_after_save=False)
+    client.sig_saved.emit(True)
+
+    qtbot.waitUntil(lambda: not tabwidget._pending_copies)
+    assert mock_copy.call_count == 2
+
+
+def test_save_as_with_error(mocker, tabwidget, qtbot):
+    """Test that .save_as() reports an error when copying the notebook fails
+    and leaves the original tab open."""
+    mocker.patch(
+        'spyder_notebook.widgets.notebooktabwidget.getsavefilename',
+        return_value=('spam.ipynb', 'ignored'))
+    mocker.patch(
+        'spyder_notebook.widgets.notebooktabwidget.shutil.copyfile',
+        side_effect=PermissionError)
+    mock_critical = mocker.patch(
+        'spyder_notebook.widgets.notebooktabwidget.QMessageBox.critical')
+    client = tabwidget.create_new_client('ham.ipynb')
+    client.save = mocker.Mock()
+
+    tabwidget.save_as()
+
+    qtbot.waitUntil(lambda: mock_critical.called)
+    assert tabwidget.indexOf(client) != -1
+
+
+def test_open_notebook_deferred(tabwidget):
+    """Test that .open_notebook() with deferred=True only loads the notebook
+    in the current tab and loads the others when their tab becomes current."""
+    tabwidget.open_notebook(['ham.ipynb', 'spam.ipynb'], deferred=True)
+    ham_client = tabwidget.widget(0)
+    spam_client = tabwidget.widget(1)
+
+    assert tabwidget.currentWidget() == spam_client
+    assert ham_client.deferred and ham_client.path is None
+    assert not spam_client.deferred and spam_client.path is not None
+
+    tabwidget.setCurrentIndex(0)
+
+    assert not ham_client.deferred and ham_client.path is not None
+
+
+def test_hibernate_least_recently_used(mocker, tabwidget):
+    """Test that .hibernate_least_recently_used() hibernates the background
+    tab that was used least recently."""
+    clients = [tabwidget.create_new_client(name)
+               for name in ['ham.ipynb', 'spam.ipynb', 'eggs.ipynb']]
+    for client, last_active in zip(clients, [20, 10, 30]):
+        client.last_active = last_active
+        client.can_hibernate = mocker.Mock(return_value=True)
+        client.hibernate = mocker.Mock(return_value=True)
+
+    result = tabwidget.hibernate_least_recently_used()
+
+    assert result == 1
+    clients[0].hibernate.assert_not_called()
+    clients[1].hibernate.assert_called_once()
+    clients[2].hibernate.assert_not_called()  # current tab
+
+
+def test_set_hibernate_timeout(tabwidget):
+    """Test that .set_hibernate_timeout() only checks tabs periodically if
+    the timeout is positive."""
+    tabwidget.set_hibernate_timeout(0)
+    assert not tabwidget._hibernate_timer.isActive()
+
+    tabwidget.set_hibernate_timeout(10)
+    assert tabwidget._hibernate_timer.isActive()
+    assert tabwidget.hibernate_timeout == 10
+
+
+def test_hibernate_idle_tabs(mocker, tabwidget):
+    """Test that .hibernate_idle_tabs() hibernates tabs which were not used
+    for longer than the timeout."""
+    tabwidget.hibernate_timeout = 1
+    clients = [tabwidget.create_new_client(name)
+               for name in ['ham.ipynb', 'spam.ipynb', 'eggs.ipynb']]
+    mocker.patch('spyder_notebook.widgets.notebooktabwidget.time.monotonic',
+                 return_value=1000)
+    for client, last_active in zip(clients, [900, 990, 0]):
+        client.last_active = last_active
+        client.hibernate = mocker.Mock()
+
+    tabwidget.hibernate_idle_tabs()
+
+    clients[0].hibernate.assert_called_once()
+    clients[1].hibernate.assert_not_called()
+    clients[2].hibernate.assert_not_called()  # current tab
+
+
+def test_wake_up_when_tab_becomes_current(mocker, tabwidget):
+    """Test that a hibernated tab is woken up when it becomes current."""
+    client = tabwidget.create_new_client('ham.ipynb')
+    tabwidget.create_new_client('spam.ipynb')
+    client.hibernated = True
+    client.wake_up = mocker.Mock()
+
+    tabwidget.setCurrentIndex(0)
 
-@pytest.mark.parametrize('exception', [FileNotFoundError, NotJSONError])
-def test_wait_and_check_if_empty_with_delay(mocker, tabwidget, exception):
-    """Test that .wait_and_check_if_empty() on an empty notebook tries to read
-    it, and when that fails because the file does not exist or is not JSON, it
-    tries again to read it. When the read succeeds the second time and the
-    notebook turns out to be empty, the function returns True."""
-    contents = {'cells': []}
-    mock_read = mocker.patch(
-        'spyder_notebook.widgets.notebooktabwidget.nbformat.read',
-        side_effect=[exception, contents])
+    client.wake_up.assert_called_once()
 
-    result = tabwidget.wait_and_check_if_empty('ham.ipynb')
 
-    assert mock_read.call_count == 2
-    assert result is True
+def test_dirty_count(mocker, tabwidget, qtbot):
+    """Test that the tab widget counts the dirty notebooks, ignoring repeated
+    messages, and that closing a dirty notebook decreases the count."""
+    ham_client = tabwidget.create_new_client('ham.ipynb')
+    spam_client = tabwidget.create_new_client('spam.ipynb')
+    dirty_message = {'type': 'dirty', 'value': True}
 
+    ham_client.notebookwidget.on_message_received(dirty_message)
+    ham_client.notebookwidget.on_message_received(dirty_message)
+    spam_client.notebookwidget.on_message_received(dirty_message)
 
-def test_wait_and_check_with_long_delay(mocker, tabwidget):
-    """Test that .wait_and_check_if_empty() repeatedly tries to read the file,
-    and when that keeps failing because the file does not exists, eventually
-    gives up and returns True."""
-    mock_read = mocker.patch(
-        'spyder_notebook.widgets.notebooktabwidget.nbformat.read',
-        side_effect=FileNotFoundError)
+    assert tabwidget.dirty_count == 2
+    assert tabwidget.tabText(0) == 'ham*'
 
-    result = tabwidget.wait_and_check_if_empty('ham.ipynb')
+    spam_client.notebookwidget.on_message_received(
+        {'type': 'dirty', 'value': False})
+    assert tabwidget.dirty_count == 1
 
-    assert mock_read.call_count == WAIT_SAVE_ITERATIONS
-    assert result is True
+    ham_client.save = mocker.Mock()
+    ham_client.shutdown_kernel = mocker.Mock()
+    with qtbot.waitSignal(tabwidget.sig_refresh_save_actions_requested):
+        tabwidget.close_client(0)
+    assert tabwidget.dirty_count == 0
 
 
 def test_is_newly_created_with_new_notebook(tabwidget):
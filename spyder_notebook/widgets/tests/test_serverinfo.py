@@ -6,12 +6,20 @@
 
 """Tests for serverinfo.py."""
 
+# Standard library imports
+import datetime
+from unittest.mock import ANY
+
 # Third party imports
+import psutil
 import pytest
+import requests
 
 # Local imports
+from spyder_notebook.utils.outputbuffer import OutputBuffer
 from spyder_notebook.utils.servermanager import ServerProcess, ServerState
-from spyder_notebook.widgets.serverinfo import ServerInfoDialog
+from spyder_notebook.widgets.serverinfo import (
+    collect_metrics, ServerInfoDialog)
 
 
 class FakeProcess:
@@ -67,3 +75,143 @@ def test_dialog_change_process(dialog):
     assert dialog.interpreter_lineedit.text() == '/spam/interpreter'
     assert (dialog.log_textedit.toPlainText()
             == 'Terminated for some reason...\n')
+
+
+def test_dialog_refresh_after_server_removed(dialog):
+    """Test that the dialog keeps showing the selected server after another
+    server is removed from the list of servers."""
+    dialog.process_combo.setCurrentIndex(1)
+
+    del dialog.servers[0]
+    dialog.refresh_data()
+
+    assert dialog.process_combo.count() == 1
+    assert dialog.process_combo.currentText() == '404'
+    assert dialog.current_server() is dialog.servers[0]
+    assert dialog.dir_lineedit.text() == '/some/other/dir'
+
+
+def test_dialog_with_truncated_output(qtbot):
+    """Test that dialog says that output is discarded if the output buffer
+    of the server is full."""
+    output_buffer = OutputBuffer(max_size=10)
+    server = ServerProcess(FakeProcess(42), '/my/home/dir',
+                           interpreter='/ham/interpreter',
+                           info_file='info1.json',
+                           output='Nicely humming along...\n',
+                           output_buffer=output_buffer)
+    dialog = ServerInfoDialog([server])
+    qtbot.addWidget(dialog)
+
+    assert (dialog.log_textedit.toPlainText()
+            == '[Earlier output is discarded]\n along...\n')
+
+
+def test_dialog_append_output(dialog):
+    """Test that new output of the selected server is appended to the log
+    and that output of other servers is ignored."""
+    server0, server1 = dialog.servers
+    dialog.append_output(server0, '[I 12:00 ServerApp] Ready\n')
+    dialog.append_output(server1, 'Not for this server\n')
+
+    assert (dialog.log_textedit.toPlainText()
+            == 'Nicely humming along...\n[I 12:00 ServerApp] Ready\n')
+
+
+def test_dialog_log_filter(dialog):
+    """Test that the log filter hides lines below the selected level,
+    including lines without level following such a line."""
+    dialog.append_output(
+        dialog.servers[0],
+        '[I 12:00 ServerApp] Ready\n[W 12:01 ServerApp] Careful\n'
+        '[E 12:02 ServerApp] Oops\nTraceback\n[D 12:03 ServerApp] Debug\n')
+    document = dialog.log_textedit.document()
+
+    def visible_lines():
+        return [document.findBlockByNumber(i).text()
+                for i in range(document.blockCount())
+                if document.findBlockByNumber(i).isVisible()
+                and document.findBlockByNumber(i).text()]
+
+    index = dialog.log_filter_combo.findData(30)
+    dialog.log_filter_combo.setCurrentIndex(index)
+    assert visible_lines() == ['[W 12:01 ServerApp] Careful',
+                               '[E 12:02 ServerApp] Oops', 'Traceback']
+
+    dialog.log_filter_combo.setCurrentIndex(0)
+    assert len(visible_lines()) == 6
+
+
+def test_collect_metrics(mocker):
+    """Test that collect_metrics() combines process and API data."""
+    def fake_process(pid, rss, cpu, cmdline=None, children=None):
+        process = mocker.MagicMock(pid=pid)
+        process.memory_info.return_value.rss = rss
+        process.cpu_percent.return_value = cpu
+        process.cmdline.return_value = cmdline or []
+        process.children.return_value = children or []
+        return process
+
+    kernel = fake_process(
+        43, 2000, 50.0, ['python', '-f', '/run/kernel-abc-123.json'])
+    server = fake_process(42, 1000, 1.0, children=[kernel])
+    mocker.patch('spyder_notebook.widgets.serverinfo.psutil.Process',
+                 side_effect=lambda pid: {42: server, 43: kernel}[pid])
+
+    def fake_get(url, **kwargs):
+        response = mocker.Mock()
+        if url.endswith('status'):
+            response.json.return_value = {'connections': 1}
+        else:
+            response.json.return_value = [
+                {'id': 'abc-123', 'name': 'python3',
+                 'execution_state': 'idle', 'connections': 1}]
+        return response
+
+    http_session = mocker.Mock(**{'get.side_effect': fake_get})
+    server_info = {'url': 'http://localhost:8888/', 'token': 'ham'}
+
+    metrics = collect_metrics(42, server_info, http_session, {})
+
+    assert metrics == {
+        'rss': 1000, 'cpu': 1.0, 'connections': 1,
+        'kernels': [{'id': 'abc-123', 'name': 'python3', 'state': 'idle',
+                     'connections': 1, 'rss': 2000, 'cpu': 50.0}]}
+    http_session.get.assert_called_with(
+        'http://localhost:8888/api/kernels', timeout=ANY)
+
+
+def test_collect_metrics_when_request_fails(mocker):
+    """Test that collect_metrics() returns no kernels if the server returns
+    an error."""
+    mocker.patch('spyder_notebook.widgets.serverinfo.psutil.Process',
+                 side_effect=psutil.NoSuchProcess(42))
+    http_session = mocker.Mock()
+    http_session.get.return_value.raise_for_status.side_effect = (
+        requests.exceptions.HTTPError('403 Client Error'))
+    server_info = {'url': 'http://localhost:8888/', 'token': 'ham'}
+
+    metrics = collect_metrics(42, server_info, http_session, {})
+
+    assert metrics == {
+        'rss': None, 'cpu': None, 'connections': None, 'kernels': []}
+
+
+def test_dialog_show_metrics(dialog):
+    """Test that dialog displays metrics of the selected server."""
+    server = dialog.servers[0]
+    server.readytime = server.starttime + datetime.timedelta(seconds=2.5)
+    metrics = {
+        'rss': 200 * 2**20, 'cpu': 12.0, 'connections': 3,
+        'kernels': [{'id': 'abc', 'name': 'python3', 'state': 'busy',
+                     'connections': 1, 'rss': 100 * 2**20, 'cpu': 99.0}]}
+
+    dialog.show_metrics(server, metrics)
+
+    assert dialog.startup_lineedit.text() == '2.5 s'
+    assert dialog.memory_lineedit.text() == '200 MiB'
+    assert dialog.cpu_lineedit.text() == '12%'
+    assert dialog.connections_lineedit.text() == '3'
+    assert dialog.kernel_table.rowCount() == 1
+    assert dialog.kernel_table.item(0, 0).text() == 'python3 (abc)'
+    assert dialog.kernel_table.item(0, 3).text() == '100 MiB'